@@ -0,0 +1,64 @@
+class BatchedScanReader(object):
+    """
+    Batch access (get_by_ids) for the indexed peak list readers (MGF, ms2).
+
+    The reader provides info['offsetList'] with (start, end) offsets per scanId (start -1 for
+    empty scans), a seekable seeker, parse_peaks and parse_precursor. The scans are read in
+    file order with large buffered reads instead of seeking to each one separately.
+    """
+
+    # name of the file type in error messages
+    file_type = 'peak list'
+    # minimum number of bytes read at once
+    buffer_size = 8388608
+
+    @staticmethod
+    def empty_spectrum():
+        return {'peaks': '', 'precursor': {'mz': None, 'charge': None}}
+
+    def get_by_ids(self, scan_ids, buffer_size=None):
+        """
+        Batch access to spectra by scanId.
+
+        :param scan_ids: iterable of scanIds
+        :param buffer_size: minimum number of bytes read at once, defaults to buffer_size
+        :returns: generator of (scanId, spectrum) tuples in file order, same spectra as get_by_id
+        """
+        positions = []
+        for scan_id in set(scan_ids):
+            try:
+                position = self.info['offsetList'][scan_id]
+            except IndexError:
+                raise KeyError("{0} file does not contain a spectrum with index {1}.".format(
+                    self.file_type, scan_id))
+            positions.append((int(position[0]), int(position[1]), scan_id))
+        positions.sort()
+
+        for scan_id, scan in self.read_scans(positions, buffer_size or self.buffer_size):
+            if scan is None:  # empty scan
+                yield scan_id, self.empty_spectrum()
+                continue
+
+            yield scan_id, {
+                'peaks': self.parse_peaks(scan),
+                'precursor': self.parse_precursor(scan)
+            }
+
+    def read_scans(self, positions, buffer_size):
+        """
+        :param positions: sorted list of (start, end, scanId)
+        :returns: generator of (scanId, raw scan) tuples, raw scan None for empty scans
+        """
+        buff = ''
+        buff_start = 0
+        for start_pos, end_pos, scan_id in positions:
+            if start_pos == -1:
+                yield scan_id, None
+                continue
+
+            if start_pos < buff_start or end_pos > buff_start + len(buff):
+                self.seeker.seek(start_pos, 0)
+                buff = self.seeker.read(max(buffer_size, end_pos - start_pos))
+                buff_start = start_pos
+
+            yield scan_id, buff[start_pos - buff_start:end_pos - buff_start]
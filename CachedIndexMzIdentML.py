@@ -0,0 +1,138 @@
+import json
+import pyteomics.mzid as py_mzid
+from pyteomics.xml import TagSpecificXMLByteIndex, ByteEncodingOrderedDict, ensure_bytes_single
+from pyteomics.auxiliary import basestring, _keepstate
+from collections import defaultdict, OrderedDict
+
+
+class CachedTagSpecificXMLByteIndex(TagSpecificXMLByteIndex):
+    """
+    TagSpecificXMLByteIndex restored from an index cache instead of scanning the file.
+    """
+
+    def __init__(self, source, indexed_tags, keys, offsets):
+        self.indexed_tags = indexed_tags
+        self.indexed_tag_keys = keys
+        self.source = source
+        self.offsets = offsets
+
+
+class CachedIndexMzIdentML(py_mzid.MzIdentML):
+    """
+    MzIdentML reader that stores its tag-specific byte offset index in a SpectrumIndexCache.
+
+    The index is saved as one offset per indexed element, the tags and element ids are kept in
+    the json meta data of the index file. The index is validated by the SpectrumIndexCache
+    (file size, mtime and hashes), against the indexed tags and id keys of the reader and by
+    spot-checking that the elements start at their offsets, so a known mzid is opened without
+    the indexing scan.
+    """
+
+    index_format = 'mzid_offset_index_v1'
+
+    def __init__(self, source, index_cache=None, **kwargs):
+        """
+        :param source: path to the mzid file
+        :param index_cache: SpectrumIndexCache to load/save the offset index, None to always
+            build the index
+        """
+        self.index_cache = index_cache
+        self.index_file_path = source if isinstance(source, basestring) else None
+        super(CachedIndexMzIdentML, self).__init__(source, **kwargs)
+
+    @_keepstate
+    def _build_index(self):
+        if self.index_cache is None or self.index_file_path is None or \
+                not self._indexed_tags or not self._use_index:
+            return super(CachedIndexMzIdentML, self)._build_index()
+
+        offsets = self.load_offset_index()
+        if offsets is None:
+            self._offset_index = TagSpecificXMLByteIndex(
+                self._source, self._indexed_tags, self._indexed_tag_keys)
+            self.build_flat_offset_index()
+            self.save_offset_index()
+            return
+
+        self._offset_index = CachedTagSpecificXMLByteIndex(
+            self._source, self._indexed_tags, self._indexed_tag_keys, offsets)
+        self.build_flat_offset_index()
+
+    def build_flat_offset_index(self):
+        # the ids are bytes already, skip the key encoding of ByteEncodingOrderedDict
+        setitem = OrderedDict.__setitem__
+        self._flat_offset_index = ByteEncodingOrderedDict()
+        for tag, tag_offsets in self._offset_index.items():
+            for elem_id, offset in tag_offsets.iteritems():
+                setitem(self._flat_offset_index, elem_id, offset)
+
+    def get_index_meta(self):
+        # the byte index fills in the default id key of the indexed tags while scanning
+        tag_keys = dict((tag, self._indexed_tag_keys.get(tag, b'id'))
+                        for tag in self._indexed_tags)
+        return {
+            'format': self.index_format,
+            'indexed_tags': sorted(self._indexed_tags),
+            'indexed_tag_keys': sorted(tag_keys.items()),
+        }
+
+    def load_offset_index(self):
+        """
+        :return: defaultdict(ByteEncodingOrderedDict) tag -> element id -> offset, None if
+            there is no valid cached index
+        """
+        cached = self.index_cache.load(self.index_file_path)
+        if cached is None:
+            return None
+        offset_array, meta = cached
+
+        # round trip through json like the stored meta data (tuples -> lists)
+        expected_meta = json.loads(json.dumps(self.get_index_meta()))
+        if any(meta.get(key) != value for key, value in expected_meta.items()):
+            return None
+
+        offset_list = offset_array[:, 0].tolist() if len(offset_array) > 0 else []
+        offsets = defaultdict(ByteEncodingOrderedDict)
+        setitem = OrderedDict.__setitem__
+        i = 0
+        try:
+            for tag, ids in meta['tags']:
+                tag_offsets = offsets[ensure_bytes_single(tag)]
+                if i + len(ids) > len(offset_list):
+                    return None
+                for elem_id, offset in zip(ids, offset_list[i:i + len(ids)]):
+                    setitem(tag_offsets, elem_id.encode('utf-8'), offset)
+                i += len(ids)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+        if i != len(offset_list):
+            return None
+
+        for tag, tag_offsets in offsets.items():
+            if not self.index_cache.check_entries(
+                    self.index_file_path, tag_offsets.values(),
+                    lambda f, offset: self.check_index_entry(f, offset, tag)):
+                return None
+
+        return offsets
+
+    @staticmethod
+    def check_index_entry(f, offset, tag):
+        """
+        :return: True if an element with tag starts at offset
+        """
+        f.seek(offset)
+        start_tag = f.read(len(tag) + 2)
+        return start_tag[:len(tag) + 1] == b'<' + tag and start_tag[len(tag) + 1:] in \
+            (b' ', b'\t', b'\n', b'\r', b'>', b'/')
+
+    def save_offset_index(self):
+        tags = []
+        offset_list = []
+        for tag, tag_offsets in self._offset_index.items():
+            tags.append([tag, list(tag_offsets.keys())])
+            offset_list.extend(tag_offsets.values())
+
+        meta = self.get_index_meta()
+        meta['tags'] = tags
+        return self.index_cache.save(self.index_file_path, offset_list, meta)
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+
+class ElementCache:
+    """
+    Per-upload memo of parsed mzid elements (get_by_id with detailed=True).
+
+    Every element type has its own LRU cache: small sections that are read by several
+    parser stages (SpectraData, SpectrumIdentificationProtocol, SearchDatabase) are kept
+    completely, the potentially large ones are bounded (DBSequence) or not cached at all
+    (Peptide, PeptideEvidence - only parsed once and modified by the parser).
+
+    Cached elements are shared between the callers and must not be modified.
+    """
+
+    # element type -> max number of cached elements, None: unbounded
+    default_sizes = {
+        'SpectraData': None,
+        'SpectrumIdentificationProtocol': None,
+        'SearchDatabase': None,
+        'DBSequence': 10000,
+        'Peptide': 0,
+        'PeptideEvidence': 0,
+    }
+
+    def __init__(self, mzid_reader, sizes=None):
+        """
+        :param mzid_reader: pyteomics MzIdentML reader
+        :param sizes: element type -> max number of cached elements (None: unbounded),
+            overrides default_sizes. Types without a size aren't cached.
+        """
+        self.mzid_reader = mzid_reader
+        self.sizes = dict(self.default_sizes)
+        if sizes is not None:
+            self.sizes.update(sizes)
+        self.elements = dict((tag, OrderedDict()) for tag in self.sizes)
+        self.hits = 0
+        self.misses = 0
+
+    def get_ids(self, tag):
+        """
+        :return: ids of all elements of type tag in file order
+        """
+        try:
+            return self.mzid_reader._offset_index[tag].keys()
+        except KeyError:
+            return []
+
+    def get(self, elem_id, tag):
+        """
+        :param elem_id: element id
+        :param tag: element type, e.g. 'SpectraData'
+        :return: parsed element
+        """
+        cache = self.elements.get(tag)
+        if cache is not None and elem_id in cache:
+            self.hits += 1
+            element = cache.pop(elem_id)
+            cache[elem_id] = element
+            return element
+
+        self.misses += 1
+        element = self.mzid_reader.get_by_id(elem_id, tag_id=tag, detailed=True)
+        self.put(tag, elem_id, element)
+        return element
+
+    def put(self, tag, elem_id, element):
+        size = self.sizes.get(tag, 0)
+        if size == 0:
+            return
+        cache = self.elements[tag]
+        cache[elem_id] = element
+        if size is not None and len(cache) > size:
+            cache.popitem(last=False)
+
+    def iter_elements(self, tag):
+        """
+        Yields all parsed elements of type tag in file order. The elements that aren't
+        cached are parsed in one batch (get_by_ids).
+        """
+        elem_ids = self.get_ids(tag)
+        cache = self.elements.get(tag, {})
+        uncached_ids = [elem_id for elem_id in elem_ids if elem_id not in cache]
+        uncached_id_set = set(uncached_ids)
+        uncached_elements = self.mzid_reader.get_by_ids(uncached_ids, tag_id=tag, detailed=True)
+        for elem_id in elem_ids:
+            if elem_id in uncached_id_set:
+                self.misses += 1
+                element = next(uncached_elements)
+                self.put(tag, elem_id, element)
+                yield element
+            else:
+                yield self.get(elem_id, tag)
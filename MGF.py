@@ -22,15 +22,19 @@ import re
 import os
 import bisect
 import codecs
+import mmap
 
 from collections import defaultdict as ddict
 
+from PeakEncoding import parse_peak_arrays
+from BatchedScanReader import BatchedScanReader
+
 
 class ParseError(Exception):
     pass
 
 
-class Reader(object):
+class Reader(BatchedScanReader):
     """
 
     Initializes an indexed mgf reader.
@@ -42,14 +46,23 @@ class Reader(object):
                         path obsolete, seeking is disabled
     :type file_object: File_object like
 
+    :param index_cache: persistent offset index storage, the index is only built from
+                        scratch if the cache has no valid index for the file
+    :type index_cache: SpectrumIndexCache.SpectrumIndexCache
+
     Example:
 
     """
 
+    # return peaks as (mz, intensity) arrays instead of text
+    peak_arrays = False
+    file_type = 'MGF'
+
     def __init__(
             self,
             path=None,
             file_object=None,
+            index_cache=None,
     ):
 
         # self.info contains information extracted from the mgf file
@@ -71,6 +84,7 @@ class Reader(object):
         )
         self.info['filename'] = path
 
+        self.index_cache = index_cache
         self.seeker = self._build_index()
 
         self.spectrum = {}
@@ -118,7 +132,18 @@ class Reader(object):
         self.info['offsets'] = None
         seeker.seek(0, 2)  # what's this for? - cc
 
-        self._build_index_from_scratch(seeker)
+        cached_index = None
+        if self.index_cache is not None:
+            cached_index = self.index_cache.load(self.info['filename'], self.check_index_entry)
+
+        if cached_index is not None:
+            # memory-mapped (n, 2) array of (start, end) offsets
+            self.info['offsetList'] = cached_index[0]
+            self.info['seekable'] = True
+        else:
+            self._build_index_from_scratch(seeker)
+            if self.index_cache is not None:
+                self.index_cache.save(self.info['filename'], self.info['offsetList'])
 
         seeker.close()
         seeker = codecs.open(
@@ -164,11 +189,11 @@ class Reader(object):
          """
 
         position = self.info['offsetList'][scan_id]
-        start_pos = position[0]
-        end_pos = position[1]
+        start_pos = int(position[0])
+        end_pos = int(position[1])
 
         if start_pos == -1:  # empty scan
-            self.spectrum['peaks'] = ''
+            self.spectrum.update(self.empty_spectrum())
             # self.spectrum['params'] = params
             return self.spectrum
 
@@ -178,7 +203,7 @@ class Reader(object):
         if scan is None:
             raise KeyError("MGF file does not contain a spectrum with index {0}.".format(scan_id))
         else:
-            self.spectrum['peaks'] = self.parse_peak_list(scan)
+            self.spectrum['peaks'] = self.parse_peaks(scan)
             self.spectrum['precursor'] = self.parse_precursor(scan)
             return self.spectrum
 
@@ -189,6 +214,31 @@ class Reader(object):
         """
         return self.get_by_id(scan_id)
 
+    @staticmethod
+    def check_index_entry(f, entry):
+        """
+        Checks a cached index entry against the file (see SpectrumIndexCache.load): the scan
+        starts after a BEGIN IONS line and ends after an END IONS line.
+        """
+        start, end = int(entry[0]), int(entry[1])
+        if start == -1:  # empty scan
+            return True
+        f.seek(max(0, start - 32))
+        before_start = f.read(start - max(0, start - 32))
+        f.seek(max(0, end - 32))
+        before_end = f.read(end - max(0, end - 32))
+        return before_start.rstrip().endswith(b'BEGIN IONS') and \
+            before_end.rstrip().endswith(b'END IONS')
+
+    def parse_peaks(self, raw_scan):
+        """
+        :returns: newline-joined peak list or, with :attr:`peak_arrays`, a tuple of
+                  (mz, intensity) arrays
+        """
+        if self.peak_arrays:
+            return parse_peak_arrays(raw_scan)
+        return self.parse_peak_list(raw_scan)
+
     @staticmethod
     def parse_peak_list(raw_scan):
         lines = raw_scan.splitlines()
@@ -226,3 +276,127 @@ class Reader(object):
 
         return precursor
 
+
+class MmapReader(Reader):
+    """
+
+    Initializes an indexed, memory-mapped mgf reader. Drop-in replacement for
+    :py:class:`Reader` for uncompressed files.
+
+    The index is built by searching the mapping for BEGIN IONS/END IONS instead of
+    reading the file line by line and scans are only sliced out of the mapping when
+    they are parsed.
+
+    :param path: path to mgf file.
+    :type path: string
+
+    :param index_cache: persistent offset index storage, the index is only built from
+                        scratch if the cache has no valid index for the file
+    :type index_cache: SpectrumIndexCache.SpectrumIndexCache
+
+    """
+
+    def __init__(
+            self,
+            path,
+            index_cache=None,
+    ):
+
+        self.info = dict()
+        self.info['offsetList'] = []
+        self.info['filename'] = path
+        self.info['fileObject'] = open(path, 'rb')
+        self.info['seekable'] = True
+
+        self.index_cache = index_cache
+        self.seeker = self._build_index()
+
+        self.spectrum = {}
+
+    def _build_index(self):
+        """
+        .. method:: _build_index()
+
+        Maps the file into memory and builds the index of (start, end) offsets.
+
+        :returns: the mapping, used as seeker
+        """
+        try:
+            mapping = mmap.mmap(self.info['fileObject'].fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            mapping = b''
+
+        self.info['offsets'] = None
+
+        cached_index = None
+        if self.index_cache is not None:
+            cached_index = self.index_cache.load(self.info['filename'], self.check_index_entry)
+
+        if cached_index is not None:
+            # memory-mapped (n, 2) array of (start, end) offsets
+            self.info['offsetList'] = cached_index[0]
+        else:
+            self.info['offsetList'] = self.get_data_indices(mapping)
+            if self.index_cache is not None:
+                self.index_cache.save(self.info['filename'], self.info['offsetList'])
+
+        return mapping
+
+    @staticmethod
+    def get_data_indices(mapping):
+        """
+        Get a list with binary file indices of spectra in mgf file.
+
+        Same offsets as :py:meth:`Reader._build_index_from_scratch`: a scan starts after its
+        BEGIN IONS line and ends after its END IONS line.
+        """
+        spec_positions = []
+        scan_start_pos = 0
+        pos = mapping.find(b' IONS')
+        while pos != -1:
+            line_start = mapping.rfind(b'\n', 0, pos) + 1
+            line_end = mapping.find(b'\n', pos)
+            if line_end == -1:
+                line_end = len(mapping)
+            next_line_pos = min(line_end + 1, len(mapping))
+
+            line = mapping[line_start:line_end].strip()
+            if line == b'BEGIN IONS':
+                scan_start_pos = next_line_pos
+            elif line == b'END IONS':
+                spec_positions.append((scan_start_pos, next_line_pos))
+
+            pos = mapping.find(b' IONS', next_line_pos)
+
+        return spec_positions
+
+    def get_by_id(self, scan_id):
+        """"
+         Random access to spectrum peak list in mgf by scanId
+
+         """
+
+        position = self.info['offsetList'][scan_id]
+        start_pos = int(position[0])
+        end_pos = int(position[1])
+
+        if start_pos == -1:  # empty scan
+            self.spectrum.update(self.empty_spectrum())
+            return self.spectrum
+
+        scan = self.seeker[start_pos:end_pos]
+        self.spectrum['peaks'] = self.parse_peaks(scan)
+        self.spectrum['precursor'] = self.parse_precursor(scan)
+        return self.spectrum
+
+    def read_scans(self, positions, buffer_size):
+        """
+        The whole file is mapped, scans are sliced out of the mapping instead of buffered.
+        """
+        for start_pos, end_pos, scan_id in positions:
+            if start_pos == -1:  # empty scan
+                yield scan_id, None
+                continue
+
+            yield scan_id, self.seeker[start_pos:end_pos]
@@ -0,0 +1,87 @@
+class ModificationRegistry:
+    """
+    The modifications of an upload, indexed by name.
+
+    Modifications are the parsed mzIdentML Modification dicts (name, monoisotopicMassDelta,
+    residues, optional accession). The residues of a modification keep their order of
+    appearance (they are written as a string), membership is checked with a set.
+    """
+
+    def __init__(self):
+        self.modifications = []
+        self.name_index = {}        # name -> modification
+        self.residue_sets = {}      # name -> set of residues
+
+    def __iter__(self):
+        return iter(self.modifications)
+
+    def __len__(self):
+        return len(self.modifications)
+
+    def __contains__(self, name):
+        return name in self.name_index
+
+    def get(self, name):
+        """
+        :return: modification named name or None
+        """
+        return self.name_index.get(name)
+
+    def get_mass(self, name):
+        return self.name_index[name]['monoisotopicMassDelta']
+
+    def add(self, mod):
+        """
+        Adds a modification. A modification with the name of a known modification adds its
+        residues to the known one. If the masses differ the name gets a '*' appended (until it
+        is unique or matches a modification with the same mass).
+
+        :param mod: modification dict (modified in place)
+        :return: the name the modification is stored under
+        """
+        if mod['name'] == "unknown_modification":
+            mod['name'] = "({0:.2f})".format(mod['monoisotopicMassDelta'])
+
+        mod['monoisotopicMassDelta'] = float(mod['monoisotopicMassDelta'])
+
+        mod['residues'] = [aa for aa in mod['residues']]
+
+        old_mod = self.name_index.get(mod['name'])
+        # check if modname with different mass exists already
+        while old_mod is not None and \
+                mod['monoisotopicMassDelta'] != old_mod['monoisotopicMassDelta']:
+            mod['name'] += "*"
+            old_mod = self.name_index.get(mod['name'])
+
+        if old_mod is None:
+            self.modifications.append(mod)
+            self.name_index[mod['name']] = mod
+            self.residue_sets[mod['name']] = set(mod['residues'])
+        else:
+            residues = self.residue_sets[mod['name']]
+            for res in mod['residues']:
+                if res not in residues:
+                    residues.add(res)
+                    old_mod['residues'].append(res)
+
+        return mod['name']
+
+    def get_inj_list(self, upload_id):
+        """
+        :return: modifications rows, ids are the order the modifications were added in
+        """
+        modifications_inj_list = []
+        for mod_index, mod in enumerate(self.modifications):
+            try:
+                mod_accession = mod['accession']
+            except KeyError:
+                mod_accession = ''
+            modifications_inj_list.append([
+                mod_index,
+                upload_id,
+                mod['name'],
+                mod['monoisotopicMassDelta'],
+                ''.join(mod['residues']),
+                mod_accession
+            ])
+        return modifications_inj_list
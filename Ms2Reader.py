@@ -25,6 +25,9 @@ import codecs
 
 from collections import defaultdict as ddict
 
+from PeakEncoding import parse_peak_arrays
+from BatchedScanReader import BatchedScanReader
+
 
 class RegexPatterns(object):
     params_pattern = re.compile('([A-Z]+)=(.*)')
@@ -35,7 +38,7 @@ class ParseError(Exception):
     pass
 
 
-class Reader(object):
+class Reader(BatchedScanReader):
     """
 
     Initializes an indexed mgf reader.
@@ -47,14 +50,23 @@ class Reader(object):
                         path obsolete, seeking is disabled
     :type file_object: File_object like
 
+    :param index_cache: persistent offset index storage, the index is only built from
+                        scratch if the cache has no valid index for the file
+    :type index_cache: SpectrumIndexCache.SpectrumIndexCache
+
     Example:
 
     """
 
+    # return peaks as (mz, intensity) arrays instead of text
+    peak_arrays = False
+    file_type = 'MS2'
+
     def __init__(
             self,
             path=None,
             file_object=None,
+            index_cache=None,
     ):
 
         # self.info contains information extracted from the mgf file
@@ -75,6 +87,7 @@ class Reader(object):
         )
         self.info['filename'] = path
 
+        self.index_cache = index_cache
         self.seeker = self._build_index()
 
         self.spectrum = {}
@@ -122,7 +135,18 @@ class Reader(object):
         self.info['offsets'] = None
         seeker.seek(0, 2) #  what's this for? - cc
 
-        self._build_index_from_scratch(seeker)
+        cached_index = None
+        if self.index_cache is not None:
+            cached_index = self.index_cache.load(self.info['filename'], self.check_index_entry)
+
+        if cached_index is not None:
+            # memory-mapped (n, 2) array of (start, end) offsets
+            self.info['offsetList'] = cached_index[0]
+            self.info['seekable'] = True
+        else:
+            self._build_index_from_scratch(seeker)
+            if self.index_cache is not None:
+                self.index_cache.save(self.info['filename'], self.info['offsetList'])
 
         seeker.close()
         seeker = codecs.open(
@@ -193,11 +217,11 @@ class Reader(object):
          """
 
         position = self.info['offsetList'][scan_id]
-        start_pos = position[0]
-        end_pos = position[1]
+        start_pos = int(position[0])
+        end_pos = int(position[1])
 
         if start_pos == -1:  # empty scan
-            self.spectrum['peaks'] = ''
+            self.spectrum.update(self.empty_spectrum())
             # self.spectrum['params'] = params
             return self.spectrum
 
@@ -207,7 +231,7 @@ class Reader(object):
         if scan is None:
             raise KeyError("MS2 file does not contain a spectrum with index {0}.".format(scan_id))
         else:
-            self.spectrum['peaks'] = self.parse_peak_list(scan)
+            self.spectrum['peaks'] = self.parse_peaks(scan)
             self.spectrum['precursor'] = self.parse_precursor(scan)
             return self.spectrum
 
@@ -218,6 +242,26 @@ class Reader(object):
         """
         return self.get_by_id(scan_id)
 
+    @staticmethod
+    def check_index_entry(f, entry):
+        """
+        Checks a cached index entry against the file (see SpectrumIndexCache.load): the scan
+        starts with its S line.
+        """
+        if int(entry[0]) == -1:  # empty scan
+            return True
+        f.seek(int(entry[0]))
+        return f.read(1) == b'S'
+
+    def parse_peaks(self, raw_scan):
+        """
+        :returns: newline-joined peak list or, with :attr:`peak_arrays`, a tuple of
+                  (mz, intensity) arrays
+        """
+        if self.peak_arrays:
+            return parse_peak_arrays(raw_scan)
+        return self.parse_peak_list(raw_scan)
+
     @staticmethod
     def parse_peak_list(raw_scan):
         lines = raw_scan.splitlines()
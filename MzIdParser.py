@@ -1,13 +1,21 @@
-import pyteomics.mzid as py_mzid
+from pyteomics.xml import ByteCountingXMLScanner
+from lxml import etree
+from io import BytesIO
+import multiprocessing
 import re
 import ntpath
 import json
 import sys
 from time import time
 from PeakListParser import PeakListParser
+from UnimodTable import UnimodTable
+from ModificationRegistry import ModificationRegistry
+from ElementCache import ElementCache
+from CachedIndexMzIdentML import CachedIndexMzIdentML
 import zipfile
 import gzip
 import os
+from array import array
 from NumpyEncoder import NumpyEncoder
 
 
@@ -15,12 +23,44 @@ class MzIdParseException(Exception):
     pass
 
 
+# parser used by the main loop worker processes, set before forking the pool
+_parallel_parser = None
+
+
+def _init_main_loop_worker():
+    # don't share the peak list file handles (and their positions) with the parent process
+    parser = _parallel_parser
+    parser.peak_list_readers = {
+        sd_id: PeakListParser(
+            reader.peak_list_path,
+            reader.file_format_accession,
+            reader.spectrum_id_format_accession,
+            reader.peak_encoder
+        ) for sd_id, reader in parser.peak_list_readers.items()
+    }
+
+
+def _main_loop_worker(byte_range):
+    parser = _parallel_parser
+    return parser.process_sid_results(parser.read_sid_results(*byte_range))
+
+
 class MzIdParser:
     """
 
     """
+    # top level elements read by upload_info (see read_header)
+    header_tags = ['AnalysisSoftwareList', 'Provider', 'AuditCollection',
+                   'AnalysisSampleCollection', 'AnalysisCollection', 'AnalysisProtocolCollection',
+                   'BibliographicReference']
+    header_block_size = 65536
+
+    # SpectrumIndexCache.SpectrumIndexCache to reuse the byte offset index of known mzid files
+    index_cache = None
+
     def __init__(self, mzid_path, temp_dir, peak_list_dir, db, logger, db_name='', user_id=0,
-                 origin=''):
+                 origin='', stream_sequence_collection=False, processes=1, peak_encoder=None,
+                 peak_list_store=None, score_table=False, ingest_profile=None):
         """
 
         :param mzid_path: path to mzidentML file
@@ -28,12 +68,25 @@ class MzIdParser:
         :param db: database python module to use (xiUI_pg or xiSPEC_sqlite)
         :param db_name: db name for SQLite
         :param origin: ftp dir of pride project
+        :param stream_sequence_collection: parse the SequenceCollection in a single iterparse
+            pass instead of looking up every element by id (see parse_sequence_collection)
+        :param processes: number of worker processes for the main loop, 1 parses serially
+        :param peak_encoder: PeakEncoding.PeakEncoder to store peaks as binary peak_blob
+            instead of peak_list text
+        :param peak_list_store: PeakListStore.PeakListStore for lazy peaks - the peak list
+            files are added to the store and spectra only get the location of their scan
+            (peak_file_hash, peak_offset, peak_length, peak_file_format), the scans aren't read
+        :param score_table: also write the numeric scores to the scores table (one row per
+            identification and score, with ids from the score_names table)
+        :param ingest_profile: SQLite ingest profile for connect (SQLite.get_ingest_profile)
         """
 
         self.upload_id = 0
         self.mzid_path = mzid_path
 
         self.peak_list_readers = {}  # peak list readers indexed by spectraData_ref
+        self.peak_list_store = peak_list_store
+        self.peak_file_hashes = {}  # peak list store hashes indexed by spectraData_ref
         self.temp_dir = temp_dir
         if not self.temp_dir.endswith('/'):
             self.temp_dir += '/'
@@ -58,7 +111,7 @@ class MzIdParser:
         # ToDo: AnalysisProtocolCollection->SpectrumIdentificationProtocol->ModificationParams
         # ToDo: atm we get them while looping through the peptides
         #  (might be more robust and we're doing it anyway)
-        self.modlist = []
+        self.modlist = ModificationRegistry()
         self.unknown_mods = []
 
         # From mzidentML schema 1.2.0:
@@ -68,9 +121,19 @@ class MzIdParser:
 
         self.warnings = []
 
+        self.score_table = score_table
+        self.score_name_ids = {}    # score name -> score_names id
+
+        # frozenset of score names -> ids of the spectrum identifications with these scores,
+        # collected in main_loop (see xiSPEC_MzIdParser.fill_in_missing_scores)
+        self.score_name_sets = {}
+
         # connect to DB
         try:
-            self.con = db.connect(db_name)
+            if ingest_profile is None:
+                self.con = db.connect(db_name)
+            else:
+                self.con = db.connect(db_name, ingest_profile)
             self.cur = self.con.cursor()
 
         except db.DBException as e:
@@ -85,6 +148,13 @@ class MzIdParser:
 
         self.upload_info_read = False
         self.mzid_reader = None
+        self.element_cache = None   # parsed SpectraData, DBSequence, ... (see ElementCache)
+        self.header = None      # top level elements (see read_header)
+        self.seq_id_to_acc_map = {}     # DBSequence id -> accession
+        self.stream_sequence_collection = stream_sequence_collection
+        self.processes = processes
+        self.peak_encoder = peak_encoder
+        self.mzid_root_tags = None
 
     def initialise_mzid_reader(self):
         if self.mzid_path.endswith('.gz') or self.mzid_path.endswith('.zip'):
@@ -95,9 +165,10 @@ class MzIdParser:
         # schema:
         # https://raw.githubusercontent.com/HUPO-PSI/mzIdentML/master/schema/mzIdentML1.2.0.xsd
         try:
-            self.mzid_reader = py_mzid.MzIdentML(self.mzid_path)
+            self.mzid_reader = CachedIndexMzIdentML(self.mzid_path, index_cache=self.index_cache)
         except Exception as e:
             raise MzIdParseException(type(e).__name__, e.args)
+        self.element_cache = ElementCache(self.mzid_reader)
 
         self.logger.info('reading mzid - done. Time: {} sec'.format(round(time() - start_time, 2)))
 
@@ -107,9 +178,7 @@ class MzIdParser:
         :return: list of all supported peak list file names
         """
         peak_list_file_names = []
-        for spectra_data_id in self.mzid_reader._offset_index["SpectraData"].keys():
-            sp_datum = self.mzid_reader.get_by_id(spectra_data_id, tag_id='SpectraData',
-                                                  detailed=True)
+        for sp_datum in self.element_cache.iter_elements('SpectraData'):
             ff_acc = sp_datum['FileFormat']['accession']
             if any([ff_acc == 'MS:1001062',  # MGF
                     ff_acc == 'MS:1000584',  # mzML
@@ -125,9 +194,7 @@ class MzIdParser:
         :return: list of all peak list file names
         """
         peak_list_file_names = []
-        for spectra_data_id in self.mzid_reader._offset_index["SpectraData"].keys():
-            sp_datum = self.mzid_reader.get_by_id(spectra_data_id, tag_id='SpectraData',
-                                                  detailed=True)
+        for sp_datum in self.element_cache.iter_elements('SpectraData'):
             peak_list_file_names.append(ntpath.basename(sp_datum['location']))
 
         return peak_list_file_names
@@ -140,9 +207,7 @@ class MzIdParser:
             value: associated peak_list_reader
         """
         peak_list_readers = {}
-        for spectra_data_id in self.mzid_reader._offset_index["SpectraData"].keys():
-            sp_datum = self.mzid_reader.get_by_id(spectra_data_id, tag_id='SpectraData',
-                                                  detailed=True)
+        for sp_datum in self.element_cache.iter_elements('SpectraData'):
 
             self.check_spectra_data_validity(sp_datum)
 
@@ -154,7 +219,8 @@ class MzIdParser:
                 peak_list_reader = PeakListParser(
                     peak_list_file_path,
                     sp_datum['FileFormat']['accession'],
-                    sp_datum['SpectrumIDFormat']['accession']
+                    sp_datum['SpectrumIDFormat']['accession'],
+                    self.peak_encoder
                 )
             except Exception:
                 # try gz version
@@ -162,19 +228,22 @@ class MzIdParser:
                     peak_list_reader = PeakListParser(
                         PeakListParser.extract_gz(peak_list_file_path + '.gz'),
                         sp_datum['FileFormat']['accession'],
-                        sp_datum['SpectrumIDFormat']['accession']
+                        sp_datum['SpectrumIDFormat']['accession'],
+                        self.peak_encoder
                     )
                 except IOError:
                     raise MzIdParseException('Missing peak list file: %s' % peak_list_file_path)
 
             peak_list_readers[sd_id] = peak_list_reader
 
+            if self.peak_list_store is not None:
+                self.peak_file_hashes[sd_id] = self.peak_list_store.add(
+                    peak_list_reader.peak_list_path)
+
         self.peak_list_readers = peak_list_readers
 
     def check_all_spectra_data_validity(self):
-        for spectra_data_id in self.mzid_reader._offset_index["SpectraData"].keys():
-            sp_datum = self.mzid_reader.get_by_id(spectra_data_id, tag_id='SpectraData',
-                                                  detailed=True)
+        for sp_datum in self.element_cache.iter_elements('SpectraData'):
             self.check_spectra_data_validity(sp_datum)
 
     @staticmethod
@@ -210,19 +279,25 @@ class MzIdParser:
         if self.peak_list_dir:
             self.init_peak_list_readers()
 
-        self.parse_db_sequences()  # overridden (empty function) in xiSPEC subclass
-        self.parse_peptides()
-        self.parse_peptide_evidences()
+        if self.stream_sequence_collection:
+            self.parse_sequence_collection()
+        else:
+            self.parse_db_sequences()  # overridden (empty function) in xiSPEC subclass
+            self.parse_peptides()
+            self.parse_peptide_evidences()
         self.map_spectra_data_to_protocol()
         self.main_loop()
+        self.create_indexes()
 
         # meta_data = [self.upload_id, -1, -1, -1, -1]
         # self.db.write_meta_data(meta_data, self.cur, self.con)
 
         self.fill_in_missing_scores()  # empty here, overridden in xiSPEC subclass to do stuff
+        self.create_psm_view()
 
         self.other_info()
 
+        self.db.finish_ingest(self.cur, self.con)
         self.logger.info('all done! Total time: ' + str(round(time() - start_time, 2)) + " sec")
 
         self.con.close()
@@ -308,12 +383,14 @@ class MzIdParser:
 
         sid_protocols = []
 
-        analysis_collection = self.mzid_reader.iterfind('AnalysisCollection').next()
+        try:
+            analysis_collection = self.get_header()['AnalysisCollection'][0]
+        except IndexError:
+            raise MzIdParseException('missing AnalysisCollection')
         for spectrumIdentification in analysis_collection['SpectrumIdentification']:
             sid_protocol_ref = spectrumIdentification['spectrumIdentificationProtocol_ref']
-            sid_protocol = self.mzid_reader.get_by_id(sid_protocol_ref,
-                                                      tag_id='SpectrumIdentificationProtocol',
-                                                      detailed=True)
+            sid_protocol = self.element_cache.get(sid_protocol_ref,
+                                                  'SpectrumIdentificationProtocol')
             sid_protocols.append(sid_protocol)
             try:
                 frag_tol = sid_protocol['FragmentTolerance']
@@ -354,7 +431,6 @@ class MzIdParser:
                     'fragmentTolerance': ' '.join([frag_tol_value, frag_tol_unit])
                 }
 
-        self.mzid_reader.reset()
         self.spectra_data_protocol_map = spectra_data_protocol_map
         self.logger.info('generating spectraData_ProtocolMap - done. Time: {} sec'.format(
             round(time() - start_time, 2)))
@@ -362,27 +438,7 @@ class MzIdParser:
         # self.db.write.protocols()
 
     def add_to_modlist(self, mod):
-        if mod['name'] == "unknown_modification":
-            mod['name'] = "({0:.2f})".format(mod['monoisotopicMassDelta'])
-
-        mod['monoisotopicMassDelta'] = float(mod['monoisotopicMassDelta'])
-
-        mod['residues'] = [aa for aa in mod['residues']]
-
-        if mod['name'] in [m['name'] for m in self.modlist]:
-            old_mod = self.modlist[[m['name'] for m in self.modlist].index(mod['name'])]
-            # check if modname with different mass exists already
-            if mod['monoisotopicMassDelta'] != old_mod['monoisotopicMassDelta']:
-                mod['name'] += "*"
-                self.add_to_modlist(mod)
-            else:
-                for res in mod['residues']:
-                    if res not in old_mod['residues']:
-                        old_mod['residues'].append(res)
-        else:
-            self.modlist.append(mod)
-
-        return mod['name']
+        return self.modlist.add(mod)
 
     def parse_db_sequences(self):
 
@@ -390,41 +446,53 @@ class MzIdParser:
         start_time = time()
         # DBSEQUENCES
         inj_list = []
-        for db_id in self.mzid_reader._offset_index["DBSequence"].keys():
-            db_sequence = self.mzid_reader.get_by_id(db_id, tag_id='DBSequence', detailed=True)
+        for db_sequence in self.element_cache.iter_elements('DBSequence'):
+            self.seq_id_to_acc_map[db_sequence["id"]] = db_sequence["accession"]
+            inj_list.append(self.get_db_sequence_data(db_sequence))
 
-            data = [db_sequence["id"], db_sequence["accession"]]
+        self.write_db_sequences(inj_list)
 
-            # name, optional elem att
-            if "name" in db_sequence:
-                data.append(db_sequence["name"])
-            else :
-                data.append(db_sequence["accession"])
+        self.logger.info('parse db sequences - done. Time: {} sec'.format(
+            round(time() - start_time, 2)))
 
-            # description, officially not there?
-            if "protein description" in db_sequence:
-                data.append(json.dumps(db_sequence["protein description"], cls=NumpyEncoder))
-            else:
-                data.append(None)
+    def write_db_sequences(self, inj_list):
+        """
+        Writes db_sequences rows, overridden (empty function) in xiSPEC subclass.
+        """
+        self.db.write_db_sequences(inj_list, self.cur, self.con)
 
-            # searchDatabase_ref
+    def get_db_sequence_data(self, db_sequence):
+        """
+        :param db_sequence: parsed DBSequence element
+        :return: db_sequences row
+        """
+        data = [db_sequence["id"], db_sequence["accession"]]
 
-            # Seq is optional child elem of DBSequence
-            if "Seq" in db_sequence and isinstance(db_sequence["Seq"], basestring):
-                seq = db_sequence["Seq"]
-                data.append(seq)
-            else:
-                # todo: get sequence
-                data.append("no sequence")
+        # name, optional elem att
+        if "name" in db_sequence:
+            data.append(db_sequence["name"])
+        else :
+            data.append(db_sequence["accession"])
 
-            data.append(self.upload_id)
+        # description, officially not there?
+        if "protein description" in db_sequence:
+            data.append(json.dumps(db_sequence["protein description"], cls=NumpyEncoder))
+        else:
+            data.append(None)
 
-            inj_list.append(data)
+        # searchDatabase_ref
 
-        self.db.write_db_sequences(inj_list, self.cur, self.con)
+        # Seq is optional child elem of DBSequence
+        if "Seq" in db_sequence and isinstance(db_sequence["Seq"], basestring):
+            seq = db_sequence["Seq"]
+            data.append(seq)
+        else:
+            # todo: get sequence
+            data.append("no sequence")
 
-        self.logger.info('parse db sequences - done. Time: {} sec'.format(
-            round(time() - start_time, 2)))
+        data.append(self.upload_id)
+
+        return data
 
     def parse_peptides(self):
         start_time = time()
@@ -436,107 +504,8 @@ class MzIdParser:
         # PEPTIDES
         peptide_index = 0
         peptide_inj_list = []
-        for pep_id in self.mzid_reader._offset_index["Peptide"].keys():
-            peptide = self.mzid_reader.get_by_id(pep_id, tag_id='Peptide', detailed=True)
-            pep_seq_dict = []
-            for aa in peptide['PeptideSequence']:
-                pep_seq_dict.append({"Modification": "", "aminoAcid": aa})
-
-            link_site = -1
-            crosslinker_modmass = None
-            value = None
-
-            # MODIFICATIONS
-            # add in modifications
-            if 'Modification' in peptide.keys():
-                for mod in peptide['Modification']:
-
-                    if 'monoisotopicMassDelta' not in mod.keys():
-                        try:
-                            mod['monoisotopicMassDelta'] = unimod_masses[mod['accession']]
-
-                        # ToDo: what's going on here?
-                        except KeyError:
-                            # seq_ref_prot_map['errors'].append({
-                            #     "type": "mzidParseError",
-                            #     "message": "could not get modification mass for modification {}".format(mod),
-                            #     "id": mod["id"]
-                            # })
-                            continue
-
-                    # link_index = 0  # TODO: multilink support
-                    # mod_location is 0-based for assigning modifications to correct amino acid
-                    # mod['location'] is 1-based with 0 = n-terminal and len(pep)+1 = C-terminal
-                    if mod['location'] == 0:
-                        mod_location = 0
-                        # n_terminal_mod = True
-                    elif mod['location'] == len(peptide['PeptideSequence']) + 1:
-                        mod_location = mod['location'] - 2
-                        # c_terminal_mod = True
-                    else:
-                        mod_location = mod['location'] - 1
-                        # n_terminal_mod = False
-                        # c_terminal_mod = False
-                    if 'residues' not in mod:
-                        mod['residues'] = peptide['PeptideSequence'][mod_location]
-
-                    # TODO - issues here with using names rather than cv param accession
-                    #  (cross-link acceptor/ receiver)
-                    if 'name' in mod.keys():
-                        # fix mod names
-                        if isinstance(mod['name'], list):  # todo: have a look at this  - cc
-                            mod['name'] = ','.join(mod['name'])
-                        mod['name'] = mod['name'].lower()
-                        mod['name'] = mod['name'].replace(" ", "_")
-                        if 'cross-link donor' not in mod.keys() and 'cross-link acceptor' not in mod.keys() and 'cross-link receiver' not in mod.keys():
-                            cur_mod = pep_seq_dict[mod_location]
-                            # join modifications into one for multiple modifications on the same aa
-                            if not cur_mod['Modification'] == '':
-                                mod['name'] = '_'.join(sorted([cur_mod['Modification'], mod['name']], key=str.lower))
-                                cur_mod_mass = [x['monoisotopicMassDelta'] for x in self.modlist if x['name'] == cur_mod['Modification']][0]
-                                mod['monoisotopicMassDelta'] += cur_mod_mass
-
-                            # save to all mods list and get back new_name
-                            mod['name'] = self.add_to_modlist(mod)
-                            cur_mod['Modification'] = mod['name']
-
-                    # error handling for mod without name
-                    else:
-                        # cross-link acceptor doesn't have a name
-                        if 'cross-link acceptor' not in mod.keys() and 'cross-link receiver' not in mod.keys():
-                            raise MzIdParseException("Missing modification name")
-
-                    # add CL locations
-                    if 'cross-link donor' in mod.keys() or 'cross-link acceptor' in mod.keys()\
-                            or 'cross-link receiver' in mod.keys():
-                        # use mod['location'] for link-site (1-based in database in line with mzIdentML specifications)
-                        link_site = mod['location']
-                        crosslinker_modmass = mod['monoisotopicMassDelta']
-
-                    if 'cross-link acceptor' in mod.keys():
-                        value = mod['cross-link acceptor']['value']
-                    if 'cross-link donor' in mod.keys():
-                        value = mod['cross-link donor']['value']
-                    if 'cross-link receiver' in mod.keys():
-                        value = mod['cross-link receiver']['value']
-
-            # ToDo: we should consider swapping these over because modX format has modification
-            #  before AA
-            peptide_seq_with_mods = ''.join(
-                [''.join([x['aminoAcid'], x['Modification']]) for x in pep_seq_dict])
-
-            data = [
-                # peptide_index,      # debug use mzid peptide['id'],
-                peptide['id'],
-                peptide_seq_with_mods,
-                link_site,
-                crosslinker_modmass,
-                self.upload_id,
-                str(value)
-            ]
-
-            peptide_inj_list.append(data)
-            #  self.peptide_id_lookup[peptide['id']] = peptide_index
+        for peptide in self.element_cache.iter_elements('Peptide'):
+            peptide_inj_list.append(self.get_peptide_data(peptide, unimod_masses))
 
             if peptide_index % 1000 == 0:
                 self.logger.info('writing 1000 peptides to DB')
@@ -554,65 +523,137 @@ class MzIdParser:
             self.con.commit()
         except Exception as e:
             raise e
-        #
-        mod_index = 0
-        modifications_inj_list = []
-        for mod in self.modlist:
-            try:
-                mod_accession = mod['accession']
-            except KeyError:
-                mod_accession = ''
-            modifications_inj_list.append([
-                mod_index,
-                self.upload_id,
-                mod['name'],
-                mod['monoisotopicMassDelta'],
-                ''.join(mod['residues']),
-                mod_accession
-            ])
-            mod_index += 1
-        self.db.write_modifications(modifications_inj_list, self.cur, self.con)
+
+        self.write_modifications()
 
         self.logger.info('parse peptides, modifications - done. Time: {} sec'.format(
             round(time() - start_time, 2)))
 
+    def get_peptide_data(self, peptide, unimod_masses):
+        """
+        Adds the peptide's modifications to self.modlist and returns its peptides row.
+
+        :param peptide: parsed Peptide element
+        :param unimod_masses: unimod accession -> mass dict
+        :return: peptides row
+        """
+        pep_seq_dict = []
+        for aa in peptide['PeptideSequence']:
+            pep_seq_dict.append({"Modification": "", "aminoAcid": aa})
+
+        link_site = -1
+        crosslinker_modmass = None
+        value = None
+
+        # MODIFICATIONS
+        # add in modifications
+        if 'Modification' in peptide.keys():
+            for mod in peptide['Modification']:
+
+                if 'monoisotopicMassDelta' not in mod.keys():
+                    try:
+                        mod['monoisotopicMassDelta'] = unimod_masses[mod['accession']]
+
+                    # ToDo: what's going on here?
+                    except KeyError:
+                        # seq_ref_prot_map['errors'].append({
+                        #     "type": "mzidParseError",
+                        #     "message": "could not get modification mass for modification {}".format(mod),
+                        #     "id": mod["id"]
+                        # })
+                        continue
+
+                # link_index = 0  # TODO: multilink support
+                # mod_location is 0-based for assigning modifications to correct amino acid
+                # mod['location'] is 1-based with 0 = n-terminal and len(pep)+1 = C-terminal
+                if mod['location'] == 0:
+                    mod_location = 0
+                    # n_terminal_mod = True
+                elif mod['location'] == len(peptide['PeptideSequence']) + 1:
+                    mod_location = mod['location'] - 2
+                    # c_terminal_mod = True
+                else:
+                    mod_location = mod['location'] - 1
+                    # n_terminal_mod = False
+                    # c_terminal_mod = False
+                if 'residues' not in mod:
+                    mod['residues'] = peptide['PeptideSequence'][mod_location]
+
+                # TODO - issues here with using names rather than cv param accession
+                #  (cross-link acceptor/ receiver)
+                if 'name' in mod.keys():
+                    # fix mod names
+                    if isinstance(mod['name'], list):  # todo: have a look at this  - cc
+                        mod['name'] = ','.join(mod['name'])
+                    mod['name'] = mod['name'].lower()
+                    mod['name'] = mod['name'].replace(" ", "_")
+                    if 'cross-link donor' not in mod.keys() and 'cross-link acceptor' not in mod.keys() and 'cross-link receiver' not in mod.keys():
+                        cur_mod = pep_seq_dict[mod_location]
+                        # join modifications into one for multiple modifications on the same aa
+                        if not cur_mod['Modification'] == '':
+                            mod['name'] = '_'.join(sorted([cur_mod['Modification'], mod['name']], key=str.lower))
+                            cur_mod_mass = self.modlist.get_mass(cur_mod['Modification'])
+                            mod['monoisotopicMassDelta'] += cur_mod_mass
+
+                        # save to all mods list and get back new_name
+                        mod['name'] = self.add_to_modlist(mod)
+                        cur_mod['Modification'] = mod['name']
+
+                # error handling for mod without name
+                else:
+                    # cross-link acceptor doesn't have a name
+                    if 'cross-link acceptor' not in mod.keys() and 'cross-link receiver' not in mod.keys():
+                        raise MzIdParseException("Missing modification name")
+
+                # add CL locations
+                if 'cross-link donor' in mod.keys() or 'cross-link acceptor' in mod.keys()\
+                        or 'cross-link receiver' in mod.keys():
+                    # use mod['location'] for link-site (1-based in database in line with mzIdentML specifications)
+                    link_site = mod['location']
+                    crosslinker_modmass = mod['monoisotopicMassDelta']
+
+                if 'cross-link acceptor' in mod.keys():
+                    value = mod['cross-link acceptor']['value']
+                if 'cross-link donor' in mod.keys():
+                    value = mod['cross-link donor']['value']
+                if 'cross-link receiver' in mod.keys():
+                    value = mod['cross-link receiver']['value']
+
+        # ToDo: we should consider swapping these over because modX format has modification
+        #  before AA
+        peptide_seq_with_mods = ''.join(
+            [''.join([x['aminoAcid'], x['Modification']]) for x in pep_seq_dict])
+
+        data = [
+            # peptide_index,      # debug use mzid peptide['id'],
+            peptide['id'],
+            peptide_seq_with_mods,
+            link_site,
+            crosslinker_modmass,
+            self.upload_id,
+            str(value)
+        ]
+        #  self.peptide_id_lookup[peptide['id']] = peptide_index
+
+        return data
+
+    def write_modifications(self):
+        self.db.write_modifications(self.modlist.get_inj_list(self.upload_id), self.cur, self.con)
+
     def parse_peptide_evidences(self):
         start_time = time()
         self.logger.info('parse peptide evidences - start')
 
-        seq_id_to_acc_map = {}
-
-        for db_id in self.mzid_reader._offset_index["DBSequence"].keys():
-            db_sequence = self.mzid_reader.get_by_id(db_id, tag_id='DBSequence', detailed=True)
-            seq_id_to_acc_map[db_sequence["id"]] = db_sequence["accession"]
+        # already collected by parse_db_sequences (not in the xiSPEC subclass)
+        if not self.seq_id_to_acc_map:
+            for db_sequence in self.element_cache.iter_elements('DBSequence'):
+                self.seq_id_to_acc_map[db_sequence["id"]] = db_sequence["accession"]
+        seq_id_to_acc_map = self.seq_id_to_acc_map
 
         # PEPTIDE EVIDENCES
         inj_list = []
-        for pep_ev_id in self.mzid_reader._offset_index["PeptideEvidence"].keys():
-            peptide_evidence = self.mzid_reader.get_by_id(pep_ev_id, tag_id='PeptideEvidence',
-                                                          detailed=True)
-
-            pep_start = -1
-            if "start" in peptide_evidence:
-                pep_start = peptide_evidence["start"]    # start att, optional
-
-            is_decoy = False
-            if "isDecoy" in peptide_evidence:
-                is_decoy = peptide_evidence["isDecoy"]   # isDecoy att, optional
-
-            # peptide_ref = self.peptide_id_lookup[peptide_evidence["peptide_ref"]]
-            peptide_ref = peptide_evidence["peptide_ref"]     # debug use mzid peptide['id'],
-
-            data = [
-                peptide_ref,                                                 # 'peptide_ref',
-                peptide_evidence["dBSequence_ref"],                          # 'dbsequence_ref',
-                seq_id_to_acc_map[peptide_evidence["dBSequence_ref"]],       # 'protein_accession',
-                pep_start,                                                   # 'pep_start',
-                is_decoy,                                                    # 'is_decoy',
-                self.upload_id                                               # 'upload_id'
-            ]
-
-            inj_list.append(data)
+        for peptide_evidence in self.element_cache.iter_elements('PeptideEvidence'):
+            inj_list.append(self.get_peptide_evidence_data(peptide_evidence, seq_id_to_acc_map))
 
             if len(inj_list) % 1000 == 0:
                 self.logger.info('writing 1000 peptide_evidences to DB')
@@ -635,27 +676,128 @@ class MzIdParser:
         self.logger.info('parse peptide evidences - done. Time: {} sec'.format(
             round(time() - start_time, 2)))
 
-    @staticmethod
-    def get_unimod_masses(unimod_path):
-        masses = {}
-        mod_id = -1
+    def get_peptide_evidence_data(self, peptide_evidence, seq_id_to_acc_map):
+        """
+        :param peptide_evidence: parsed PeptideEvidence element
+        :param seq_id_to_acc_map: DBSequence id -> accession dict
+        :return: peptide_evidences row
+        """
+        pep_start = -1
+        if "start" in peptide_evidence:
+            pep_start = peptide_evidence["start"]    # start att, optional
+
+        is_decoy = False
+        if "isDecoy" in peptide_evidence:
+            is_decoy = peptide_evidence["isDecoy"]   # isDecoy att, optional
+
+        # peptide_ref = self.peptide_id_lookup[peptide_evidence["peptide_ref"]]
+        peptide_ref = peptide_evidence["peptide_ref"]     # debug use mzid peptide['id'],
 
-        with open(unimod_path) as f:
-            for line in f:
-                if line.startswith('id: '):
-                    mod_id = ''.join(line.replace('id: ', '').split())
+        data = [
+            peptide_ref,                                                 # 'peptide_ref',
+            peptide_evidence["dBSequence_ref"],                          # 'dbsequence_ref',
+            seq_id_to_acc_map[peptide_evidence["dBSequence_ref"]],       # 'protein_accession',
+            pep_start,                                                   # 'pep_start',
+            is_decoy,                                                    # 'is_decoy',
+            self.upload_id                                               # 'upload_id'
+        ]
 
-                elif line.startswith('xref: delta_mono_mass ') and not mod_id == -1:
-                    mass = float(line.replace('xref: delta_mono_mass ', '').replace('"', ''))
-                    masses[mod_id] = mass
+        return data
 
-        return masses
+    def parse_sequence_collection(self):
+        """
+        Streaming alternative to parse_db_sequences, parse_peptides and parse_peptide_evidences.
+
+        Walks the SequenceCollection once with iterparse instead of seeking to and re-parsing
+        every DBSequence, Peptide and PeptideEvidence by id. Rows are identical to the ones
+        written by the three separate functions. Elements are freed as soon as they are
+        written and the scan stops at the end of the SequenceCollection.
+        """
+        start_time = time()
+        self.logger.info('parse sequence collection (streaming) - start')
+
+        # ToDo: might be stuff in pyteomics lib for this?
+        unimod_masses = self.get_unimod_masses(self.unimod_path)
+
+        seq_id_to_acc_map = {}
+        db_sequences = []
+        peptides = []
+        peptide_evidences = []
+        peptide_index = 0
+
+        for event, elem in etree.iterparse(self.mzid_path, events=('start', 'end'),
+                                           remove_comments=True, huge_tree=True):
+            tag = etree.QName(elem).localname
+            if event == 'start':
+                # SequenceCollection is optional - don't scan the rest of the file without it
+                if tag == 'AnalysisCollection':
+                    break
+                continue
+
+            if tag == 'DBSequence':
+                db_sequence = self.mzid_reader._get_info_smart(elem, detailed=True)
+                seq_id_to_acc_map[db_sequence["id"]] = db_sequence["accession"]
+                db_sequences.append(self.get_db_sequence_data(db_sequence))
+
+                if len(db_sequences) % 1000 == 0:
+                    self.write_db_sequences(db_sequences)
+                    db_sequences = []
+
+            elif tag == 'Peptide':
+                peptide = self.mzid_reader._get_info_smart(elem, detailed=True)
+                peptides.append(self.get_peptide_data(peptide, unimod_masses))
+
+                if peptide_index % 1000 == 0:
+                    self.logger.info('writing 1000 peptides to DB')
+                    self.db.write_peptides(peptides, self.cur, self.con)
+                    peptides = []
+                    self.con.commit()
+                peptide_index += 1
+
+            elif tag == 'PeptideEvidence':
+                peptide_evidence = self.mzid_reader._get_info_smart(elem, detailed=True)
+                peptide_evidences.append(
+                    self.get_peptide_evidence_data(peptide_evidence, seq_id_to_acc_map))
+
+                if len(peptide_evidences) % 1000 == 0:
+                    self.logger.info('writing 1000 peptide_evidences to DB')
+                    self.db.write_peptide_evidences(peptide_evidences, self.cur, self.con)
+                    peptide_evidences = []
+                    self.con.commit()
+
+            elif tag == 'SequenceCollection':
+                break
+
+            else:
+                # children are cleared together with their DBSequence/Peptide/PeptideEvidence
+                continue
+
+            # free the processed element and its already processed siblings
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+        self.write_db_sequences(db_sequences)
+        self.db.write_peptides(peptides, self.cur, self.con)
+        self.db.write_peptide_evidences(peptide_evidences, self.cur, self.con)
+        self.con.commit()
+
+        self.write_modifications()
+
+        self.logger.info('parse sequence collection (streaming) - done. Time: {} sec'.format(
+            round(time() - start_time, 2)))
+
+    @staticmethod
+    def get_unimod_masses(unimod_path):
+        """
+        :param unimod_path: path to unimod.obo
+        :return: unimod accession -> mass dict (from the compiled, process-wide Unimod table)
+        """
+        return UnimodTable.get_table(unimod_path).masses
 
     def main_loop(self):
         spec_id = 0
         identification_id = 0
-        spectra = []
-        spectrum_identifications = []
 
         fragment_parsing_error_scans = []
 
@@ -664,15 +806,230 @@ class MzIdParser:
         main_loop_start_time = time()
         self.logger.info('main loop - start')
 
+        byte_ranges = []
+        if self.processes > 1:
+            byte_ranges = self.get_sid_result_byte_ranges()
+
+        if len(byte_ranges) > 0:
+            chunks = self.parallel_sid_result_chunks(byte_ranges)
+        else:
+            chunks = self.sid_result_chunks()
+
+        for (sid_result_count, spectra, spectrum_identifications, error_scans, crosslinks,
+             score_name_sets, scores_rows) in chunks:
+            # chunk rows are numbered from 0 - shift them onto the running ids
+            for spectrum in spectra:
+                spectrum[0] += spec_id
+            for ident_data in spectrum_identifications:
+                ident_data[0] += identification_id
+                ident_data[2] += spec_id
+            for score_names, ident_ids in score_name_sets.items():
+                self.score_name_sets.setdefault(score_names, array('l')).extend(
+                    [ident_id + identification_id for ident_id in ident_ids])
+            scores_rows = [
+                [ident_id + identification_id, self.upload_id, self.get_score_name_id(name), value]
+                for ident_id, name, value in scores_rows
+            ]
+
+            spec_id += sid_result_count
+            identification_id += len(spectrum_identifications)
+            fragment_parsing_error_scans += error_scans
+            if crosslinks:
+                self.contains_crosslinks = True
+
+            self.logger.info('writing {} entries ({} spectra and their idents) to DB'.format(
+                sid_result_count, len(spectra)))
+            try:
+                self.db.write_spectra(spectra, self.cur, self.con)
+                self.db.write_spectrum_identifications(spectrum_identifications, self.cur,
+                                                       self.con)
+                if self.score_table:
+                    self.db.write_scores(scores_rows, self.cur, self.con)
+                self.con.commit()
+            except Exception as e:
+                raise e
+
+        # end main loop
+        self.logger.info('main loop - done Time: {} sec'.format(
+            round(time() - main_loop_start_time, 2)))
+
+        self.ident_count = identification_id
+
+        if self.score_table:
+            self.db.write_score_names(
+                [[score_name_id, self.upload_id, name] for name, score_name_id
+                 in sorted(self.score_name_ids.items(), key=lambda i: i[1])],
+                self.cur, self.con)
+            self.con.commit()
+
+        # warnings
+        if len(fragment_parsing_error_scans) > 0:
+            if len(fragment_parsing_error_scans) > 50:
+                id_string = '; '.join(fragment_parsing_error_scans[:50]) + ' ...'
+            else:
+                id_string = '; '.join(fragment_parsing_error_scans)
+
+            self.warnings.append({
+                "type": "IonParsing",
+                "message": "mzidentML file does not specify fragment ions.",
+                'id': id_string
+            })
+
+    def sid_result_chunks(self, chunk_size=1000):
+        """
+        Serially iterates the SpectrumIdentificationResults and yields processed chunks.
+        """
+        sid_results = []
         for sid_result in self.mzid_reader:
+            sid_results.append(sid_result)
+            if len(sid_results) == chunk_size:
+                yield self.process_sid_results(sid_results)
+                sid_results = []
+
+        if len(sid_results) > 0:
+            yield self.process_sid_results(sid_results)
+
+    def parallel_sid_result_chunks(self, byte_ranges):
+        """
+        Processes the SpectrumIdentificationResult byte ranges in a pool of worker processes
+        and yields the processed chunks in file order.
+
+        Workers are forked from this process and read the mzid and peak list files through
+        their own file handles.
+        """
+        global _parallel_parser
+        _parallel_parser = self
+        pool = multiprocessing.Pool(self.processes, initializer=_init_main_loop_worker)
+        try:
+            for chunk in pool.imap(_main_loop_worker, byte_ranges):
+                yield chunk
+        finally:
+            pool.terminate()
+            pool.join()
+            _parallel_parser = None
+
+    def get_sid_result_byte_ranges(self, chunk_size=1000):
+        """
+        Splits the SpectrumIdentificationResults into byte ranges of up to chunk_size results.
+        A range never spans two SpectrumIdentificationLists.
+
+        :return: list of (start, end) byte offsets
+        """
+        self.logger.info('index SpectrumIdentificationResults - start')
+        start_time = time()
+
+        offsets = ByteCountingXMLScanner.scan(self.mzid_path, [
+            'SpectrumIdentificationResult',
+            'SpectrumIdentificationList',
+            'ProteinDetectionList'
+        ])
+        tagged_offsets = sorted(
+            (offset, tag == b'SpectrumIdentificationResult')
+            for tag, index in offsets.items() for offset in index.values()
+        )
+        tagged_offsets.append((os.path.getsize(self.mzid_path), False))
+
+        byte_ranges = []
+        start = None
+        count = 0
+        for offset, is_sid_result in tagged_offsets:
+            if start is not None and (not is_sid_result or count == chunk_size):
+                byte_ranges.append((start, offset))
+                start = None
+                count = 0
+            if is_sid_result:
+                if start is None:
+                    start = offset
+                count += 1
+
+        # root element (with the namespace declarations) wrapping each range for parsing
+        for _, elem in etree.iterparse(self.mzid_path, events=('start',)):
+            self.mzid_root_tags = self.get_root_tags(elem)
+            break
+
+        self.logger.info('index SpectrumIdentificationResults - done. Time: {} sec'.format(
+            round(time() - start_time, 2)))
+
+        return byte_ranges
+
+    def read_sid_results(self, start, end):
+        """
+        Parses the SpectrumIdentificationResults between the byte offsets start and end.
+
+        :return: list of SpectrumIdentificationResult dicts
+        """
+        with open(self.mzid_path, 'rb') as f:
+            f.seek(start)
+            buff = f.read(end - start)
+
+        # drop closing tags of the enclosing elements following the last result
+        last_close = buff.rfind(b'SpectrumIdentificationResult')
+        buff = buff[:buff.index(b'>', last_close) + 1]
+
+        open_tag, close_tag = self.mzid_root_tags
+        sid_results = []
+        for _, elem in etree.iterparse(BytesIO(open_tag + buff + close_tag), events=('end',),
+                                       remove_comments=True, huge_tree=True):
+            if etree.QName(elem).localname == 'SpectrumIdentificationResult':
+                sid_results.append(self.mzid_reader._get_info_smart(elem))
+                elem.clear()
+
+        return sid_results
+
+    def process_sid_results(self, sid_results):
+        """
+        Converts SpectrumIdentificationResults into spectra and spectrum_identifications rows.
+        spec_id and identification_id of the rows are numbered from 0.
+
+        :param sid_results: list of SpectrumIdentificationResult dicts
+        :return: tuple (number of results, spectra rows, spectrum_identifications rows,
+            ids of results without fragment ion types, contains crosslinks,
+            dict frozenset of score names -> identification ids with these scores,
+            score rows [identification_id, score name, value] if score_table is set)
+        """
+        spec_id = 0
+        identification_id = 0
+        spectra = []
+        spectrum_identifications = []
+        score_name_sets = {}
+        scores_rows = []
+
+        fragment_parsing_error_scans = []
+
+        # read the scans of the chunk in file order
+        scans = {}
+        if self.peak_list_dir and self.peak_list_store is None:
+            spectrum_ids = {}
+            for sid_result in sid_results:
+                spectrum_ids.setdefault(sid_result['spectraData_ref'], []).append(
+                    sid_result['spectrumID'])
+
+            for spectra_data_ref, spectrum_id_list in spectrum_ids.items():
+                peak_list_reader = self.peak_list_readers[spectra_data_ref]
+                for spectrum_id, scan_id, scan in peak_list_reader.get_scans(spectrum_id_list):
+                    scans[(spectra_data_ref, spectrum_id)] = (scan_id, scan)
+
+        for sid_result in sid_results:
             if self.peak_list_dir:
                 peak_list_reader = self.peak_list_readers[sid_result['spectraData_ref']]
 
-                scan_id = peak_list_reader.parse_scan_id(sid_result["spectrumID"])
-                scan = peak_list_reader.get_scan(scan_id)
-
                 protocol = self.spectra_data_protocol_map[sid_result['spectraData_ref']]
 
+                if self.peak_list_store is None:
+                    scan_id, scan = scans[(sid_result['spectraData_ref'], sid_result["spectrumID"])]
+                    peak_location = [None, None, None, None]
+                else:
+                    # lazy peaks - only store where to find the scan
+                    scan_id = peak_list_reader.parse_scan_id(sid_result["spectrumID"])
+                    offset, length = peak_list_reader.get_scan_location(scan_id)
+                    scan = {'peaks': None, 'peak_blob': None, 'precursor': None}
+                    peak_location = [
+                        self.peak_file_hashes[sid_result['spectraData_ref']],
+                        offset,
+                        length,
+                        peak_list_reader.file_format_accession
+                    ]
+
                 if scan['precursor'] is not None:
                     precursor_mz = scan['precursor']['mz']
                     precursor_charge = scan['precursor']['charge']
@@ -690,8 +1047,9 @@ class MzIdParser:
                         self.upload_id,
                         sid_result['id'],
                         precursor_mz,
-                        precursor_charge
-                    ])
+                        precursor_charge,
+                        scan['peak_blob']
+                    ] + peak_location)
 
             spectrum_ident_dict = dict()
             linear_index = -1  # negative index values for linear peptides
@@ -783,6 +1141,9 @@ class MzIdParser:
                     ]
 
                     spectrum_ident_dict[cross_link_id] = ident_data
+                    score_name_sets.setdefault(frozenset(scores), []).append(identification_id)
+                    if self.score_table:
+                        scores_rows += self.get_scores_rows(identification_id, scores)
 
                     identification_id += 1
 
@@ -790,129 +1151,89 @@ class MzIdParser:
 
             spec_id += 1
 
-            if spec_id % 1000 == 0:
-                self.logger.info('writing 1000 entries (1000 spectra and their idents) to DB')
-                try:
-                    self.db.write_spectra(spectra, self.cur, self.con)
-                    spectra = []
-                    self.db.write_spectrum_identifications(spectrum_identifications, self.cur,
-                                                           self.con)
-                    spectrum_identifications = []
-                    self.con.commit()
-                except Exception as e:
-                    raise e
+        return (spec_id, spectra, spectrum_identifications, fragment_parsing_error_scans,
+                self.contains_crosslinks, score_name_sets, scores_rows)
 
-        # end main loop
-        self.logger.info('main loop - done Time: {} sec'.format(
-            round(time() - main_loop_start_time, 2)))
+    @staticmethod
+    def get_scores_rows(identification_id, scores):
+        """
+        :param identification_id: spectrum identification id
+        :param scores: scores dict of the identification
+        :return: list of [identification_id, score name, value] for the numeric scores
+        """
+        rows = []
+        for name, value in scores.items():
+            try:
+                rows.append([identification_id, name, float(value)])
+            except (TypeError, ValueError):
+                pass
+        return rows
 
-        # once loop is done write remaining data to DB
-        db_wrap_up_start_time = time()
-        self.logger.info('write remaining entries to DB - start')
+    def get_score_name_id(self, name):
         try:
-            self.db.write_spectra(spectra, self.cur, self.con)
-            self.db.write_spectrum_identifications(spectrum_identifications, self.cur, self.con)
-            self.con.commit()
-        except Exception as e:
-            raise e
-
-        self.logger.info('write remaining entries to DB - start - done.  Time: {} sec'.format(
-            round(time() - db_wrap_up_start_time, 2)))
-
-        self.ident_count = identification_id
-
-        # warnings
-        if len(fragment_parsing_error_scans) > 0:
-            if len(fragment_parsing_error_scans) > 50:
-                id_string = '; '.join(fragment_parsing_error_scans[:50]) + ' ...'
-            else:
-                id_string = '; '.join(fragment_parsing_error_scans)
-
-            self.warnings.append({
-                "type": "IonParsing",
-                "message": "mzidentML file does not specify fragment ions.",
-                'id': id_string
-            })
+            return self.score_name_ids[name]
+        except KeyError:
+            self.score_name_ids[name] = len(self.score_name_ids)
+            return self.score_name_ids[name]
 
     def upload_info(self):
         self.upload_info_read = True
         upload_info_start_time = time()
         self.logger.info('parse upload info - start')
 
-        peak_list_file_names = json.dumps(self.get_all_peak_list_file_names(), cls=NumpyEncoder)
-
         spectra_formats = []
-        for spectra_data_id in self.mzid_reader._offset_index["SpectraData"].keys():
-            sp_datum = self.mzid_reader.get_by_id(spectra_data_id, tag_id='SpectraData',
-                                                  detailed=True)
+        peak_list_file_names = []
+        for sp_datum in self.element_cache.iter_elements('SpectraData'):
             spectra_formats.append(sp_datum)
+            peak_list_file_names.append(ntpath.basename(sp_datum['location']))
+        peak_list_file_names = json.dumps(peak_list_file_names, cls=NumpyEncoder)
         spectra_formats = json.dumps(spectra_formats, cls=NumpyEncoder)
 
-        # AnalysisSoftwareList - optional element
-        # see https://groups.google.com/forum/#!topic/pyteomics/Mw4eUHmicyU
-        self.mzid_reader.schema_info['lists'].add("AnalysisSoftware")
         try:
-            analysis_software = json.dumps(self.mzid_reader.iterfind('AnalysisSoftwareList').next()['AnalysisSoftware'])
-        except StopIteration:
-            analysis_software = '{}'
-        except Exception as e:
-            raise MzIdParseException(type(e).__name__, e.args)
-        self.mzid_reader.reset()
+            header = self.get_header()
 
-        # Provider - optional element
-        try:
-            provider = json.dumps(self.mzid_reader.iterfind('Provider').next())
-        except StopIteration:
-            provider = '{}'
-        except Exception as e:
-            raise MzIdParseException(type(e).__name__, e.args)
-        self.mzid_reader.reset()
+            # AnalysisSoftwareList - optional element
+            if header['AnalysisSoftwareList']:
+                analysis_software = json.dumps(header['AnalysisSoftwareList'][0]['AnalysisSoftware'])
+            else:
+                analysis_software = '{}'
 
-        # AuditCollection - optional element
-        audits = '{}'
-        try:
-            audits = json.dumps(self.mzid_reader.iterfind('AuditCollection').next())
-        except StopIteration:
-            audits = '{}'
-        except Exception as e:
-            raise MzIdParseException(type(e).__name__, e.args)
-        self.mzid_reader.reset()
+            # Provider - optional element
+            if header['Provider']:
+                provider = json.dumps(header['Provider'][0])
+            else:
+                provider = '{}'
 
-        # AnalysisSampleCollection - optional element
-        try:
-            samples = json.dumps(self.mzid_reader.iterfind('AnalysisSampleCollection').next()['Sample'])
-        except StopIteration:
-            samples = '{}'
-        except Exception as e:
-            raise MzIdParseException(type(e).__name__, e.args)
-        self.mzid_reader.reset()
+            # AuditCollection - optional element
+            if header['AuditCollection']:
+                audits = json.dumps(header['AuditCollection'][0])
+            else:
+                audits = '{}'
 
-        # AnalysisCollection - required element, StopIteration exception shouldn't happen
-        try:
-            analyses = json.dumps(self.mzid_reader.iterfind('AnalysisCollection').next()['SpectrumIdentification'])
-        except StopIteration:
-            analyses = '{}' # could legitimately throw error here instead, its required
-        except Exception as e:
-            raise MzIdParseException(type(e).__name__, e.args)
-        self.mzid_reader.reset()
+            # AnalysisSampleCollection - optional element
+            if header['AnalysisSampleCollection']:
+                samples = json.dumps(header['AnalysisSampleCollection'][0]['Sample'])
+            else:
+                samples = '{}'
 
-        # AnalysisProtocolCollection - required element
-        try:
-            protocol_collection = self.mzid_reader.iterfind('AnalysisProtocolCollection').next()
-            protocols = json.dumps(protocol_collection['SpectrumIdentificationProtocol'],
-                                   cls=NumpyEncoder)
-        except StopIteration:
-            protocols = '{}' # could legitimately throw error here instead, its required
+            # AnalysisCollection - required element
+            if header['AnalysisCollection']:
+                analyses = json.dumps(header['AnalysisCollection'][0]['SpectrumIdentification'])
+            else:
+                analyses = '{}'  # could legitimately throw error here instead, its required
+
+            # AnalysisProtocolCollection - required element
+            if header['AnalysisProtocolCollection']:
+                protocols = json.dumps(
+                    header['AnalysisProtocolCollection'][0]['SpectrumIdentificationProtocol'],
+                    cls=NumpyEncoder)
+            else:
+                protocols = '{}'  # could legitimately throw error here instead, its required
+
+            # BibliographicReference - optional element
+            bibRefs = json.dumps(header['BibliographicReference'])
         except Exception as e:
             raise MzIdParseException(type(e).__name__, e.args)
-        self.mzid_reader.reset()
-
-        # BibliographicReference - optional element
-        bibRefs = []
-        for bib in self.mzid_reader.iterfind('BibliographicReference'):
-            bibRefs.append(bib)
-        bibRefs = json.dumps(bibRefs)
-        self.mzid_reader.reset()
 
         self.db.write_mzid_info(peak_list_file_names,
                                 spectra_formats,
@@ -928,6 +1249,182 @@ class MzIdParser:
         self.logger.info('getting upload info - done  Time: {} sec'.format(
                 round(time() - upload_info_start_time, 2)))
 
+    @staticmethod
+    def get_root_tags(elem):
+        """
+        :param elem: root element of the mzid
+        :return: tuple (open tag with the namespace declarations, close tag) of the root element
+        """
+        root = etree.Element(elem.tag, nsmap=elem.nsmap)
+        root.text = ''
+        open_tag, close_tag = etree.tostring(root).split(b'><')
+        return open_tag + b'>', b'<' + close_tag
+
+    def get_header(self):
+        """
+        :return: the top level elements read by read_header (only read once per upload)
+        """
+        if self.header is None:
+            self.header = self.read_header()
+        return self.header
+
+    def read_header(self):
+        """
+        Reads the top level elements used by upload_info in one forward scan, instead of an
+        iterfind (an iterparse from the top of the file) per element.
+
+        The scan reads the elements before the SequenceCollection, seeks past the
+        SequenceCollection (behind its last indexed element), reads the AnalysisCollection and
+        AnalysisProtocolCollection and stops at the DataCollection. The BibliographicReferences
+        following the DataCollection are read from the end of the file.
+
+        :return: dict top level element name -> list of parsed elements
+        """
+        header = dict((tag, []) for tag in self.header_tags)
+
+        # AnalysisSoftwareList - see https://groups.google.com/forum/#!topic/pyteomics/Mw4eUHmicyU
+        self.mzid_reader.schema_info['lists'].add("AnalysisSoftware")
+
+        with open(self.mzid_path, 'rb') as f:
+            root_tags = None
+            parser = etree.XMLPullParser(events=('start', 'end'), remove_comments=True,
+                                         huge_tree=True)
+            depth = 0
+            done = False
+            while not done:
+                block = f.read(self.header_block_size)
+                if not block:
+                    break
+                parser.feed(block)
+                for event, elem in parser.read_events():
+                    if event == 'start':
+                        depth += 1
+                        if depth == 1 and root_tags is None:
+                            root_tags = self.get_root_tags(elem)
+                        elif depth == 2:
+                            tag = etree.QName(elem).localname
+                            if tag == 'SequenceCollection':
+                                # continue with a new parser behind the SequenceCollection
+                                offset = self.find_tag(f, b'AnalysisCollection',
+                                                       self.get_sequence_collection_offset())
+                                if offset is None:
+                                    done = True
+                                    break
+                                f.seek(offset)
+                                parser = etree.XMLPullParser(events=('start', 'end'),
+                                                             remove_comments=True,
+                                                             huge_tree=True)
+                                parser.feed(root_tags[0])
+                                depth = 0
+                                break
+                            elif tag == 'DataCollection':
+                                done = True
+                                break
+                    else:
+                        if depth == 2:
+                            self.add_header_element(header, elem)
+                        depth -= 1
+
+            # BibliographicReferences follow the DataCollection
+            offset = self.rfind_tag(f, b'/DataCollection')
+            if root_tags is not None and offset is not None:
+                f.seek(offset)
+                tail = f.read()
+                tail = tail[tail.index(b'>') + 1:]
+                for _, elem in etree.iterparse(BytesIO(root_tags[0] + tail), events=('end',),
+                                               remove_comments=True, huge_tree=True):
+                    if elem.getparent() is not None and elem.getparent().getparent() is None:
+                        self.add_header_element(header, elem)
+
+        return header
+
+    def add_header_element(self, header, elem):
+        tag = etree.QName(elem).localname
+        if tag in header:
+            header[tag].append(self.mzid_reader._get_info_smart(elem))
+        elem.clear()
+
+    def get_sequence_collection_offset(self):
+        """
+        :return: byte offset of the last indexed element of the SequenceCollection (a position
+            inside the SequenceCollection close to its end)
+        """
+        offset = 0
+        for tag in ['DBSequence', 'Peptide', 'PeptideEvidence']:
+            if tag in self.mzid_reader._offset_index:
+                tag_offsets = self.mzid_reader._offset_index[tag].values()
+                if len(tag_offsets) > 0:
+                    offset = max(offset, max(tag_offsets))
+        return offset
+
+    def find_tag(self, f, tag, start):
+        """
+        :param f: mzid file
+        :param tag: tag name (bytes), e.g. b'AnalysisCollection' or b'/DataCollection'
+        :param start: byte offset to search from
+        :return: byte offset of the first tag after start or None
+        """
+        pattern = re.compile(br'<(/?)(?:[\w.-]+:)?' + tag.lstrip(b'/') + br'[\s/>]')
+        closing = tag.startswith(b'/')
+        f.seek(start)
+        offset = start
+        overlap = b''
+        while True:
+            block = f.read(self.header_block_size)
+            if not block:
+                return None
+            buff = overlap + block
+            for match in pattern.finditer(buff):
+                if bool(match.group(1)) == closing:
+                    return offset - len(overlap) + match.start()
+            overlap = buff[-(len(tag) + 64):]
+            offset += len(block)
+
+    def rfind_tag(self, f, tag):
+        """
+        :param f: mzid file
+        :param tag: tag name (bytes), e.g. b'/DataCollection'
+        :return: byte offset of the last tag in the file or None
+        """
+        pattern = re.compile(br'<(/?)(?:[\w.-]+:)?' + tag.lstrip(b'/') + br'[\s/>]')
+        closing = tag.startswith(b'/')
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        overlap = b''
+        while end > 0:
+            start = max(0, end - self.header_block_size)
+            f.seek(start)
+            buff = f.read(end - start) + overlap
+            matches = [m for m in pattern.finditer(buff) if bool(m.group(1)) == closing]
+            if matches:
+                return start + matches[-1].start()
+            overlap = buff[:len(tag) + 64]
+            end = start
+        return None
+
+    def create_indexes(self):
+        """
+        Builds the secondary indexes after the bulk load, so the inserts don't have to
+        maintain them. Only for the per-upload SQLite dbs, the shared PostgreSQL tables get
+        their indexes with the schema.
+        """
+        index_start_time = time()
+        self.logger.info('create indexes - start')
+        self.db.create_indexes(self.cur, self.con)
+        self.logger.info('create indexes - done. Time: {} sec'.format(
+            round(time() - index_start_time, 2)))
+
+    def create_psm_view(self):
+        """
+        Builds the denormalized psm_view table (one row per spectrum identification) for the
+        viewer, once all identifications are written.
+        """
+        psm_view_start_time = time()
+        self.logger.info('create psm view - start')
+        self.db.create_psm_view(self.upload_id, self.cur, self.con)
+        self.logger.info('create psm view - done. Time: {} sec'.format(
+            round(time() - psm_view_start_time, 2)))
+
     def fill_in_missing_scores(self):
         pass
 
@@ -945,11 +1442,20 @@ class xiSPEC_MzIdParser(MzIdParser):
     def parse_db_sequences(self):
         pass
 
+    def write_db_sequences(self, inj_list):
+        pass
+
     def fill_in_missing_scores(self):
-        # Fill missing scores with
+        # Fill missing scores with -1
+        # only the identifications that don't have all scores of the upload are updated
         score_fill_start_time = time()
         self.logger.info('fill in missing scores - start')
-        self.db.fill_in_missing_scores(self.cur, self.con)
+        all_score_names = set().union(*self.score_name_sets.keys())
+        for score_names, identification_ids in self.score_name_sets.items():
+            missing_score_names = all_score_names - score_names
+            if len(missing_score_names) > 0:
+                self.db.fill_in_missing_scores(sorted(missing_score_names), identification_ids,
+                                               self.cur, self.con)
         self.logger.info('fill in missing scores - done. Time: {}'.format(
             round(time() - score_fill_start_time, 2)))
 
@@ -0,0 +1,113 @@
+import re
+import zlib
+import struct
+import numpy as np
+
+
+class PeakEncodingException(Exception):
+    pass
+
+
+# magic, dtype ('d' float64 / 'f' float32), flags, number of peaks
+header_format = '<4scBxxI'
+header_size = struct.calcsize(header_format)
+magic = b'XPK1'
+ZLIB = 1
+
+# "mz intensity" peak lines of MGF/MS2 scans: the first two whitespace separated values,
+# which are parsed with float() (exponent notation, signs)
+peak_line_pattern = re.compile(r'^[^\S\n]*([-+]?[0-9.]\S*)[^\S\n]+([-+]?[0-9.]\S*)', re.M)
+
+
+class PeakEncoder:
+    """
+    Encodes peak arrays into the compact binary format stored in spectra.peak_blob:
+    a 12 byte header followed by the m/z array and the intensity array (optionally zlib
+    compressed as a whole).
+    """
+
+    def __init__(self, dtype='float64', compress=False):
+        """
+        :param dtype: 'float64' or 'float32'
+        :param compress: zlib compress the arrays
+        """
+        if dtype not in ('float64', 'float32'):
+            raise PeakEncodingException('unsupported peak dtype: %s' % dtype)
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.compress = compress
+
+    def encode(self, mz, intensity):
+        """
+        :param mz: m/z values
+        :param intensity: intensity values
+        :return: bytes
+        """
+        mz = np.asarray(mz, dtype=self.dtype)
+        intensity = np.asarray(intensity, dtype=self.dtype)
+        if len(mz) != len(intensity):
+            raise PeakEncodingException('m/z and intensity arrays differ in length')
+
+        data = mz.tobytes() + intensity.tobytes()
+        flags = 0
+        if self.compress:
+            data = zlib.compress(data)
+            flags |= ZLIB
+
+        return struct.pack(header_format, magic, self.dtype.char, flags, len(mz)) + data
+
+
+def decode_peaks(blob):
+    """
+    Decodes a spectra.peak_blob value.
+
+    :param blob: bytes (or buffer/memoryview as returned by the db drivers)
+    :return: tuple (mz, intensity) of numpy arrays
+    """
+    blob = bytes(blob)
+    try:
+        blob_magic, dtype_char, flags, count = struct.unpack(header_format, blob[:header_size])
+    except struct.error:
+        raise PeakEncodingException('invalid peak blob')
+    if blob_magic != magic:
+        raise PeakEncodingException('invalid peak blob')
+
+    data = blob[header_size:]
+    if flags & ZLIB:
+        data = zlib.decompress(data)
+
+    peaks = np.frombuffer(data, dtype=np.dtype(dtype_char).newbyteorder('<'))
+    if len(peaks) != 2 * count:
+        raise PeakEncodingException('invalid peak blob')
+
+    return peaks[:count], peaks[count:]
+
+
+def decode_peaks_to_text(blob):
+    """
+    :return: newline-joined "mz intensity" peak list, same layout as spectra.peak_list
+    """
+    mz, intensity = decode_peaks(blob)
+    return "\n".join(["%s %s" % (m, i) for m, i in zip(mz.tolist(), intensity.tolist())])
+
+
+def parse_peak_arrays(raw_scan):
+    """
+    Parses the "mz intensity" lines of a raw MGF/MS2 scan straight into arrays. Unlike the text
+    peak lists of the readers (parse_peak_list), lines with leading whitespace or signed values
+    are peaks as well (see peak_line_pattern).
+
+    :return: tuple (mz, intensity) of float64 numpy arrays
+    """
+    peak_lines = peak_line_pattern.findall(raw_scan)
+    try:
+        peaks = np.array(peak_lines, dtype=np.float64)
+    except ValueError:
+        for peak_line in peak_lines:
+            try:
+                float(peak_line[0]), float(peak_line[1])
+            except ValueError:
+                raise PeakEncodingException('invalid peak: %s %s' % peak_line)
+        raise
+    if len(peaks) == 0:
+        return np.zeros(0), np.zeros(0)
+    return peaks[:, 0], peaks[:, 1]
@@ -6,6 +6,9 @@ import pymzml
 import re
 import gzip
 import os
+import numpy as np
+from PeakEncoding import parse_peak_arrays
+from BatchedScanReader import BatchedScanReader
 
 
 class PeakListParseError(Exception):
@@ -17,7 +20,20 @@ class ScanNotFoundException(Exception):
 
 
 class PeakListParser:
-    def __init__(self, pl_path, file_format_accession, spectrum_id_format_accession):
+    # SpectrumIndexCache used for the readers' offset indices, None to always build them
+    index_cache = None
+
+    def __init__(self, pl_path, file_format_accession, spectrum_id_format_accession,
+                 peak_encoder=None, build_index=True):
+        """
+        :param pl_path: path to peak list file
+        :param file_format_accession: FileFormat accession of the peak list file
+        :param spectrum_id_format_accession: SpectrumIDFormat accession of the peak list file
+        :param peak_encoder: PeakEncoding.PeakEncoder to return the peaks as binary peak_blob
+            instead of text
+        :param build_index: False to skip indexing the file, the scans can then only be read
+            by their location with get_scan_at
+        """
         # self.spectra_data = spectra_data
         self.file_format_accession = file_format_accession
         self.spectrum_id_format_accession = spectrum_id_format_accession
@@ -25,18 +41,30 @@ class PeakListParser:
         self.peak_list_file_name = os.path.split(pl_path)[1]
 
         try:
-            if self.is_mzML():
-                self.reader = pymzml.run.Reader(pl_path)
+            if self.is_mzML() and not build_index:
+                self.reader = pymzml.run.Reader(pl_path, build_index=False)
+            elif not build_index:
+                # MGF/MS2 scans are parsed by the static methods of the readers
+                self.reader = None
+            elif self.is_mzML():
+                self.reader = pymzml.run.Reader(pl_path, index_cache=self.index_cache)
+            elif self.is_mgf() and not pl_path.endswith('.gz'):
+                self.reader = py_mgf.MmapReader(pl_path, index_cache=self.index_cache)
             elif self.is_mgf():
-                self.reader = py_mgf.Reader(pl_path)
+                self.reader = py_mgf.Reader(pl_path, index_cache=self.index_cache)
             elif self.is_ms2():
-                self.reader = py_msn.Reader(pl_path)
+                self.reader = py_msn.Reader(pl_path, index_cache=self.index_cache)
             else:
                 self.reader = None
         except Exception as e:
             message = "Error reading peak list file {0}: {1} - Arguments:\n{2!r}".format(self.peak_list_file_name, type(e).__name__, e.args)
             raise PeakListParseError(message)
 
+        self.peak_encoder = peak_encoder
+        if peak_encoder is not None and self.reader is not None and \
+                (self.is_mgf() or self.is_ms2()):
+            self.reader.peak_arrays = True
+
     def is_mgf(self):
         return self.file_format_accession == 'MS:1001062'
 
@@ -106,8 +134,20 @@ class PeakListParser:
             #                             ntpath.basename(self.peak_list_path), e.args)
             raise ScanNotFoundException("%s - for file: %s - scanId: %s" % (e.args[0], ntpath.basename(self.peak_list_path), scan_id))
 
+        return self.convert_scan(scan)
+
+    def convert_scan(self, scan):
+        """
+        :param scan: scan as returned by the reader
+        :return: scan dict as returned by get_scan
+        """
         if self.is_mzML():
-            peak_list = "\n".join(["%s %s" % (mz, i) for mz, i in scan.peaks if i > 0])
+            if self.peak_encoder is None:
+                peak_list = "\n".join(["%s %s" % (mz, i) for mz, i in scan.peaks if i > 0])
+            else:
+                peaks = np.array(scan.peaks, dtype=np.float64).reshape((-1, 2))
+                peaks = peaks[peaks[:, 1] > 0]
+                peak_list = (peaks[:, 0], peaks[:, 1])
             precursor = None
             if 'precursors' in scan:
                 precursor = scan['precursors'][0]
@@ -120,12 +160,112 @@ class PeakListParser:
             peak_list = scan['peaks']
             precursor = scan['precursor']
 
-        scan = {
-            'peaks': peak_list,
+        return self.get_scan_data(peak_list, precursor)
+
+    def get_scan_location(self, scan_id):
+        """
+        :param scan_id: scan id as returned by parse_scan_id
+        :return: tuple (byte offset, length) of the scan in the peak list file, offset -1 for
+            empty MGF/MS2 scans
+        """
+        if self.reader is None:
+            raise PeakListParseError("unsupported peak list file type for: %s" % ntpath.basename(self.peak_list_file_name))
+
+        try:
+            if self.is_mzML():
+                start_pos, end_pos = self.reader.get_offset_range(scan_id)
+            else:
+                position = self.reader.info['offsetList'][scan_id]
+                start_pos, end_pos = int(position[0]), int(position[1])
+        except (KeyError, IndexError):
+            raise ScanNotFoundException("no offset for scan - for file: %s - scanId: %s" % (ntpath.basename(self.peak_list_path), scan_id))
+
+        if start_pos == -1:
+            return -1, 0
+        return start_pos, end_pos - start_pos
+
+    def get_scan_at(self, offset, length):
+        """
+        Reads a scan by its location (see get_scan_location).
+
+        :return: scan dict as returned by get_scan
+        """
+        if self.is_mzML():
+            scan = self.reader.get_by_offset_range(offset, offset + length)
+        elif not self.is_mgf() and not self.is_ms2():
+            raise PeakListParseError("unsupported peak list file type for: %s" % ntpath.basename(self.peak_list_file_name))
+        elif offset == -1:  # empty scan
+            scan = BatchedScanReader.empty_spectrum()
+        else:
+            reader_class = py_mgf.Reader if self.is_mgf() else py_msn.Reader
+            with open(self.peak_list_path, 'rb') as f:
+                f.seek(offset)
+                raw_scan = f.read(length)
+            scan = {
+                'peaks': reader_class.parse_peak_list(raw_scan) if self.peak_encoder is None
+                else parse_peak_arrays(raw_scan),
+                'precursor': reader_class.parse_precursor(raw_scan)
+            }
+
+        return self.convert_scan(scan)
+
+    def get_scan_data(self, peak_list, precursor):
+        """
+        :param peak_list: newline-joined peak list or tuple of (mz, intensity) arrays
+        :param precursor: precursor info dict
+        :return: scan dict with text peaks or, with a peak_encoder, the binary peak_blob
+        """
+        if self.peak_encoder is None:
+            return {
+                'peaks': peak_list,
+                'peak_blob': None,
+                'precursor': precursor
+            }
+
+        if isinstance(peak_list, basestring):     # empty scans
+            peak_list = parse_peak_arrays(peak_list)
+
+        return {
+            'peaks': None,
+            'peak_blob': self.peak_encoder.encode(*peak_list),
             'precursor': precursor
         }
 
-        return scan
+    def get_scans(self, spec_ids, parse_ids=True):
+        """
+        Batch version of get_scan. The scans are read in file order, which turns random seeks
+        into a forward pass over the peak list file.
+
+        :param spec_ids: iterable of spectrum ids
+        :param parse_ids: resolve spec_ids through parse_scan_id, False if they are scan ids
+        :return: generator of (spec_id, scan_id, scan) tuples in file order, scan as returned
+            by get_scan
+        """
+        if self.reader is None:
+            raise PeakListParseError("unsupported peak list file type for: %s" % ntpath.basename(self.peak_list_file_name))
+
+        spec_ids_by_scan_id = {}
+        for spec_id in set(spec_ids):
+            scan_id = self.parse_scan_id(spec_id) if parse_ids else spec_id
+            spec_ids_by_scan_id.setdefault(scan_id, []).append(spec_id)
+
+        if self.is_mzML():
+            # pymzml has no batch access - just read the spectra in file order
+            offsets = self.reader.info['offsets']
+            sorted_scan_ids = sorted(spec_ids_by_scan_id, key=lambda s: offsets.get(s, -1))
+            scans = ((scan_id, self.get_scan(scan_id)) for scan_id in sorted_scan_ids)
+        else:
+            scans = (
+                (scan_id, self.get_scan_data(scan['peaks'], scan['precursor']))
+                for scan_id, scan in self.reader.get_by_ids(spec_ids_by_scan_id.keys())
+            )
+
+        try:
+            for scan_id, scan in scans:
+                for spec_id in spec_ids_by_scan_id[scan_id]:
+                    yield spec_id, scan_id, scan
+        except KeyError as e:
+            raise ScanNotFoundException("%s - for file: %s" % (e.args[0], ntpath.basename(self.peak_list_path)))
 
 
     def parse_scan_id(self, spec_id):
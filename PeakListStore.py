@@ -0,0 +1,97 @@
+import os
+import shutil
+import hashlib
+from PeakListParser import PeakListParser
+
+
+class PeakListStoreException(Exception):
+    pass
+
+
+class PeakListStore:
+    """
+    Content-addressed store for peak list files.
+
+    Files are stored as <store_dir>/<hash[:2]>/<hash> (sha1 of the file content), so the same
+    peak list uploaded twice is only stored once. Spectra ingested in lazy peaks mode only
+    reference their scan by (peak_file_hash, peak_offset, peak_length, peak_file_format), the
+    peaks are read from the store with get_scan when they are needed.
+    """
+
+    hash_block_size = 1048576
+
+    def __init__(self, store_dir, peak_encoder=None):
+        """
+        :param store_dir: root dir of the store
+        :param peak_encoder: PeakEncoding.PeakEncoder to return the peaks of resolved scans as
+            binary peak_blob instead of text
+        """
+        self.store_dir = store_dir
+        self.peak_encoder = peak_encoder
+        # peak_file_hash, peak_file_format -> PeakListParser without offset index
+        self.peak_list_readers = {}
+
+    def get_path(self, peak_file_hash):
+        return os.path.join(self.store_dir, peak_file_hash[:2], peak_file_hash)
+
+    @classmethod
+    def hash_file(cls, file_path):
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(cls.hash_block_size), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def add(self, file_path):
+        """
+        Adds a peak list file to the store, if it isn't stored already. The file is hashed
+        first and only copied if the hash isn't in the store, so re-uploads aren't written.
+
+        :param file_path: path to the peak list file
+        :return: peak_file_hash
+        """
+        tmp_path = None
+        try:
+            peak_file_hash = self.hash_file(file_path)
+            stored_path = self.get_path(peak_file_hash)
+            if os.path.isfile(stored_path):
+                return peak_file_hash
+
+            if not os.path.isdir(os.path.dirname(stored_path)):
+                os.makedirs(os.path.dirname(stored_path))
+            # copy to a tmp file next to the stored path, the rename makes it appear at once
+            tmp_path = '%s.%s.tmp' % (stored_path, os.getpid())
+            shutil.copyfile(file_path, tmp_path)
+            os.rename(tmp_path, stored_path)
+        except (IOError, OSError) as e:
+            if tmp_path is not None and os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            raise PeakListStoreException("Error storing peak list file {0}: {1}".format(
+                os.path.basename(file_path), e))
+
+        return peak_file_hash
+
+    def get_peak_list_reader(self, peak_file_hash, peak_file_format):
+        key = (peak_file_hash, peak_file_format)
+        if key not in self.peak_list_readers:
+            stored_path = self.get_path(peak_file_hash)
+            if not os.path.isfile(stored_path):
+                raise PeakListStoreException("peak list file not in store: %s" % peak_file_hash)
+            # the spectrum id format is only needed for parsing scan ids, the offset index
+            # isn't needed for reading a scan at its stored location
+            self.peak_list_readers[key] = PeakListParser(stored_path, peak_file_format, None,
+                                                         self.peak_encoder, build_index=False)
+        return self.peak_list_readers[key]
+
+    def get_scan(self, peak_file_hash, peak_offset, peak_length, peak_file_format):
+        """
+        Resolves a lazily stored spectrum.
+
+        :param peak_file_hash: spectra.peak_file_hash
+        :param peak_offset: spectra.peak_offset
+        :param peak_length: spectra.peak_length
+        :param peak_file_format: spectra.peak_file_format (FileFormat accession)
+        :return: scan dict as returned by PeakListParser.get_scan
+        """
+        reader = self.get_peak_list_reader(peak_file_hash, peak_file_format)
+        return reader.get_scan_at(peak_offset, peak_length)
@@ -1,5 +1,7 @@
 import psycopg2
 import json
+import io
+import numbers
 
 
 class DBException(Exception):
@@ -17,6 +19,14 @@ def connect(dbname):
     return con
 
 
+def finish_ingest(cur, con):
+    try:
+        con.commit()
+    except psycopg2.Error as e:
+        raise DBException(e.message)
+    return True
+
+
 def create_tables(cur, con):
     # don't create tables here
     # use file postgreSQL_schema.sql to init db
@@ -26,6 +36,150 @@ def create_tables(cur, con):
     return True
 
 
+def binary(data):
+    if data is None:
+        return None
+    return psycopg2.Binary(data)
+
+
+# COPY text format escapes - backslash first
+copy_escapes = [
+    (u'\\', u'\\\\'),
+    (u'\t', u'\\t'),
+    (u'\n', u'\\n'),
+    (u'\r', u'\\r'),
+]
+copy_null = u'\\N'
+
+
+def copy_escape(text):
+    for char, escaped in copy_escapes:
+        if char in text:
+            text = text.replace(char, escaped)
+    return text
+
+
+def copy_text(value, column_type=None):
+    """
+    Text representation of a value for COPY, before escaping.
+
+    :param value: python value as it would be passed to executemany (not None)
+    :param column_type: 'json' or 'bytea' for columns that need a specific format
+    :return: unicode
+    """
+    if column_type == 'bytea':
+        # bytea hex format
+        return u'\\x' + bytes(value).encode('hex').decode('ascii')
+    if column_type == 'json':
+        if not isinstance(value, basestring):
+            value = json.dumps(value)
+    elif isinstance(value, bool):
+        return u't' if value else u'f'
+    elif isinstance(value, float):
+        return repr(value).decode('ascii')
+    elif isinstance(value, numbers.Number):
+        return unicode(value)
+    elif isinstance(value, (list, tuple)):
+        # array literal - elements are quoted
+        return u'{%s}' % u','.join(
+            [u'NULL' if v is None else
+             u'"%s"' % copy_text(v).replace(u'\\', u'\\\\').replace(u'"', u'\\"')
+             for v in value])
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    return unicode(value)
+
+
+def copy_value(value, column_type=None):
+    """
+    Formats a value as a field of COPY ... FROM STDIN in text format.
+    """
+    if value is None:
+        return copy_null
+    return copy_escape(copy_text(value, column_type))
+
+
+def copy_rows(table, columns, inj_list, cur, column_types=None):
+    """
+    Bulk loads rows with COPY ... FROM STDIN (text format) from an in-memory buffer, instead
+    of one INSERT round trip per row with executemany.
+
+    :param table: table name
+    :param columns: column names in row order
+    :param inj_list: rows
+    :param cur: cursor
+    :param column_types: dict column name -> 'json' or 'bytea'
+    :raises DBException: for byte string values that aren't valid UTF-8 (the db encoding)
+    """
+    if len(inj_list) == 0:
+        return
+    if column_types is None:
+        column_types = {}
+    types = [column_types.get(col) for col in columns]
+    buf = io.BytesIO()
+    for row in inj_list:
+        try:
+            line = u'\t'.join([copy_value(v, t) for v, t in zip(row, types)]) + u'\n'
+        except UnicodeDecodeError as e:
+            # not a psycopg2.Error, the write_* functions only convert those
+            raise DBException("invalid UTF-8 text in %s row: %s" % (table, e))
+        buf.write(line.encode('utf-8'))
+    buf.seek(0)
+    cur.copy_expert("COPY %s (%s) FROM STDIN" % (table, ", ".join(columns)), buf)
+
+
+def create_indexes(cur, con):
+    # the tables are shared by all uploads, so their indexes can't be deferred to the end of an
+    # upload: the secondary indexes for the viewer query (read_me.sql) lead with upload_id and
+    # are created with the schema (postgreSQL_schema.sql), the inserts always maintain them
+    return True
+
+
+def create_psm_view(upload_id, cur, con):
+    """
+    Fills psm_view - the result of the viewer query (read_me.sql) - with the rows of the upload
+    at the end of the ingest.
+    """
+    try:
+        cur.execute("DELETE FROM psm_view WHERE upload_id = %s", [upload_id])
+        cur.execute("""
+        INSERT INTO psm_view (
+            id, upload_id, sid, pep1, pep2, linkpos1, linkpos2, charge, fragtolerance,
+            pass_threshold, rank, ions, scores, modmass1, crosslinker_modmass, is_decoy1,
+            is_decoy2, protein1, protein2, file, scan_id, peaklist_id
+        )
+        WITH ev AS (
+            SELECT peptide_ref, string_agg(DISTINCT protein_accession, ',') AS protein,
+                string_agg(DISTINCT is_decoy::text, ',') AS decoy
+            FROM peptide_evidences WHERE upload_id = %(upload_id)s GROUP BY peptide_ref
+        )
+        SELECT si.id, si.upload_id, si.spectrum_id,
+        pep1.seq_mods, pep2.seq_mods, pep1.link_site, pep2.link_site,
+        si.charge_state,
+        sp.frag_tol,
+        si.pass_threshold, si.rank, si.ions, si.scores, pep1.crosslinker_modmass,
+        pep2.crosslinker_modmass,
+        pep1_ev.decoy,
+        pep2_ev.decoy,
+        pep1_ev.protein,
+        pep2_ev.protein,
+        sp.peak_list_file_name,
+        sp.scan_id,
+        si.spectrum_id
+        FROM spectrum_identifications AS si
+        LEFT JOIN spectra AS sp ON (sp.upload_id = si.upload_id AND si.spectrum_id = sp.id)
+        LEFT JOIN peptides AS pep1 ON (pep1.upload_id = si.upload_id AND si.pep1_id = pep1.id)
+        LEFT JOIN ev AS pep1_ev ON (si.pep1_id = pep1_ev.peptide_ref)
+        LEFT JOIN peptides AS pep2 ON (pep2.upload_id = si.upload_id AND si.pep2_id = pep2.id)
+        LEFT JOIN ev AS pep2_ev ON (si.pep2_id = pep2_ev.peptide_ref)
+        WHERE si.upload_id = %(upload_id)s""", {'upload_id': upload_id})
+        con.commit()
+
+    except psycopg2.Error as e:
+        raise DBException(e.message)
+    return True
+
+
 def new_upload(inj_list, cur, con):
     try:
         cur.execute("""
@@ -130,6 +284,15 @@ def write_error(upload_id, error_type, error, cur, con):
         cur.execute("DELETE FROM spectrum_identifications WHERE upload_id = " + str(upload_id) + ";")
         con.commit()
 
+        cur.execute("DELETE FROM psm_view WHERE upload_id = " + str(upload_id) + ";")
+        con.commit()
+
+        cur.execute("DELETE FROM score_names WHERE upload_id = " + str(upload_id) + ";")
+        con.commit()
+
+        cur.execute("DELETE FROM scores WHERE upload_id = " + str(upload_id) + ";")
+        con.commit()
+
     except psycopg2.Error as e:
         raise DBException(e.message)
     return True
@@ -140,16 +303,14 @@ def write_error(upload_id, error_type, error, cur, con):
 
 def write_db_sequences(inj_list, cur, con):
     try:
-        cur.executemany("""
-        INSERT INTO db_sequences (
-            id,
-            accession,
-            protein_name,
-            description,
-            sequence,
-            upload_id
-        )
-        VALUES (%s, %s, %s, %s, %s, %s) """, inj_list)
+        copy_rows('db_sequences', [
+            'id',
+            'accession',
+            'protein_name',
+            'description',
+            'sequence',
+            'upload_id',
+        ], inj_list, cur)
         #     con.commit()
         #
     except psycopg2.Error as e:
@@ -164,16 +325,14 @@ def write_meta_data(*args):
 
 def write_peptides(inj_list, cur, con):
     try:
-        cur.executemany("""
-        INSERT INTO peptides (
-            id,
-            seq_mods,
-            link_site,
-            crosslinker_modmass,
-            upload_id,
-            crosslinker_pair_id
-        )
-        VALUES (%s, %s, %s, %s, %s, %s)""", inj_list)
+        copy_rows('peptides', [
+            'id',
+            'seq_mods',
+            'link_site',
+            'crosslinker_modmass',
+            'upload_id',
+            'crosslinker_pair_id',
+        ], inj_list, cur)
         con.commit()
 
     except psycopg2.Error as e:
@@ -184,16 +343,14 @@ def write_peptides(inj_list, cur, con):
 
 def write_modifications(inj_list, cur, con):
     try:
-        cur.executemany("""
-          INSERT INTO modifications (
-            id,
-            upload_id,
-            mod_name,
-            mass,
-            residues,
-            accession
-          )
-          VALUES (%s, %s, %s, %s, %s, %s)""", inj_list)
+        copy_rows('modifications', [
+            'id',
+            'upload_id',
+            'mod_name',
+            'mass',
+            'residues',
+            'accession',
+        ], inj_list, cur)
         con.commit()
     except psycopg2.Error as e:
         raise DBException(e.message)
@@ -203,16 +360,14 @@ def write_modifications(inj_list, cur, con):
 
 def write_peptide_evidences(inj_list, cur, con):
     try:
-        cur.executemany("""
-        INSERT INTO peptide_evidences (
-            peptide_ref,
-            dbsequence_ref,
-            protein_accession,
-            pep_start,
-            is_decoy,
-            upload_id
-        )
-        VALUES (%s, %s, %s, %s, %s, %s)""", inj_list)
+        copy_rows('peptide_evidences', [
+            'peptide_ref',
+            'dbsequence_ref',
+            'protein_accession',
+            'pep_start',
+            'is_decoy',
+            'upload_id',
+        ], inj_list, cur)
         con.commit()
 
     except psycopg2.Error as e:
@@ -223,19 +378,22 @@ def write_peptide_evidences(inj_list, cur, con):
 
 def write_spectra(inj_list, cur, con):
     try:
-        cur.executemany("""
-        INSERT INTO spectra (
-        id, 
-        peak_list, 
-        peak_list_file_name, 
-        scan_id, 
-        frag_tol, 
-        upload_id, 
-        spectrum_ref,
-        precursor_mz,
-        precursor_charge
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)""", inj_list)
+        copy_rows('spectra', [
+            'id',
+            'peak_list',
+            'peak_list_file_name',
+            'scan_id',
+            'frag_tol',
+            'upload_id',
+            'spectrum_ref',
+            'precursor_mz',
+            'precursor_charge',
+            'peak_blob',
+            'peak_file_hash',
+            'peak_offset',
+            'peak_length',
+            'peak_file_format',
+        ], inj_list, cur, column_types={'peak_blob': 'bytea'})
         con.commit()
 
     except psycopg2.Error as e:
@@ -246,24 +404,54 @@ def write_spectra(inj_list, cur, con):
 
 def write_spectrum_identifications(inj_list, cur, con):
     try:
-        cur.executemany("""
-          INSERT INTO spectrum_identifications (
-              id,
-              upload_id,
-              spectrum_id,
-              pep1_id,
-              pep2_id,
-              charge_state,
-              rank,
-              pass_threshold,
-              ions,
-              scores,
-              exp_mz,
-              calc_mz,
-              meta1,
-              meta2,
-              meta3
-          ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s , %s, %s, %s, %s, %s, %s, %s)""", inj_list)
+        copy_rows('spectrum_identifications', [
+            'id',
+            'upload_id',
+            'spectrum_id',
+            'pep1_id',
+            'pep2_id',
+            'charge_state',
+            'rank',
+            'pass_threshold',
+            'ions',
+            'scores',
+            'exp_mz',
+            'calc_mz',
+            'meta1',
+            'meta2',
+            'meta3',
+        ], inj_list, cur, column_types={'scores': 'json'})
+        con.commit()
+
+    except psycopg2.Error as e:
+        raise DBException(e.message)
+
+    return True
+
+
+def write_score_names(inj_list, cur, con):
+    try:
+        copy_rows('score_names', [
+            'id',
+            'upload_id',
+            'name',
+        ], inj_list, cur)
+        con.commit()
+
+    except psycopg2.Error as e:
+        raise DBException(e.message)
+
+    return True
+
+
+def write_scores(inj_list, cur, con):
+    try:
+        copy_rows('scores', [
+            'identification_id',
+            'upload_id',
+            'score_name_id',
+            'value',
+        ], inj_list, cur)
         con.commit()
 
     except psycopg2.Error as e:
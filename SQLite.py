@@ -1,20 +1,144 @@
 import sqlite3
 import json
+from collections import OrderedDict
 
 
 class DBException(Exception):
     pass
 
 
-def connect(dbname):
+class IngestConnection(sqlite3.Connection):
+    """
+    Connection of the ingest profile (see connect and get_ingest_profile).
+
+    While loading, the journal is in WAL (or OFF) mode with synchronous=OFF and commit() only
+    commits every commit_interval calls - with commit_interval None everything is written in a
+    single transaction. finish() (see finish_ingest) ends a successful load: the last
+    transaction is committed with synchronous=FULL and the journal mode is set back to DELETE,
+    which checkpoints the WAL into the db file. close() without finish() rolls back the
+    uncommitted rows, so a failed parse doesn't leave a partial upload (with commit_interval,
+    the rows of earlier intervals are already committed). Used as a context manager, the
+    connection is finished on success and rolled back on an exception.
+
+    With journal_mode OFF there is no rollback (SQLite leaves ROLLBACK undefined without a
+    journal): rollback() keeps the rows and close() without finish() commits them. Errors of
+    the rollback on close/__exit__ are ignored, so they don't replace the original error.
+    """
+
+    def setup_ingest(self, journal_mode='WAL', commit_interval=None):
+        self.journal_mode = journal_mode.upper()
+        self.commit_interval = commit_interval
+        self.pending_commits = 0
+        self.finished = False
+        self.execute("PRAGMA journal_mode=%s" % journal_mode)
+        self.execute("PRAGMA synchronous=OFF")
+        # the transactions are managed here - sqlite3 would commit before DDL statements
+        # (create_indexes, create_psm_view)
+        self.isolation_level = None
+        self.execute("BEGIN")
+
+    def commit(self):
+        self.pending_commits += 1
+        if self.commit_interval and self.pending_commits >= self.commit_interval:
+            self.execute("COMMIT")
+            self.execute("BEGIN")
+            self.pending_commits = 0
+
+    def rollback(self):
+        if not self.finished and self.journal_mode != 'OFF':
+            self.end_transaction("ROLLBACK")
+            self.execute("BEGIN")
+            self.pending_commits = 0
+
+    def end_transaction(self, statement):
+        """
+        Ends the current transaction with statement (COMMIT or ROLLBACK), if there is one - SQLite
+        rolls back by itself on some errors (e.g. SQLITE_FULL). Errors are ignored.
+
+        :return: True if the statement was executed
+        """
+        # python 2.7 has no in_transaction, the error of ending no transaction is ignored there
+        if not getattr(self, 'in_transaction', True):
+            return False
+        try:
+            self.execute(statement)
+        except sqlite3.Error:
+            return False
+        return True
+
+    def finish(self):
+        if not self.finished:
+            self.execute("COMMIT")
+            self.execute("PRAGMA synchronous=FULL")
+            self.execute("PRAGMA journal_mode=DELETE")
+            self.finished = True
+
+    def close(self):
+        if not self.finished:
+            self.end_transaction("COMMIT" if self.journal_mode == 'OFF' else "ROLLBACK")
+            try:
+                self.execute("PRAGMA journal_mode=DELETE")
+            except sqlite3.Error:
+                pass
+        sqlite3.Connection.close(self)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish()
+        else:
+            try:
+                self.rollback()
+            except sqlite3.Error:
+                pass
+        return False
+
+
+def get_ingest_profile(journal_mode='WAL', commit_interval=None):
+    """
+    Fast ingest profile for connect() - meant for the parsers, that finish their connection at
+    the end of parse() (finish_ingest).
+
+    :param journal_mode: journal mode while loading, 'WAL' or 'OFF' (no rollback - an
+        interrupted parse leaves a corrupt DB)
+    :param commit_interval: commit every commit_interval commit() calls, None: one transaction
+        per parse
+    :return: ingest profile dict for connect()
+    """
+    if journal_mode.upper() not in ('WAL', 'OFF'):
+        raise DBException("Unsupported ingest journal mode: %s" % journal_mode)
+    return {'journal_mode': journal_mode.upper(), 'commit_interval': commit_interval}
+
+
+def connect(dbname, ingest_profile=None):
+    """
+    :param ingest_profile: ingest profile (get_ingest_profile), returns an IngestConnection
+    """
     try:
-        con = sqlite3.connect(dbname)
+        if ingest_profile is None:
+            con = sqlite3.connect(dbname)
+        else:
+            con = sqlite3.connect(dbname, factory=IngestConnection)
+            con.setup_ingest(**ingest_profile)
     except sqlite3.Error as e:
         raise DBException(e.message)
 
     return con
 
 
+def finish_ingest(cur, con):
+    """
+    Commits the parsed upload, durably for the ingest profile (IngestConnection.finish).
+    """
+    try:
+        if isinstance(con, IngestConnection):
+            con.finish()
+        else:
+            con.commit()
+    except sqlite3.Error as e:
+        raise DBException(e.message)
+    return True
+
+
 def create_tables(cur, con):
     try:
         # cur.execute("DROP TABLE IF EXISTS uploads")
@@ -38,6 +162,9 @@ def create_tables(cur, con):
         #     "upload_errors JSON)"
         # )
 
+        # built from the other tables at the end of the ingest (create_psm_view)
+        cur.execute("DROP TABLE IF EXISTS psm_view")
+
         cur.execute("DROP TABLE IF EXISTS meta_data")
         cur.execute(
             "CREATE TABLE meta_data("
@@ -102,7 +229,13 @@ def create_tables(cur, con):
             "frag_tol TEXT,"
             "spectrum_ref TEXT,"
             "precursor_mz FLOAT,"
-            "precursor_charge INT)"
+            "precursor_charge INT,"
+            "peak_blob BLOB,"      # binary peaks (PeakEncoding), alternative to peak_list text
+            # lazy peaks (PeakListStore), location of the scan instead of the peaks
+            "peak_file_hash TEXT,"
+            "peak_offset INT,"
+            "peak_length INT,"
+            "peak_file_format TEXT)"
         )
 
         cur.execute("DROP TABLE IF EXISTS spectrum_identifications")
@@ -124,6 +257,59 @@ def create_tables(cur, con):
             "meta2 TEXT,"           
             "meta3 TEXT)"
         )
+
+        # columnar scores (optional, see the score_table parser option)
+        cur.execute("DROP TABLE IF EXISTS score_names")
+        cur.execute(
+            "CREATE TABLE score_names("
+            "id INT, "
+            "upload_id INT,"
+            "name TEXT)"
+        )
+
+        cur.execute("DROP TABLE IF EXISTS scores")
+        cur.execute(
+            "CREATE TABLE scores("
+            "identification_id INT, "
+            "upload_id INT,"
+            "score_name_id INT,"
+            "value FLOAT)"
+        )
+        con.commit()
+
+    except sqlite3.Error as e:
+        raise DBException(e.message)
+    return True
+
+
+# secondary indexes for the viewer query (read_me.sql) and fill_in_missing_scores,
+# built after the bulk load by create_indexes: (name, table, columns)
+indexes = [
+    ('spectra_id_idx', 'spectra', 'id'),
+    ('peptides_id_idx', 'peptides', 'id'),
+    ('peptide_evidences_peptide_ref_idx', 'peptide_evidences',
+     'peptide_ref, protein_accession, is_decoy'),
+    ('spectrum_identifications_id_idx', 'spectrum_identifications', 'id'),
+    # score threshold range queries: WHERE score_name_id = ? AND value >= ?
+    ('scores_score_name_id_value_idx', 'scores', 'score_name_id, value, identification_id'),
+]
+
+
+def create_indexes(cur, con):
+    try:
+        for name, table, columns in indexes:
+            cur.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (name, table, columns))
+        con.commit()
+
+    except sqlite3.Error as e:
+        raise DBException(e.message)
+    return True
+
+
+def drop_indexes(cur, con):
+    try:
+        for name, table, columns in indexes:
+            cur.execute("DROP INDEX IF EXISTS %s" % name)
         con.commit()
 
     except sqlite3.Error as e:
@@ -131,6 +317,57 @@ def create_tables(cur, con):
     return True
 
 
+# denormalized read_me.sql: one row per spectrum identification, the peptide evidences are
+# only aggregated once
+psm_view_query = """
+    WITH ev AS (
+        SELECT peptide_ref, group_concat(DISTINCT protein_accession) AS protein,
+            group_concat(DISTINCT is_decoy) AS decoy
+        FROM peptide_evidences GROUP BY peptide_ref
+    )
+    SELECT si.id, si.spectrum_id AS sid,
+    pep1.seq_mods AS pep1, pep2.seq_mods AS pep2, pep1.link_site AS linkpos1, pep2.link_site AS linkpos2,
+    si.charge_state AS charge,
+    sp.frag_tol AS fragTolerance,
+    si.pass_threshold, si.rank, si.ions, si.scores, pep1.crosslinker_modmass AS modmass1,
+    pep2.crosslinker_modmass AS crosslinker_modmass,
+    pep1_ev.decoy AS is_decoy1,
+    pep2_ev.decoy AS is_decoy2,
+    pep1_ev.protein AS protein1,
+    pep2_ev.protein AS protein2,
+    sp.peak_list_file_name AS file,
+    sp.scan_id AS scan_id,
+    si.spectrum_id AS peakList_id
+    FROM spectrum_identifications AS si
+    LEFT JOIN spectra AS sp ON (si.spectrum_id = sp.id)
+    LEFT JOIN peptides AS pep1 ON (si.pep1_id = pep1.id)
+    LEFT JOIN ev AS pep1_ev ON (si.pep1_id = pep1_ev.peptide_ref)
+    LEFT JOIN peptides AS pep2 ON (si.pep2_id = pep2.id)
+    LEFT JOIN ev AS pep2_ev ON (si.pep2_id = pep2_ev.peptide_ref)"""
+
+
+def create_psm_view(upload_id, cur, con):
+    """
+    Builds the psm_view table - the result of the viewer query (read_me.sql) - at the end of
+    the ingest.
+    """
+    try:
+        cur.execute("DROP TABLE IF EXISTS psm_view")
+        cur.execute("CREATE TABLE psm_view AS " + psm_view_query)
+        cur.execute("CREATE INDEX psm_view_id_idx ON psm_view (id)")
+        con.commit()
+
+    except sqlite3.Error as e:
+        raise DBException(e.message)
+    return True
+
+
+def binary(data):
+    if data is None:
+        return None
+    return sqlite3.Binary(data)
+
+
 def new_upload(*args):
     return True
 
@@ -240,6 +477,8 @@ def write_peptide_evidences(inj_list, cur, con):
 
 
 def write_spectra(inj_list, cur, con):
+    # peak_blob has to be passed as buffer to be stored as BLOB
+    inj_list = (row[:9] + [binary(row[9])] + row[10:] for row in inj_list)
     try:
         cur.executemany("""
           INSERT INTO spectra (
@@ -251,9 +490,14 @@ def write_spectra(inj_list, cur, con):
               'upload_id', 
               'spectrum_ref',
               'precursor_mz',
-              'precursor_charge'
+              'precursor_charge',
+              'peak_blob',
+              'peak_file_hash',
+              'peak_offset',
+              'peak_length',
+              'peak_file_format'
           )
-          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", inj_list)
+          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", inj_list)
         con.commit()
 
     except sqlite3.Error as e:
@@ -290,44 +534,63 @@ def write_spectrum_identifications(inj_list, cur, con):
     return True
 
 
-# con = connect('/home/lars/Xi/xiSPEC_ms_parser/dbs/saved/Tmuris_exosomes1.db')
-# cur = con.cursor()
+def write_score_names(inj_list, cur, con):
+    try:
+        cur.executemany("""
+          INSERT INTO score_names (
+              'id',
+              'upload_id',
+              'name'
+          ) VALUES (?, ?, ?)""", inj_list)
+        con.commit()
 
+    except sqlite3.Error as e:
+        raise DBException(e.message)
+
+    return True
 
-def fill_in_missing_scores(cur, con):
+
+def write_scores(inj_list, cur, con):
     try:
-        cur.execute("""
-          SELECT DISTINCT scoresJSON.key as scoreKey
-          FROM spectrum_identifications, json_each(spectrum_identifications.scores) AS scoresJSON""")
+        cur.executemany("""
+          INSERT INTO scores (
+              'identification_id',
+              'upload_id',
+              'score_name_id',
+              'value'
+          ) VALUES (?, ?, ?, ?)""", inj_list)
+        con.commit()
 
-        all_scores = cur.fetchall()
-        all_scores = set([str(x[0]) for x in all_scores])
+    except sqlite3.Error as e:
+        raise DBException(e.message)
+
+    return True
 
-        inj_list = []
 
-        cur.execute('SELECT id, scores FROM spectrum_identifications')
-        res = cur.fetchall()
+# con = connect('/home/lars/Xi/xiSPEC_ms_parser/dbs/saved/Tmuris_exosomes1.db')
+# cur = con.cursor()
 
-        for row in res:
-            row_scores = json.loads(row[1])
-            missing = all_scores - set(row_scores.keys())
 
-            if len(missing) > 0:
-                missing_dict = {key: -1 for key in missing}
-                row_scores.update(missing_dict)
-                inj_list.append([json.dumps(row_scores), row[0]])
-                # cur.execute('UPDATE identifications SET allScores=? WHERE id = row[0]', json.dumps(row_scores))
+def fill_in_missing_scores(score_names, identification_ids, cur, con):
+    """
+    Adds the scores missing from the scores JSON of spectrum identifications with value -1.
 
+    :param score_names: names of the missing scores
+    :param identification_ids: ids of the spectrum_identifications missing these scores
+    """
+    # merged as a JSON object - score names can't be escaped in JSON paths
+    missing_scores = json.dumps(OrderedDict((score_name, -1) for score_name in score_names))
+    try:
         cur.executemany("""
             UPDATE spectrum_identifications
-            SET `scores` = ?
-            WHERE `id` = ?""", inj_list)
+            SET `scores` = json_patch(`scores`, ?)
+            WHERE `id` = ?""", ([missing_scores, identification_id]
+                                for identification_id in identification_ids))
 
         con.commit()
 
     except sqlite3.Error as e:
         raise DBException(e.message)
-    pass
 
 
 
@@ -0,0 +1,164 @@
+import os
+import json
+import struct
+import hashlib
+import numpy as np
+
+
+class SpectrumIndexCache:
+    """
+    Persistent byte offset index for peak list files.
+
+    The index of a peak list file is stored as a binary file with a fixed size header
+    (magic, peak list file size, mtime, head/tail hash, full file hash, shape, json meta data
+    length) followed by an int64 offset array that is memory-mapped on load, and optional json
+    meta data (e.g. the nativeID -> offset mapping of mzML files).
+
+    Without cache_dir the index is written next to the peak list file (<file>.idx) and is
+    validated by size, mtime and head/tail hash. With a cache_dir the index file is named after
+    the size and head/tail hash of the peak list file so re-uploads of the same file (with a
+    different path and mtime) find the index: if the mtime differs, the sha1 of the whole file
+    (written with the index) is compared. Readers can also pass a check_entry function to
+    spot-check some index entries against the file.
+    """
+
+    magic = b'XSPIDX02'
+    header_format = '<8sQd24s24sQQQ'
+    header_size = struct.calcsize(header_format)
+    hash_block_size = 65536
+    file_hash_block_size = 1048576
+    check_count = 5     # number of index entries checked by check_entries
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: shared directory for the index files, None to store them next to
+            the peak list files
+        """
+        self.cache_dir = cache_dir
+
+    def fingerprint(self, file_path):
+        """
+        :return: (file size, mtime, sha1 of the first and last 64kB of the file)
+        """
+        stat = os.stat(file_path)
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            sha1.update(f.read(self.hash_block_size))
+            if stat.st_size > self.hash_block_size:
+                f.seek(max(self.hash_block_size, stat.st_size - self.hash_block_size))
+                sha1.update(f.read(self.hash_block_size))
+        return stat.st_size, stat.st_mtime, sha1.digest()
+
+    def hash_file(self, file_path):
+        """
+        :return: sha1 of the whole file
+        """
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(self.file_hash_block_size), b''):
+                sha1.update(block)
+        return sha1.digest()
+
+    def check_entries(self, file_path, entries, check_entry):
+        """
+        Spot-checks index entries: check_entry is called for the first, the last and some evenly
+        spaced entries.
+
+        :param entries: sequence of index entries (e.g. rows of the offset array)
+        :param check_entry: function(file object, entry) -> bool
+        :return: True if all checked entries match the file
+        """
+        if len(entries) == 0:
+            return True
+        positions = sorted(set(
+            int(round(position)) for position in np.linspace(0, len(entries) - 1, self.check_count)
+        ))
+        with open(file_path, 'rb') as f:
+            return all(check_entry(f, entries[position]) for position in positions)
+
+    def get_index_path(self, file_path, fingerprint):
+        if self.cache_dir is None:
+            return file_path + '.idx'
+        size, _, digest = fingerprint
+        return os.path.join(self.cache_dir, '%s_%s.idx' % (digest.encode('hex'), size))
+
+    def load(self, file_path, check_entry=None):
+        """
+        :param file_path: path to the peak list file
+        :param check_entry: function(file object, row of the offset array) -> bool that checks
+            an index entry against the file (e.g. that a scan starts at the offset), see
+            check_entries
+        :return: tuple (memory-mapped offset array, meta data dict) or None if there is no
+            valid index for the file
+        """
+        try:
+            fingerprint = self.fingerprint(file_path)
+            index_path = self.get_index_path(file_path, fingerprint)
+            if not os.path.isfile(index_path):
+                return None
+
+            with open(index_path, 'rb') as f:
+                header = f.read(self.header_size)
+                if len(header) != self.header_size:
+                    return None
+                magic, size, mtime, digest, file_digest, rows, cols, meta_length = \
+                    struct.unpack(self.header_format, header)
+
+                if magic != self.magic or size != fingerprint[0] or \
+                        digest[:20] != fingerprint[2]:
+                    return None
+                # the file was modified (in the middle) or, in the shared cache dir, it is a copy
+                # of the indexed file - copies don't keep the mtime
+                if mtime != fingerprint[1]:
+                    if self.cache_dir is None or file_digest[:20] != self.hash_file(file_path):
+                        return None
+
+                f.seek(self.header_size + rows * cols * 8)
+                meta = json.loads(f.read(meta_length)) if meta_length > 0 else {}
+
+            if rows == 0:
+                offsets = np.zeros((0, cols), dtype='<i8')
+            else:
+                offsets = np.memmap(index_path, dtype='<i8', mode='r',
+                                    offset=self.header_size, shape=(rows, cols))
+
+            if check_entry is not None and not self.check_entries(file_path, offsets, check_entry):
+                return None
+            return offsets, meta
+
+        except (IOError, OSError, ValueError, struct.error):
+            return None
+
+    def save(self, file_path, offsets, meta=None):
+        """
+        Writes the index for file_path. Failing to write (e.g. read-only dir) is not an error,
+        the index is just rebuilt next time. With a cache_dir the whole file is hashed.
+
+        :param file_path: path to the peak list file
+        :param offsets: 2D array-like of int offsets
+        :param meta: json serializable dict
+        :return: True if the index was written
+        """
+        try:
+            offsets = np.asarray(offsets, dtype='<i8')
+            if offsets.ndim == 1:
+                offsets = offsets.reshape((-1, 1))
+            meta_data = json.dumps(meta) if meta else b''
+
+            fingerprint = self.fingerprint(file_path)
+            index_path = self.get_index_path(file_path, fingerprint)
+            size, mtime, digest = fingerprint
+            file_digest = self.hash_file(file_path) if self.cache_dir is not None else b''
+            tmp_path = '%s.%s.tmp' % (index_path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(struct.pack(self.header_format, self.magic, size, mtime, digest,
+                                    file_digest, offsets.shape[0], offsets.shape[1],
+                                    len(meta_data)))
+                f.write(offsets.tobytes())
+                f.write(meta_data)
+            os.rename(tmp_path, index_path)
+            return True
+
+        # TypeError/ValueError: offsets that can't be stored, e.g. None for empty files
+        except (IOError, OSError, TypeError, ValueError):
+            return False
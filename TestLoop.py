@@ -15,7 +15,13 @@ import PostgreSQL as db
 
 class TestLoop:
 
-    def __init__(self):
+    def __init__(self, stream_sequence_collection=False, processes=1):
+        """
+        :param stream_sequence_collection: passed to MzIdParser
+        :param processes: passed to MzIdParser
+        """
+        self.stream_sequence_collection = stream_sequence_collection
+        self.processes = processes
         # count parsed id files
         self.mzId_count = 0
         # logging
@@ -84,7 +90,9 @@ class TestLoop:
             raise e
         ftp.quit()
 
-        mzid_parser = MzIdParser(path, self.temp_dir, self.temp_dir, db, self.logger, 0, origin=ymp)
+        mzid_parser = MzIdParser(path, self.temp_dir, self.temp_dir, db, self.logger, 0, origin=ymp,
+                                 stream_sequence_collection=self.stream_sequence_collection,
+                                 processes=self.processes)
 
         # init parser
         try:
@@ -0,0 +1,217 @@
+import os
+import re
+import bisect
+import hashlib
+import cPickle as pickle
+import numpy as np
+
+
+class UnimodTable:
+    """
+    Compiled Unimod modification table.
+
+    The unimod.obo file is only line-parsed once: the table (accession -> mass, accession ->
+    name and the accessions sorted by mass for mass range lookups) is pickled to a cache file
+    keyed on the sha1 of the obo file and loaded from there afterwards. Tables are also shared
+    within the process (e.g. by the parsers of a TestLoop run), see get_table.
+
+    The cache file is written next to the obo file (<obo file>.cache) unless a cache_path is
+    given. Hashing the obo file costs about as much as parsing it, so the hash is only checked
+    if the size or mtime of the obo file changed.
+    """
+
+    version = 1
+    hash_block_size = 1048576
+
+    # (obo path, size, mtime, cache path) -> UnimodTable
+    tables = {}
+
+    def __init__(self, masses, names, mass_order=None):
+        """
+        :param masses: accession -> delta mono mass dict
+        :param names: accession -> name dict
+        :param mass_order: tuple (sorted masses, accessions) of the mass-indexed lookup,
+            default: built from masses
+        """
+        self.masses = masses
+        self.names = names
+        if mass_order is None:
+            mass_order = sorted(masses.items(), key=lambda m: (m[1], m[0]))
+            mass_order = ([mass for _, mass in mass_order],
+                          [accession for accession, _ in mass_order])
+        # mass-indexed lookup: accessions sorted by mass
+        self.sorted_masses, self.sorted_accessions = mass_order
+        self.mass_array = np.asarray(self.sorted_masses, dtype=np.float64)
+
+    @classmethod
+    def get_table(cls, obo_path, cache_path=None):
+        """
+        Returns the table of obo_path: from the process-wide tables, the cache file or by
+        parsing the obo file (and writing the cache file).
+
+        :param obo_path: path to unimod.obo
+        :param cache_path: path of the cache file, default: <obo_path>.cache
+        :return: UnimodTable
+        """
+        stat = os.stat(obo_path)
+        key = (os.path.abspath(obo_path), stat.st_size, stat.st_mtime, cache_path)
+        if key not in cls.tables:
+            cls.tables[key] = cls.load(obo_path, cache_path)
+        return cls.tables[key]
+
+    @classmethod
+    def hash_file(cls, file_path):
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(cls.hash_block_size), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    @classmethod
+    def load(cls, obo_path, cache_path=None):
+        if cache_path is None:
+            cache_path = obo_path + '.cache'
+        stat = os.stat(obo_path)
+        obo_hash = None
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['version'] == cls.version:
+                if (cached['obo_size'], cached['obo_mtime']) == (stat.st_size, stat.st_mtime):
+                    return cls(cached['masses'], cached['names'], cached['mass_order'])
+
+                obo_hash = cls.hash_file(obo_path)
+                if cached['obo_hash'] == obo_hash:
+                    table = cls(cached['masses'], cached['names'], cached['mass_order'])
+                    table.save(cache_path, obo_hash, stat)
+                    return table
+
+        except (IOError, OSError, EOFError, KeyError, TypeError, ValueError,
+                pickle.UnpicklingError):
+            pass
+
+        table = cls.parse_obo(obo_path)
+        table.save(cache_path, obo_hash or cls.hash_file(obo_path), stat)
+        return table
+
+    def save(self, cache_path, obo_hash, obo_stat):
+        """
+        Writes the cache file. Failing to write (e.g. read-only dir) is not an error, the obo
+        file is just parsed again next time.
+
+        :return: True if the cache file was written
+        """
+        try:
+            tmp_path = '%s.%s.tmp' % (cache_path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({
+                    'version': self.version,
+                    'obo_hash': obo_hash,
+                    'obo_size': obo_stat.st_size,
+                    'obo_mtime': obo_stat.st_mtime,
+                    'masses': self.masses,
+                    'names': self.names,
+                    'mass_order': (self.sorted_masses, self.sorted_accessions),
+                }, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, cache_path)
+            return True
+        except (IOError, OSError):
+            return False
+
+    @classmethod
+    def parse_obo(cls, obo_path):
+        masses = {}
+        names = {}
+        mod_id = -1
+
+        with open(obo_path) as f:
+            for line in f:
+                if line.startswith('id: '):
+                    mod_id = ''.join(line.replace('id: ', '').split())
+
+                elif line.startswith('name: ') and not mod_id == -1:
+                    names[mod_id] = line.replace('name: ', '').strip()
+
+                elif line.startswith('xref: delta_mono_mass ') and not mod_id == -1:
+                    mass = float(line.replace('xref: delta_mono_mass ', '').replace('"', ''))
+                    masses[mod_id] = mass
+
+        return cls(masses, names)
+
+    def get_accessions_in_mass_range(self, min_mass, max_mass):
+        """
+        :return: list of the accessions with min_mass <= delta mono mass <= max_mass, sorted
+            by mass
+        """
+        start = bisect.bisect_left(self.sorted_masses, min_mass)
+        end = bisect.bisect_right(self.sorted_masses, max_mass)
+        return self.sorted_accessions[start:end]
+
+    def find_by_masses(self, masses, tolerance, tolerance_unit='Da'):
+        """
+        Batch mass lookup: all masses are looked up in one searchsorted call on the sorted
+        masses.
+
+        :param masses: sequence of delta mono masses
+        :param tolerance: mass tolerance
+        :param tolerance_unit: 'Da' or 'ppm' (relative to the looked up mass)
+        :return: list with a list of candidate accessions per mass, sorted by mass error
+        """
+        masses = np.asarray(masses, dtype=np.float64)
+        if tolerance_unit.lower() == 'ppm':
+            tolerances = np.abs(masses) * tolerance * 1e-6
+        elif tolerance_unit.lower() == 'da':
+            tolerances = np.full(len(masses), tolerance, dtype=np.float64)
+        else:
+            raise ValueError('unknown mass tolerance unit: %s' % tolerance_unit)
+
+        starts = np.searchsorted(self.mass_array, masses - tolerances, side='left')
+        ends = np.searchsorted(self.mass_array, masses + tolerances, side='right')
+
+        candidates = []
+        for mass, start, end in zip(masses.tolist(), starts.tolist(), ends.tolist()):
+            errors = np.abs(self.mass_array[start:end] - mass)
+            candidates.append([self.sorted_accessions[start + i]
+                               for i in np.argsort(errors, kind='mergesort').tolist()])
+        return candidates
+
+    @staticmethod
+    def get_mod_mass(mod):
+        """
+        :param mod: modification string, e.g. '+15.99', '(-18.01)' or '[42.0106]'
+        :return: mass delta of mod or None if mod is not a mass (e.g. 'ox')
+        """
+        match = re.match(r'^[\(\[]?([+-]?\d+(?:\.\d*)?|[+-]?\.\d+)[\)\]]?$', mod.strip())
+        if match is None:
+            return None
+        return float(match.group(1))
+
+    def resolve_unknown_mods(self, mods, tolerance=0.01, tolerance_unit='Da'):
+        """
+        Looks up Unimod candidates for the modifications that are given as mass deltas.
+
+        :param mods: list of unknown modification strings
+        :param tolerance: mass tolerance
+        :param tolerance_unit: 'Da' or 'ppm'
+        :return: list of dicts per mod: name (the mod string), mass (None if mod isn't a
+            mass delta) and candidates (list of dicts with accession, name, mass - sorted by
+            mass error)
+        """
+        mod_masses = [self.get_mod_mass(mod) for mod in mods]
+        mass_mods = [i for i, mass in enumerate(mod_masses) if mass is not None]
+        candidates = self.find_by_masses([mod_masses[i] for i in mass_mods], tolerance,
+                                         tolerance_unit)
+        mod_candidates = dict(zip(mass_mods, candidates))
+
+        resolved = []
+        for i, mod in enumerate(mods):
+            resolved.append({
+                'name': mod,
+                'mass': mod_masses[i],
+                'candidates': [{
+                    'accession': accession,
+                    'name': self.names.get(accession, ''),
+                    'mass': self.masses[accession]
+                } for accession in mod_candidates.get(i, [])]
+            })
+        return resolved
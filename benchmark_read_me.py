@@ -0,0 +1,72 @@
+"""
+Benchmark of the viewer query (read_me.sql) on an SQLite output db, without and with the
+secondary indexes of SQLite.create_indexes, and of reading the same rows from the psm_view
+table (SQLite.create_psm_view). Works on a copy of the db.
+
+usage: python benchmark_read_me.py <db file> [repeats]
+"""
+import sys
+import os
+import shutil
+import tempfile
+from time import time
+import SQLite
+
+
+first_page_size = 100
+
+
+def time_query(cur, query, repeats):
+    times = []
+    for _ in range(repeats):
+        start_time = time()
+        rows = cur.execute(query).fetchall()
+        times.append(time() - start_time)
+    return len(rows), min(times)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    db_path = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'read_me.sql')) as f:
+        query = f.read()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        bench_db = os.path.join(temp_dir, os.path.basename(db_path))
+        shutil.copyfile(db_path, bench_db)
+        con = SQLite.connect(bench_db)
+        cur = con.cursor()
+
+        SQLite.drop_indexes(cur, con)
+        row_count, before = time_query(cur, query, repeats)
+        print('without indexes: %s rows in %.3f sec' % (row_count, before))
+
+        start_time = time()
+        SQLite.create_indexes(cur, con)
+        print('create indexes: %.3f sec' % (time() - start_time))
+
+        row_count, after = time_query(cur, query, repeats)
+        print('with indexes: %s rows in %.3f sec' % (row_count, after))
+
+        row_count, first_page = time_query(
+            cur, 'SELECT * FROM (%s) ORDER BY id LIMIT %s' % (query, first_page_size), repeats)
+        print('first page: %s rows in %.3f sec' % (row_count, first_page))
+
+        start_time = time()
+        SQLite.create_psm_view(None, cur, con)
+        print('create psm_view: %.3f sec' % (time() - start_time))
+
+        row_count, view = time_query(cur, 'SELECT * FROM psm_view', repeats)
+        print('psm_view: %s rows in %.3f sec' % (row_count, view))
+
+        row_count, view_first_page = time_query(
+            cur, 'SELECT * FROM psm_view ORDER BY id LIMIT %s' % first_page_size, repeats)
+        print('psm_view first page: %s rows in %.3f sec' % (row_count, view_first_page))
+        con.close()
+    finally:
+        shutil.rmtree(temp_dir)
@@ -40,13 +40,39 @@ class AbstractCsvParser:
         'calcmz': -1
     }
 
-    def __init__(self, csv_path, temp_dir, peak_list_dir, db, logger, db_name='', user_id=0):
+    # columns read as str in streaming mode (meta columns are also read as str)
+    text_cols = [
+        'pepseq1',
+        'pepseq2',
+        'protein1',
+        'protein2',
+        'peppos1',
+        'peppos2',
+        'decoy1',
+        'decoy2',
+        'peaklistfilename',
+        'fragmenttolerance',
+        'iontypes',
+    ]
+
+    def __init__(self, csv_path, temp_dir, peak_list_dir, db, logger, db_name='', user_id=0,
+                 peak_encoder=None, peak_list_store=None, chunk_size=None, score_table=False,
+                 ingest_profile=None):
         """
 
         :param csv_path: path to csv file
         :param temp_dir: absolute path to temp dir for unzipping/storing files
         :param db: database python module to use (xiUI_pg or xiSPEC_sqlite)
         :param logger: logger to use
+        :param peak_encoder: PeakEncoding.PeakEncoder to store peaks as binary peak_blob
+            instead of peak_list text
+        :param peak_list_store: PeakListStore.PeakListStore for lazy peaks (spectra only get
+            the location of their scan in the stored peak list file)
+        :param chunk_size: streaming mode - read, validate and write the csv in chunks of
+            chunk_size rows instead of loading the whole file
+        :param score_table: also write the scores to the scores table (one row per
+            identification and score, with ids from the score_names table)
+        :param ingest_profile: SQLite ingest profile for connect (SQLite.get_ingest_profile)
         """
 
         self.csv_path = csv_path
@@ -61,6 +87,9 @@ class AbstractCsvParser:
             self.peak_list_dir += '/'
 
         self.user_id = user_id
+        self.peak_encoder = peak_encoder
+        self.peak_list_store = peak_list_store
+        self.peak_file_hashes = {}  # peak list store hashes indexed by peak list file name
 
         self.db = db
         self.logger = logger
@@ -80,7 +109,10 @@ class AbstractCsvParser:
 
         # connect to DB
         try:
-            self.con = db.connect(db_name)
+            if ingest_profile is None:
+                self.con = db.connect(db_name)
+            else:
+                self.con = db.connect(db_name, ingest_profile)
             self.cur = self.con.cursor()
 
         except db.DBException as e:
@@ -88,43 +120,93 @@ class AbstractCsvParser:
             print(e)
             sys.exit(1)
 
+        self.chunk_size = chunk_size
+
+        self.score_table = score_table
+        self.score_name_ids = {}    # score name -> score_names id
+
         self.logger.info('reading csv - start')
         self.start_time = time()
         # schema: https://raw.githubusercontent.com/HUPO-PSI/mzIdentML/master/schema/mzIdentML1.2.0.xsd
-        self.csv_reader = pd.read_csv(self.csv_path)
+        if self.chunk_size:
+            # streaming mode: only read the header here, rows are read in get_csv_chunks
+            csv_reader = pd.read_csv(self.csv_path, nrows=0)
+        else:
+            csv_reader = pd.read_csv(self.csv_path)
 
         # check for duplicate columns
-        col_list = self.csv_reader.columns.tolist()
+        col_list = csv_reader.columns.tolist()
         duplicate_cols = set([x for x in col_list if col_list.count(x) > 1])
         if len(duplicate_cols) > 0:
             raise CsvParseException("duplicate column(s): %s" % '; '.join(duplicate_cols))
 
-        self.csv_reader.columns = [x.lower().replace(" ", "") for x in self.csv_reader.columns]
-        self.meta_columns = [col for col in self.csv_reader.columns if col.startswith('meta')][:3]
+        self.meta_columns = [col for col in self.normalise_column_names(col_list)
+                             if col.startswith('meta')][:3]
+        self.csv_reader = self.prepare_csv_chunk(csv_reader)
+
+        # self.csv_reader.fillna('Null', inplace=True)
+
+    @staticmethod
+    def normalise_column_names(column_names):
+        return [x.lower().replace(" ", "") for x in column_names]
+
+    def prepare_csv_chunk(self, csv_chunk):
+        """
+        Normalises the column names, removes unused columns and fills in default values.
+
+        :param csv_chunk: pandas DataFrame of csv rows
+        :return: prepared DataFrame
+        """
+        csv_chunk.columns = self.normalise_column_names(csv_chunk.columns)
 
         # remove unused columns
-        for col in self.csv_reader.columns:
+        for col in csv_chunk.columns:
             if col not in self.required_cols + self.optional_cols + self.meta_columns:
                 try:
-                    del self.csv_reader[col]
+                    del csv_chunk[col]
                 except KeyError:
                     pass
 
-
-
         # check required cols
         # for required_col in self.required_cols:
-        #     if required_col not in self.csv_reader.columns:
+        #     if required_col not in csv_chunk.columns:
         #         raise CsvParseException("Required csv column %s missing" % required_col)
 
         # create missing non-required cols and fill with NaN (will then be fill with default values)
         for optional_col in self.optional_cols:
-            if optional_col not in self.csv_reader.columns:
-                self.csv_reader[optional_col] = np.nan
+            if optional_col not in csv_chunk.columns:
+                csv_chunk[optional_col] = np.nan
 
-        self.csv_reader.fillna(value=self.default_values, inplace=True)
+        csv_chunk.fillna(value=self.default_values, inplace=True)
+        return csv_chunk
 
-        # self.csv_reader.fillna('Null', inplace=True)
+    def get_csv_chunks(self, columns=None):
+        """
+        Generator over the csv rows. Without chunk_size this yields the csv read in __init__,
+        in streaming mode the used columns are read in chunks of chunk_size rows (the index
+        continues across chunks).
+
+        :param columns: only read these (normalised) columns, default: all used columns
+        :return: generator of prepared DataFrames
+        """
+        if not self.chunk_size:
+            yield self.csv_reader
+            return
+
+        if columns is None:
+            columns = self.required_cols + self.optional_cols + self.meta_columns
+        header = pd.read_csv(self.csv_path, nrows=0).columns.tolist()
+        use_cols = []
+        dtypes = {}
+        for col, normalised_col in zip(header, self.normalise_column_names(header)):
+            if normalised_col in columns:
+                use_cols.append(col)
+                if normalised_col in self.text_cols or normalised_col in self.meta_columns:
+                    dtypes[col] = str
+
+        for csv_chunk in pd.read_csv(self.csv_path, usecols=use_cols, dtype=dtypes,
+                                     chunksize=self.chunk_size):
+            yield self.prepare_csv_chunk(csv_chunk)
 
     def check_required_columns(self):
         for required_col in self.required_cols:
@@ -140,12 +222,66 @@ class AbstractCsvParser:
         return missing_cols
 
 
-    # ToDo: not used atm - can be used for checking if all files are present in temp dir
+    @staticmethod
+    def apply_unique(column, func):
+        """
+        Vectorized [func(v) for v in column]: func is only called once per unique value, csv
+        columns mostly repeat a few values (e.g. FragmentTolerance, IonTypes, Decoy).
+
+        :param column: pandas Series
+        :param func: function of a single value
+        :return: numpy object array of the results, one per row
+        """
+        codes, uniques = pd.factorize(column)
+        results = np.empty(len(uniques) + 1, dtype=object)
+        for i, value in enumerate(uniques.tolist()):
+            results[i] = func(value)
+        # missing values have code -1
+        if (codes == -1).any():
+            results[-1] = func(np.nan)
+        return results[codes]
+
+    @classmethod
+    def convert_column(cls, column, convert):
+        """
+        Type conversion of a column with the python semantics of convert(value).
+
+        :param column: pandas Series
+        :param convert: int or float
+        :return: tuple (list of converted values - None for invalid values,
+            numpy bool array of invalid rows)
+        """
+        kind = column.dtype.kind
+        if (convert is int and kind in 'iu') or (convert is float and kind in 'iuf'):
+            values = column.values.astype(np.int64 if convert is int else np.float64)
+            return values.tolist(), np.zeros(len(column), dtype=bool)
+
+        invalid = object()
+
+        def try_convert(value):
+            try:
+                return convert(value)
+            except ValueError:
+                return invalid
+
+        values = cls.apply_unique(column, try_convert)
+        invalid_rows = values == invalid
+        values[invalid_rows] = None
+        return values.tolist(), invalid_rows
+
     def get_peak_list_file_names(self):
         """
         :return: list of all used peak list file names
         """
-        return self.csv_reader.peaklistfilename.unique()
+        if not self.chunk_size:
+            return self.csv_reader.peaklistfilename.unique()
+
+        peak_list_file_names = []
+        for csv_chunk in self.get_csv_chunks(columns=['peaklistfilename']):
+            for peak_list_file_name in csv_chunk.peaklistfilename.unique():
+                if peak_list_file_name not in peak_list_file_names:
+                    peak_list_file_names.append(peak_list_file_name)
+        return peak_list_file_names
 
     def get_sequenceDB_file_names(self):
         fasta_files = []
@@ -163,7 +299,7 @@ class AbstractCsvParser:
         """
 
         peak_list_readers = {}
-        for peak_list_file_name in self.csv_reader.peaklistfilename.unique():
+        for peak_list_file_name in self.get_peak_list_file_names():
 
             # ToDo: what about .ms2?
             if peak_list_file_name.lower().endswith('.mgf'):
@@ -182,7 +318,8 @@ class AbstractCsvParser:
                 peak_list_reader = PeakListParser(
                     peak_list_file_path,
                     file_format_accession,
-                    spectrum_id_format_accesion
+                    spectrum_id_format_accesion,
+                    self.peak_encoder
                 )
             except IOError:
                 # try gz version
@@ -190,7 +327,8 @@ class AbstractCsvParser:
                     peak_list_reader = PeakListParser(
                         PeakListParser.extract_gz(peak_list_file_path + '.gz'),
                         file_format_accession,
-                        spectrum_id_format_accesion
+                        spectrum_id_format_accesion,
+                        self.peak_encoder
                     )
                 except IOError:
                     # ToDo: output all missing files not just first encountered. Use get_peak_list_file_names()?
@@ -198,6 +336,10 @@ class AbstractCsvParser:
 
             peak_list_readers[peak_list_file_name] = peak_list_reader
 
+            if self.peak_list_store is not None:
+                self.peak_file_hashes[peak_list_file_name] = self.peak_list_store.add(
+                    peak_list_reader.peak_list_path)
+
         self.peak_list_readers = peak_list_readers
 
     def parse(self):
@@ -211,6 +353,10 @@ class AbstractCsvParser:
         self.upload_info() # overridden (empty function) in xiSPEC subclass
         self.parse_db_sequences() # overridden (empty function) in xiSPEC subclass
         self.main_loop()
+        if self.score_table:
+            self.write_score_names()
+        self.create_indexes()
+        self.create_psm_view()
 
         meta_col_names = [col.replace("meta_", "") for col in self.meta_columns]
         while len(meta_col_names) < 3:
@@ -218,8 +364,11 @@ class AbstractCsvParser:
         meta_data = [self.upload_id] + meta_col_names + [self.contains_crosslinks]
         self.db.write_meta_data(meta_data, self.cur, self.con)
 
+        self.db.finish_ingest(self.cur, self.con)
         self.logger.info('all done! Total time: ' + str(round(time() - start_time, 2)) + " sec")
 
+        self.con.close()
+
 
 
     # @staticmethod
@@ -238,6 +387,41 @@ class AbstractCsvParser:
     #
     #     return masses
 
+    def get_score_name_id(self, name):
+        try:
+            return self.score_name_ids[name]
+        except KeyError:
+            self.score_name_ids[name] = len(self.score_name_ids)
+            return self.score_name_ids[name]
+
+    def write_score_names(self):
+        self.db.write_score_names(
+            [[score_name_id, self.upload_id, name] for name, score_name_id
+             in sorted(self.score_name_ids.items(), key=lambda i: i[1])],
+            self.cur, self.con)
+        self.con.commit()
+
+    def create_indexes(self):
+        """
+        Builds the secondary indexes after the bulk load, so the inserts don't have to
+        maintain them. Only for the per-upload SQLite dbs, the shared PostgreSQL tables get
+        their indexes with the schema.
+        """
+        index_start_time = time()
+        self.logger.info('create indexes - start')
+        self.db.create_indexes(self.cur, self.con)
+        self.logger.info('create indexes - done. Time: ' + str(round(time() - index_start_time, 2)) + " sec")
+
+    def create_psm_view(self):
+        """
+        Builds the denormalized psm_view table (one row per spectrum identification) for the
+        viewer, once all identifications are written.
+        """
+        psm_view_start_time = time()
+        self.logger.info('create psm view - start')
+        self.db.create_psm_view(self.upload_id, self.cur, self.con)
+        self.logger.info('create psm view - done. Time: ' + str(round(time() - psm_view_start_time, 2)) + " sec")
+
     def parse_db_sequences(self):
         self.logger.info('reading fasta - start')
         self.start_time = time()
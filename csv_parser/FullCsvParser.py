@@ -4,6 +4,9 @@ from AbstractCsvParser import CsvParseException
 from time import time
 import re
 import json
+import numpy as np
+import pandas as pd
+from IdInterning import IdInterner, intern_peptide_ids, get_cross_linker_pair_ids
 
 
 class FullCsvParser(AbstractCsvParser):
@@ -40,24 +43,242 @@ class FullCsvParser(AbstractCsvParser):
     ]
 
 
+    valid_ions = [
+        'peptide',
+        'a',
+        'b',
+        'c',
+        'x',
+        'y',
+        'z',
+        ''  # split will add an empty sell if string ends with ';'
+    ]
+
+    def validate_columns(self, csv_reader):
+        """
+        Column level validity checks and type conversions of the csv rows.
+
+        Each check runs once per column (conversions once per unique value, see
+        AbstractCsvParser.apply_unique) and all invalid rows are reported at once: the
+        CsvParseException has one line per error, ordered by row.
+
+        :param csv_reader: pandas DataFrame of csv rows
+        :return: dict of column name -> list of converted values (one per row)
+        """
+        start_time = time()
+        self.logger.info('validate csv columns - start')
+
+        row_numbers = (csv_reader.index.values + 1).tolist()    # 1 based row numbers
+        raw = dict((col, csv_reader[col].tolist()) for col in csv_reader.columns)
+        columns = dict(raw)
+        errors = []     # (row index, check number, message)
+
+        def report(check, invalid_rows, message, values=None):
+            for i in np.flatnonzero(invalid_rows):
+                if values is None:
+                    errors.append((i, check, message % row_numbers[i]))
+                else:
+                    errors.append((i, check, message % (values[i], row_numbers[i])))
+
+        # rank - ToDo: more elaborate checks?
+        columns['rank'], invalid = self.convert_column(csv_reader['rank'], int)
+        report(0, invalid, 'Invalid rank: %s for row: %s', raw['rank'])
+
+        # pepSeq
+
+        # ToDo: reorder peptides by length and alphabetical?
+        # add cross-linker always to first peptide?
+        # From mzIdentML schema 1.2.0:
+        # the cross-link donor SHOULD contain the complete mass delta introduced by the cross-linking reagent,
+        # and that the cross-link acceptor reports a mass shift
+        # delta of zero. It is RECOMMENDED that the 'donor' peptide SHOULD be the longer peptide, followed by
+        # alphabetical order for equal length peptides.
+
+        invalid_char_pattern_pepseq = re.compile('([^GALMFWKQESPVICYHRNDTXa-z:0-9(.)\-]+)')
+
+        def get_invalid_chars(pepseq):
+            if pepseq == '':
+                return None
+            invalid_char_match = invalid_char_pattern_pepseq.match(pepseq)
+            if invalid_char_match:
+                return "; ".join(invalid_char_match.groups())
+            return None
+
+        # pepSeq - 1
+        report(1, (csv_reader['pepseq1'] == '').values, 'Missing PepSeq1 for row: %s')
+        invalid_chars = self.apply_unique(csv_reader['pepseq1'], get_invalid_chars)
+        report(2, pd.notnull(invalid_chars), 'Invalid character(s) found in PepSeq1: %s for row: %s',
+               invalid_chars)
+        # pepSeq - 2
+        invalid_chars = self.apply_unique(csv_reader['pepseq2'], get_invalid_chars)
+        report(3, pd.notnull(invalid_chars), 'Invalid character(s) found in PepSeq2: %s for row: %s',
+               invalid_chars)
+
+        # LinkPos
+        columns['linkpos1'], invalid1 = self.convert_column(csv_reader['linkpos1'], int)
+        report(4, invalid1, 'Invalid LinkPos1: %s for row: %s', raw['linkpos1'])
+        columns['linkpos2'], invalid2 = self.convert_column(csv_reader['linkpos2'], int)
+        report(5, invalid2, 'Invalid LinkPos2: %s for row: %s', raw['linkpos2'])
+
+        linkpos1 = np.array(columns['linkpos1'], dtype=object)
+        linkpos2 = np.array(columns['linkpos2'], dtype=object)
+        incomplete = (linkpos1 == -1) & (linkpos2 != -1) & ~invalid1 & ~invalid2
+        report(6, incomplete, 'Incomplete cross-link site information for row: %s')
+
+        # CrossLinkerModMass
+        columns['crosslinkermodmass'], invalid = self.convert_column(
+            csv_reader['crosslinkermodmass'], float)
+        report(7, invalid, 'Invalid CrossLinkerModMass: %s for row: %s', raw['crosslinkermodmass'])
+
+        # charge - invalid charge states are None
+        # ToDo: raise CsvParseException('Invalid charge state: %s for row: %s')?
+        columns['charge'], _ = self.convert_column(csv_reader['charge'], int)
+
+        # passthreshold
+        # not per unique value, factorize doesn't tell True and 1 apart
+        if csv_reader['passthreshold'].dtype.kind == 'b':
+            invalid = np.zeros(len(csv_reader), dtype=bool)
+        else:
+            invalid = np.array([not isinstance(v, bool) for v in raw['passthreshold']], dtype=bool)
+        report(8, invalid, 'Invalid passThreshold value: %s for row: %s', raw['passthreshold'])
+
+        # fragmenttolerance
+        fragment_tolerance_pattern = re.compile('^([0-9.]+) (ppm|Da)$')
+        invalid = self.apply_unique(csv_reader['fragmenttolerance'],
+                                    lambda v: fragment_tolerance_pattern.match(str(v)) is None)
+        report(9, invalid.astype(bool), 'Invalid FragmentTolerance value: %s in row: %s',
+               raw['fragmenttolerance'])
+
+        # iontypes
+        invalid = self.apply_unique(
+            csv_reader['iontypes'],
+            lambda v: any([True for ion in v.split(';') if ion not in self.valid_ions])
+        )
+        report(10, invalid.astype(bool),
+               'Unsupported IonType in: %s in row %s! Supported ions are: peptide;a;b;c;x;y;z.',
+               raw['iontypes'])
+
+        # score
+        columns['score'], invalid = self.convert_column(csv_reader['score'], float)
+        report(11, invalid, 'Invalid score: %s in row %s', raw['score'])
+
+        invalid_decoy = object()
+
+        def parse_decoys(decoys):
+            # None if decoy is not set
+            if decoys == -1:
+                return None
+            is_decoy_list = []
+            for decoy in str(decoys).split(";"):
+                if decoy.lower().strip() == 'true':
+                    is_decoy_list.append(True)
+                elif decoy.lower().strip() == 'false':
+                    is_decoy_list.append(False)
+                else:
+                    return invalid_decoy
+            return is_decoy_list
+
+        def parse_pep_pos(pep_pos):
+            # None if pepPos is not set
+            if pep_pos == -1:
+                return None
+            return [p.strip() for p in str(pep_pos).split(";")]
+
+        for n, check in ((1, 12), (2, 14)):
+            # protein
+            proteins = self.apply_unique(csv_reader['protein%s' % n],
+                                         lambda v: [p.strip() for p in v.split(";")])
+            columns['protein%s' % n] = proteins.tolist()
+
+            # decoy
+            decoys = self.apply_unique(csv_reader['decoy%s' % n], parse_decoys)
+            report(check, decoys == invalid_decoy,
+                   'Invalid value in Decoy %s: %%s in row %%s. Allowed values: True, False.' % n,
+                   raw['decoy%s' % n])
+            columns['decoy%s' % n] = decoys.tolist()
+
+            # pepPos - protein sensibility check
+            pep_pos = self.apply_unique(csv_reader['peppos%s' % n], parse_pep_pos)
+            inconsistent = np.array([p is not None and len(p) != len(q)
+                                     for p, q in zip(pep_pos, proteins)], dtype=bool)
+            if n == 1:
+                message = 'Inconsistent number of protein to pepPos values for Protein1 and PepPos1 in row %s!'
+            else:
+                message = 'Inconsistent number of protein to pepPos values for Protein2 and PepPos2! in row %s!'
+            report(check + 1, inconsistent, message)
+            columns['peppos%s' % n] = pep_pos.tolist()
+
+        # scanId - invalid scan ids are -1
+        # ToDo: raise CsvParseException('Invalid scanid: %s in row %s')?
+        columns['scanid'], invalid = self.convert_column(csv_reader['scanid'], int)
+        columns['scanid'] = [-1 if i else v for v, i in zip(columns['scanid'], invalid)]
+
+        # expMZ
+        columns['expmz'], invalid = self.convert_column(csv_reader['expmz'], float)
+        report(16, invalid, 'Invalid expMZ: %s in row %s', raw['expmz'])
+        # calcMZ
+        columns['calcmz'], invalid = self.convert_column(csv_reader['calcmz'], float)
+        report(17, invalid, 'Invalid calcMZ: %s in row %s', raw['calcmz'])
+
+        if len(errors) > 0:
+            errors.sort(key=lambda e: e[:2])
+            raise CsvParseException("\n".join([e[2] for e in errors]))
+
+        self.logger.info('validate csv columns - done. Time: '
+                         + str(round(time() - start_time, 2)) + " sec")
+        return columns
+
     def main_loop(self):
         main_loop_start_time = time()
         self.logger.info('main loop - start')
 
+        # state kept across csv chunks
+        self.proteins = set()
+        # spectrum_ids - combination of peaklistfilename and scanid is a unique identifier
+        self.spectrum_interner = IdInterner()
+        # peptide ids - pep sequence and cross_linker_pair_id is a unique identifier
+        self.peptide_interner = IdInterner()
+        self.cross_linker_pair_count = 0
+
+        for csv_chunk in self.get_csv_chunks():
+            self.parse_csv_chunk(csv_chunk)
+
+        # DBSEQUENCES
+        # if self.fasta:
+        db_sequences = []
+        for prot in self.proteins:
+            try:
+               #data = [prot] + self.fasta[prot] + [self.upload_id]
+               temp = self.fasta[prot]
+               data = [prot, temp[0], temp[1], temp[2], temp[3], self.upload_id] # surely there's a better way
+            except Exception as ke:
+               data = [prot, prot, prot, "", None, self.upload_id]
+
+            db_sequences.append(data)
+
+        self.db.write_db_sequences(db_sequences, self.cur, self.con)
+        self.con.commit()
+
+        # end main loop
+        self.logger.info('main loop - done. Time: ' + str(round(time() - main_loop_start_time, 2)) + " sec")
+
+    def parse_csv_chunk(self, csv_chunk):
+        """
+        Validates the rows of a csv chunk and writes them to the DB.
+
+        :param csv_chunk: pandas DataFrame of csv rows (see get_csv_chunks)
+        """
+        chunk_start_time = time()
+        self.logger.info('parse csv chunk - start')
+
         peptide_evidences = []
         spectrum_identifications = []
         spectra = []
         peptides = []
-        proteins = set()
-        # list of spectra that were already seen - index in list is spectrum_id
-        # combination of peaklistfilename and scanid is a unique identifier
-        seen_spectra = []
-
-        # list of peptides that were already seen - index in list is peptide_id
-        # pep sequence including cross-link site and cross-link mass is unique identifier
-        seen_peptides = []
-
-        cross_linker_pair_count = 0
+        proteins = self.proteins
+        scores_rows = []
+        if self.score_table:
+            score_name_id = self.get_score_name_id('score')
 
         # # ID VALIDITY CHECK - unique ids
         # if len(self.csv_reader['id'].unique()) < len(self.csv_reader):
@@ -65,255 +286,104 @@ class FullCsvParser(AbstractCsvParser):
         #     duplicate_ids = [str(i) for i in duplicate_ids]
         #     raise CsvParseException('Duplicate ids found: %s' % "; ".join(duplicate_ids))
 
-        for identification_id, id_item in self.csv_reader.iterrows():  # identification_id, id_item = id_df.iterrows().next()
+        columns = self.validate_columns(csv_chunk)
+
+        # spectrum_ids - combination of peaklistfilename and scanid is a unique identifier
+        spectrum_ids, new_spectra = self.spectrum_interner.intern([
+            "%s-%s" % (peak_list_file_name, scan_id) for peak_list_file_name, scan_id
+            in zip(columns['peaklistfilename'], columns['scanid'])
+        ])
+
+        # peptide ids - pep sequence and cross_linker_pair_id is a unique identifier
+        cross_linked = [pepseq2 != '' for pepseq2 in columns['pepseq2']]
+        cross_linker_pair_ids = get_cross_linker_pair_ids(cross_linked,
+                                                          self.cross_linker_pair_count)
+        self.cross_linker_pair_count += sum(cross_linked)
+        pep1_ids, new_peptides1, pep2_ids, new_peptides2 = intern_peptide_ids(
+            ["%s-%s" % k for k in zip(columns['pepseq1'], cross_linker_pair_ids)],
+            ["%s-%s" % k for k in zip(columns['pepseq2'], cross_linker_pair_ids)],
+            cross_linked,
+            self.peptide_interner
+        )
+
+        for row_index, identification_id in enumerate(csv_chunk.index.tolist()):
 
             # 1 based row number
             row_number = identification_id + 1
 
-            #
-            # VALIDITY CHECKS & TYPE CONVERSIONS - ToDo: move type checks/conversions to col level in parse()?
-            #
-            # rank - ToDo: more elaborate checks?
-            try:
-                rank = int(id_item['rank'])
-            except KeyError:
-                rank = 1    # ToDo: create default values in parse()
-            except ValueError:
-                raise CsvParseException('Invalid rank: %s for row: %s' % (id_item['rank'], row_number))
-
-            # pepSeq
-
-            # ToDo: reorder peptides by length and alphabetical?
-            # add cross-linker always to first peptide?
-            # From mzIdentML schema 1.2.0:
-            # the cross-link donor SHOULD contain the complete mass delta introduced by the cross-linking reagent,
-            # and that the cross-link acceptor reports a mass shift
-            # delta of zero. It is RECOMMENDED that the 'donor' peptide SHOULD be the longer peptide, followed by
-            # alphabetical order for equal length peptides.
-
-            invalid_char_pattern_pepseq = '([^GALMFWKQESPVICYHRNDTXa-z:0-9(.)\-]+)'
-            # pepSeq - 1
-            if id_item['pepseq1'] == '':
-                raise CsvParseException('Missing PepSeq1 for row: %s' % row_number)
-
-            invalid_char_match = re.match(invalid_char_pattern_pepseq, id_item['pepseq1'])
-            if invalid_char_match:
-                invalid_chars = "; ".join(invalid_char_match.groups())
-                raise CsvParseException(
-                    'Invalid character(s) found in PepSeq1: %s for row: %s' % (invalid_chars, row_number)
-                )
-            pepseq1 = id_item['pepseq1']
-            # pepSeq - 2
-            if id_item['pepseq2'] == '':
+            # pre-typed values from validate_columns
+            rank = columns['rank'][row_index]
+            pepseq1 = columns['pepseq1'][row_index]
+            pepseq2 = columns['pepseq2'][row_index]
+            if pepseq2 == '':
                 cross_linked_id_item = False
             else:
                 self.contains_crosslinks = True
                 cross_linked_id_item = True
-                invalid_char_match = re.match(invalid_char_pattern_pepseq, id_item['pepseq2'])
-                if invalid_char_match:
-                    invalid_chars = "; ".join(invalid_char_match.groups())
-                    raise CsvParseException(
-                        'Invalid character(s) found in PepSeq2: %s for row: %s' % (invalid_chars, row_number)
-                    )
-            pepseq2 = id_item['pepseq2']
-
-            # LinkPos
-            # LinkPos - 1
-            try:
-                linkpos1 = int(id_item['linkpos1'])
-            except ValueError:
-                raise CsvParseException('Invalid LinkPos1: %s for row: %s' % (id_item['linkpos1'], row_number))
-
-            # LinkPos - 2
-            try:
-                linkpos2 = int(id_item['linkpos2'])
-            except ValueError:
-                raise CsvParseException('Invalid LinkPos2: %s for row: %s' % (id_item['linkpos2'], row_number))
-
-            if (linkpos1 == -1 and not linkpos2 == -1) or (linkpos1 == -1 and not linkpos2 == -1):
-                raise CsvParseException('Incomplete cross-link site information for row: %s' % row_number)
-
-            # CrossLinkerModMass
-            try:
-                cross_link_mod_mass = float(id_item['crosslinkermodmass'])
-            except ValueError:
-                raise CsvParseException('Invalid CrossLinkerModMass: %s for row: %s' % (id_item['crosslinkermodmass'], row_number))
-
-            # charge
-            try:
-                charge = int(id_item['charge'])
-            except ValueError:
-                #raise CsvParseException('Invalid charge state: %s for row: %s' % (id_item['charge'], row_number))
-                #self.warnings.append("Missing charge state.")
-                charge = None
-
-
-            # passthreshold
-            if isinstance(id_item['passthreshold'], bool):
-                pass_threshold = id_item['passthreshold']
-            else:
-                raise CsvParseException('Invalid passThreshold value: %s for row: %s' % (id_item['passthreshold'], row_number))
-
-            # fragmenttolerance
-            if not re.match('^([0-9.]+) (ppm|Da)$', str(id_item['fragmenttolerance'])):
-                raise CsvParseException(
-                    'Invalid FragmentTolerance value: %s in row: %s' % (id_item['fragmenttolerance'], row_number))
-            else:
-                fragment_tolerance = id_item['fragmenttolerance']
-
-            # iontypes
-            ions = id_item['iontypes'].split(';')
-            valid_ions = [
-                'peptide',
-                'a',
-                'b',
-                'c',
-                'x',
-                'y',
-                'z',
-                '' # split will add an empty sell if string ends with ';'
-            ]
-            if any([True for ion in ions if ion not in valid_ions]):
-                raise CsvParseException(
-                    'Unsupported IonType in: %s in row %s! Supported ions are: peptide;a;b;c;x;y;z.'
-                    % (id_item['iontypes'], row_number)
-                )
-            ion_types = id_item['iontypes']
-
-            # score
-            try:
-                score = float(id_item['score'])
-            except ValueError:
-                raise CsvParseException('Invalid score: %s in row %s' % (id_item['score'], row_number))
+            linkpos1 = columns['linkpos1'][row_index]
+            linkpos2 = columns['linkpos2'][row_index]
+            cross_link_mod_mass = columns['crosslinkermodmass'][row_index]
+            charge = columns['charge'][row_index]
+            pass_threshold = columns['passthreshold'][row_index]
+            fragment_tolerance = columns['fragmenttolerance'][row_index]
+            ion_types = columns['iontypes'][row_index]
+            score = columns['score'][row_index]
 
             # protein1
-            protein_list1 = id_item['protein1'].split(";")
-            protein_list1 = [s.strip() for s in protein_list1]
+            protein_list1 = columns['protein1'][row_index]
             for p in protein_list1:
                 proteins.add(p)
 
             # decoy1 - if decoy1 is not set fill list with default value (0)
-            if id_item['decoy1'] == -1:
+            is_decoy_list1 = columns['decoy1'][row_index]
+            if is_decoy_list1 is None:
                 is_decoy_list1 = [False] * len(protein_list1)
-            else:
-                is_decoy_list1 = []
-                for decoy in str(id_item['decoy1']).split(";"):
-                    if decoy.lower().strip() == 'true':
-                        is_decoy_list1.append(True)
-                    elif decoy.lower().strip() == 'false':
-                        is_decoy_list1.append(False)
-                    else:
-                        raise CsvParseException(
-                            'Invalid value in Decoy 1: %s in row %s. Allowed values: True, False.'
-                            % (id_item['decoy1'], row_number)
-                        )
-
-            if len(is_decoy_list1) != len(protein_list1):
+            elif len(is_decoy_list1) != len(protein_list1):
                 is_decoy_list1 = [is_decoy_list1[0]] * len(protein_list1)
 
             # pepPos1 - if pepPos1 is not set fill list with default value (-1)
             # ToDo: might need changing for xiUI where pepPos is not optional
-            if id_item['peppos1'] == -1:
+            pep_pos_list1 = columns['peppos1'][row_index]
+            if pep_pos_list1 is None:
                 pep_pos_list1 = [-1] * len(protein_list1)
-            else:
-                pep_pos_list1 = str(id_item['peppos1']).split(";")
-                pep_pos_list1 = [s.strip() for s in pep_pos_list1]
-
-            # protein - decoy - pepPos sensibility check
-            if not len(protein_list1) == len(is_decoy_list1):
-                raise CsvParseException(
-                    'Inconsistent number of protein to decoy values for Protein1 and Decoy1 in row %s!' % row_number)
-            if not len(protein_list1) == len(pep_pos_list1):
-                raise CsvParseException(
-                    'Inconsistent number of protein to pepPos values for Protein1 and PepPos1 in row %s!' % row_number)
 
             # protein2
-            protein_list2 = id_item['protein2'].split(";")
-            protein_list2 = [s.strip() for s in protein_list2]
+            protein_list2 = columns['protein2'][row_index]
             for p in protein_list2:
                 proteins.add(p)
 
             # decoy2 - if decoy2 is not set fill list with default value (0)
-            if id_item['decoy2'] == -1:
+            is_decoy_list2 = columns['decoy2'][row_index]
+            if is_decoy_list2 is None:
                 is_decoy_list2 = [False] * len(protein_list2)
-            else:
-                is_decoy_list2 = []
-                for decoy in str(id_item['decoy2']).split(";"):
-                    if decoy.lower().strip() == 'true':
-                        is_decoy_list2.append(True)
-                    elif decoy.lower().strip() == 'false':
-                        is_decoy_list2.append(False)
-                    else:
-                        raise CsvParseException(
-                            'Invalid value in Decoy 2: %s in row %s. Allowed values: True, False.'
-                            % (id_item['decoy2'], row_number)
-                        )
-
-            if len(is_decoy_list2) != len(protein_list2):
+            elif len(is_decoy_list2) != len(protein_list2):
                 is_decoy_list2 = [is_decoy_list2[0]] * len(protein_list2)
 
-
             # pepPos2 - if pepPos2 is not set fill list with default value (-1)
             # ToDo: might need changing for xiUI where pepPos is not optional
-            if id_item['peppos2'] == -1:
+            pep_pos_list2 = columns['peppos2'][row_index]
+            if pep_pos_list2 is None:
                 pep_pos_list2 = [-1] * len(protein_list2)
-            else:
-                pep_pos_list2 = str(id_item['peppos2']).split(";")
-                pep_pos_list2 = [s.strip() for s in pep_pos_list2]
-
-            # protein - decoy - pepPos sensibility check
-            if not len(protein_list2) == len(is_decoy_list2):
-                raise CsvParseException(
-                    'Inconsistent number of protein to decoy values for Protein2 and Decoy2 in row %s!' % row_number)
-            if not len(protein_list2) == len(pep_pos_list2):
-                raise CsvParseException(
-                    'Inconsistent number of protein to pepPos values for Protein2 and PepPos2! in row %s!' % row_number)
-
-            # scanId
-            try:
-                scan_id = int(id_item['scanid'])
-            except ValueError:
-                #raise CsvParseException('Invalid scanid: %s in row %s' % (id_item['scanid'], row_number))
-                scan_id = -1
 
-            # peakListFilename
-
-            # expMZ
-            try:
-                exp_mz = float(id_item['expmz'])
-            except ValueError:
-                raise CsvParseException('Invalid expMZ: %s in row %s' % (id_item['exmpmz'], row_number))
-            # calcMZ
-            try:
-                calc_mz = float(id_item['calcmz'])
-            except ValueError:
-                raise CsvParseException('Invalid calcMZ: %s in row %s' % (id_item['calcmz'], row_number))
+            scan_id = columns['scanid'][row_index]
+            exp_mz = columns['expmz'][row_index]
+            calc_mz = columns['calcmz'][row_index]
 
             #
             # -----Start actual parsing------
             #
             # SPECTRA
-            peak_list_file_name = id_item['peaklistfilename']
+            peak_list_file_name = columns['peaklistfilename'][row_index]
 
-            unique_spec_identifier = "%s-%s" % (peak_list_file_name, scan_id)
+            spectrum_id = spectrum_ids[row_index]
 
-            if unique_spec_identifier not in seen_spectra:
-                seen_spectra.append(unique_spec_identifier)
-                spectrum_id = len(seen_spectra) - 1
+            if new_spectra[row_index]:
                 peak_list = None
                 precursor_mz = None
                 precursor_charge = None
-                if self.peak_list_dir:
-                    # get peak list
-                    try:
-                        peak_list_reader = self.peak_list_readers[peak_list_file_name]
-                    except KeyError:
-                        raise CsvParseException('Missing peak list file: %s' % peak_list_file_name)
-
-                    scan = peak_list_reader.get_scan(scan_id)
-                    peak_list = scan['peaks']
-                    precursor_mz = scan['precursor']['mz']
-                    precursor_charge = scan['precursor']['charge']
+                # peak list and precursor are filled in after the loop (read_peak_lists)
+                if self.peak_list_dir and peak_list_file_name not in self.peak_list_readers:
+                    raise CsvParseException('Missing peak list file: %s' % peak_list_file_name)
 
                 spectrum = [
                     spectrum_id,                    # 'id',
@@ -325,26 +395,22 @@ class FullCsvParser(AbstractCsvParser):
                     'Spec_%s' % spectrum_id,        # 'spectrum_ref'
                     precursor_mz,                   # 'precursor_mz',
                     precursor_charge,               # 'precursor_charge'
+                    None,                           # 'peak_blob'
+                    None,                           # 'peak_file_hash'
+                    None,                           # 'peak_offset'
+                    None,                           # 'peak_length'
+                    None,                           # 'peak_file_format'
                 ]
                 spectra.append(spectrum)
-            else:
-                spectrum_id = seen_spectra.index(unique_spec_identifier)
 
             #
             # PEPTIDES
-            if cross_linked_id_item:
-                cross_linker_pair_id = cross_linker_pair_count
-                cross_linker_pair_count += 1
-            else:
-                cross_linker_pair_id = -1  # linear ToDo: -1 or None?
+            cross_linker_pair_id = cross_linker_pair_ids[row_index]  # linear: -1 ToDo: -1 or None?
 
             # peptide - 1
-            unique_pep_identifier1 = "%s-%s" % (pepseq1, cross_linker_pair_id)
-
-            if unique_pep_identifier1 not in seen_peptides:
-                seen_peptides.append(unique_pep_identifier1)
-                pep1_id = len(seen_peptides) - 1
+            pep1_id = pep1_ids[row_index]
 
+            if new_peptides1[row_index]:
                 peptide1 = [
                     pep1_id,                        # id,
                     pepseq1,                        # seq_mods,
@@ -354,29 +420,20 @@ class FullCsvParser(AbstractCsvParser):
                     cross_linker_pair_id            # crosslinker_pair_id
                 ]
                 peptides.append(peptide1)
-            else:
-                pep1_id = seen_peptides.index(unique_pep_identifier1)
 
-            if cross_linked_id_item:
-                # peptide - 2
-                unique_pep_identifier2 = "%s-%s" % (pepseq2, cross_linker_pair_id)
-
-                if unique_pep_identifier2 not in seen_peptides:
-                    seen_peptides.append(unique_pep_identifier2)
-                    pep2_id = len(seen_peptides) - 1
-                    peptide2 = [
-                        pep2_id,                        # id,
-                        pepseq2,                        # seq_mods,
-                        linkpos2,                       # link_site,
-                        0,                              # crosslinker_modmass, declare peptide 2 as cl acceptor: 0 mass
-                        self.upload_id,                 # upload_id,
-                        cross_linker_pair_id            # crosslinker_pair_id
-                    ]
-                    peptides.append(peptide2)
-                else:
-                    pep2_id = seen_peptides.index(unique_pep_identifier2)
-            else:
-                pep2_id = None
+            # peptide - 2
+            pep2_id = pep2_ids[row_index]
+
+            if cross_linked_id_item and new_peptides2[row_index]:
+                peptide2 = [
+                    pep2_id,                        # id,
+                    pepseq2,                        # seq_mods,
+                    linkpos2,                       # link_site,
+                    0,                              # crosslinker_modmass, declare peptide 2 as cl acceptor: 0 mass
+                    self.upload_id,                 # upload_id,
+                    cross_linker_pair_id            # crosslinker_pair_id
+                ]
+                peptides.append(peptide2)
 
             #
             # PEPTIDE EVIDENCES
@@ -426,17 +483,19 @@ class FullCsvParser(AbstractCsvParser):
             # SPECTRUM IDENTIFICATIONS
             # ToDo: experimental_mass_to_charge, calculated_mass_to_charge
             scores = json.dumps({'score': score})
+            if self.score_table:
+                scores_rows.append([identification_id, self.upload_id, score_name_id, score])
 
             try:
-                meta1 = id_item[self.meta_columns[0]]
+                meta1 = columns[self.meta_columns[0]][row_index]
             except IndexError:
                 meta1 = ""
             try:
-                meta2 = id_item[self.meta_columns[1]]
+                meta2 = columns[self.meta_columns[1]][row_index]
             except IndexError:
                 meta2 = ""
             try:
-                meta3 = id_item[self.meta_columns[2]]
+                meta3 = columns[self.meta_columns[2]][row_index]
             except IndexError:
                 meta3 = ""
 
@@ -472,25 +531,10 @@ class FullCsvParser(AbstractCsvParser):
                 if mod not in self.unknown_mods:
                     self.unknown_mods.append(mod)
 
+        if self.peak_list_dir:
+            self.read_peak_lists(spectra)
 
-        # DBSEQUENCES
-        # if self.fasta:
-        db_sequences = []
-        for prot in proteins:
-            try:
-               #data = [prot] + self.fasta[prot] + [self.upload_id]
-               temp = self.fasta[prot]
-               data = [prot, temp[0], temp[1], temp[2], temp[3], self.upload_id] # surely there's a better way
-            except Exception as ke:
-               data = [prot, prot, prot, "", None, self.upload_id]
-
-            db_sequences.append(data)
-
-
-        # end main loop
-        self.logger.info('main loop - done. Time: ' + str(round(time() - main_loop_start_time, 2)) + " sec")
-
-        # once loop is done write data to DB
+        # write the chunk to DB
         db_wrap_up_start_time = time()
         self.logger.info('write spectra to DB - start')
         try:
@@ -499,10 +543,54 @@ class FullCsvParser(AbstractCsvParser):
             self.db.write_peptides(peptides, self.cur, self.con)
             self.db.write_spectra(spectra, self.cur, self.con)
             self.db.write_spectrum_identifications(spectrum_identifications, self.cur, self.con)
-            self.db.write_db_sequences(db_sequences, self.cur, self.con)
+            if self.score_table:
+                self.db.write_scores(scores_rows, self.cur, self.con)
             self.con.commit()
         except Exception as e:
             raise e
 
         self.logger.info('write spectra to DB - start - done. Time: '
                          + str(round(time() - db_wrap_up_start_time, 2)) + " sec")
+        self.logger.info('parse csv chunk - done. Time: '
+                         + str(round(time() - chunk_start_time, 2)) + " sec")
+
+    def read_peak_lists(self, spectra):
+        """
+        Fills in peak list and precursor info of the spectra rows. The scans are read per peak
+        list file in file order. With a peak_list_store only the location of the scans is
+        filled in.
+
+        :param spectra: spectra rows
+        """
+        start_time = time()
+        self.logger.info('read peak lists - start')
+
+        spectra_by_file = {}
+        for spectrum in spectra:
+            spectra_by_file.setdefault(spectrum[2], []).append(spectrum)
+
+        for peak_list_file_name, file_spectra in spectra_by_file.items():
+            peak_list_reader = self.peak_list_readers[peak_list_file_name]
+
+            if self.peak_list_store is not None:
+                for spectrum in file_spectra:
+                    offset, length = peak_list_reader.get_scan_location(spectrum[3])
+                    spectrum[10] = self.peak_file_hashes[peak_list_file_name]  # 'peak_file_hash'
+                    spectrum[11] = offset                                       # 'peak_offset'
+                    spectrum[12] = length                                       # 'peak_length'
+                    spectrum[13] = peak_list_reader.file_format_accession      # 'peak_file_format'
+                continue
+
+            scans = {}
+            for _, scan_id, scan in peak_list_reader.get_scans([s[3] for s in file_spectra],
+                                                               parse_ids=False):
+                scans[scan_id] = scan
+
+            for spectrum in file_spectra:
+                scan = scans[spectrum[3]]
+                spectrum[1] = scan['peaks']                 # 'peak_list',
+                spectrum[7] = scan['precursor']['mz']       # 'precursor_mz',
+                spectrum[8] = scan['precursor']['charge']   # 'precursor_charge'
+                spectrum[9] = scan['peak_blob']             # 'peak_blob'
+
+        self.logger.info('read peak lists - done. Time: ' + str(round(time() - start_time, 2)) + " sec")
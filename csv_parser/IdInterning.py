@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+
+class IdInterner:
+    """
+    Assigns ids to keys across several columns of keys (e.g. csv chunks): ids stay consistent
+    between calls, only the remembered keys are kept between calls.
+    """
+
+    def __init__(self):
+        self.ids = {}       # remembered key -> id
+        self.next_id = 0
+
+    def intern(self, keys, remember=None):
+        """
+        Assigns ids to a column of keys: every distinct key gets consecutive ids in order of
+        first appearance - the same ids as appending unseen keys to a list and using
+        list.index, without the quadratic lookups.
+
+        :param keys: sequence of string keys
+        :param remember: sequence of bools - only remember these keys for later calls,
+            default: remember all keys. Keys that can't appear again (e.g. containing a
+            cross_linker_pair_id) don't need to be remembered.
+        :return: tuple (list of ids, list of bools - True for the first appearance of a key)
+        """
+        keys = np.asarray(keys, dtype=object)
+        codes, uniques = pd.factorize(keys)
+        first_index = np.unique(codes, return_index=True)[1]
+        uniques = uniques.tolist()
+
+        # ids of the unique keys - known keys keep their id, new keys get the next ids
+        unique_ids = np.empty(len(uniques), dtype=np.int64)
+        new = np.ones(len(uniques), dtype=bool)
+        for code, key in enumerate(uniques):
+            if key in self.ids:
+                unique_ids[code] = self.ids[key]
+                new[code] = False
+        unique_ids[new] = np.arange(self.next_id, self.next_id + new.sum())
+        self.next_id += int(new.sum())
+
+        if remember is None:
+            remembered = new
+        else:
+            remembered = new & np.asarray(remember, dtype=bool)[first_index]
+        for code in np.flatnonzero(remembered).tolist():
+            self.ids[uniques[code]] = int(unique_ids[code])
+
+        first_appearance = np.zeros(len(codes), dtype=bool)
+        first_appearance[first_index[new]] = True
+        return unique_ids[codes].tolist(), first_appearance.tolist()
+
+
+def intern_ids(keys):
+    """
+    Assigns ids to a whole column of keys, see IdInterner.intern.
+
+    :param keys: sequence of string keys
+    :return: tuple (list of ids, list of bools - True for the first appearance of a key)
+    """
+    return IdInterner().intern(keys)
+
+
+def get_cross_linker_pair_ids(cross_linked, first_id=0):
+    """
+    :param cross_linked: sequence of bools - True for cross-linked identifications
+    :param first_id: cross_linker_pair_id of the first cross-linked identification
+    :return: list of cross_linker_pair_ids - consecutive for cross-linked identifications,
+        -1 for linear ones
+    """
+    cross_linked = np.asarray(cross_linked, dtype=bool)
+    return np.where(cross_linked, np.cumsum(cross_linked) - 1 + first_id, -1).tolist()
+
+
+def intern_peptide_ids(pep1_keys, pep2_keys, cross_linked, interner=None):
+    """
+    Peptide ids of the identifications: peptides are numbered in the order peptide 1,
+    peptide 2 (only for cross-linked identifications) of each identification.
+
+    :param pep1_keys: peptide 1 keys
+    :param pep2_keys: peptide 2 keys
+    :param cross_linked: sequence of bools - True for cross-linked identifications
+    :param interner: IdInterner to continue the peptide ids of previous calls - only the
+        keys of linear peptides are remembered
+    :return: tuple (pep1 ids, pep1 first appearances, pep2 ids, pep2 first appearances), pep2
+        ids are None for linear identifications
+    """
+    n = len(pep1_keys)
+    keys = np.empty(2 * n, dtype=object)
+    keys[0::2] = pep1_keys
+    keys[1::2] = pep2_keys
+    used = np.ones(2 * n, dtype=bool)
+    used[1::2] = cross_linked
+
+    ids = np.full(2 * n, -1, dtype=np.int64)
+    first_appearance = np.zeros(2 * n, dtype=bool)
+    if interner is None:
+        interner = IdInterner()
+    # cross-linked peptide keys contain their unique cross_linker_pair_id
+    linear = np.repeat(~np.asarray(cross_linked, dtype=bool), 2)
+    used_ids, used_first_appearance = interner.intern(keys[used], remember=linear[used])
+    ids[used] = used_ids
+    first_appearance[used] = used_first_appearance
+
+    pep2_ids = [pep_id if used else None
+                for pep_id, used in zip(ids[1::2].tolist(), used[1::2].tolist())]
+    return (ids[0::2].tolist(), first_appearance[0::2].tolist(),
+            pep2_ids, first_appearance[1::2].tolist())
+
+
+if __name__ == '__main__':
+    # benchmark: python IdInterning.py [n rows ...]
+    import sys
+    import random
+    from time import time
+
+    def list_ids(keys):
+        seen = []
+        ids = []
+        for key in keys:
+            if key not in seen:
+                seen.append(key)
+            ids.append(seen.index(key))
+        return ids
+
+    row_counts = [int(n) for n in sys.argv[1:]] or [10000, 100000, 1000000]
+    for n in row_counts:
+        random.seed(0)
+        # ~ 3 identifications per spectrum
+        keys = ["run_%s.mgf-%s" % (random.randint(0, 4), random.randint(0, n // 15))
+                for _ in range(n)]
+
+        start_time = time()
+        ids, _ = intern_ids(keys)
+        intern_time = time() - start_time
+
+        if n <= 10000:
+            start_time = time()
+            assert list_ids(keys) == ids
+            list_time = '%.3f sec' % (time() - start_time)
+        else:
+            list_time = 'skipped'
+
+        print('%s rows: intern_ids %.3f sec, list.index %s' % (n, intern_time, list_time))
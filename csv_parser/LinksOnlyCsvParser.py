@@ -5,6 +5,7 @@ from time import time
 import re
 import json
 import math
+from IdInterning import IdInterner, intern_peptide_ids, get_cross_linker_pair_ids
 
 
 class LinksOnlyCsvParser(AbstractCsvParser):
@@ -26,19 +27,70 @@ class LinksOnlyCsvParser(AbstractCsvParser):
         main_loop_start_time = time()
         self.logger.info('main loop LinksOnlyCsvParser - start')
 
-        peptide_evidences = []
-        spectrum_identifications = []
-        peptides = []
+        # state kept across csv chunks
+        self.proteins = set()
+        # peptide ids - peptide number (1/2) and cross_linker_pair_id is a unique identifier
+        self.peptide_interner = IdInterner()
+        self.cross_linker_pair_count = 0
+
+        for csv_chunk in self.get_csv_chunks():
+            self.parse_csv_chunk(csv_chunk)
+
+        # DBSEQUENCES
+        # if self.fasta:
+        db_sequences = []
+        for prot in self.proteins:
+            try:
+                #data = [prot] + self.fasta[prot] + [self.upload_id]
+                temp = self.fasta[prot]
+                data = [prot, temp[0], temp[1], temp[2], temp[3], self.upload_id] # surely there's a better way
+            except Exception as ke:
+                sp_regex = re.compile('(.*)\|(.*)\|(.*)')
+                matches = sp_regex.search(prot)
+                if matches is not None:
+                    data = [matches.group(), matches.group(2), matches.group(3), "", None, self.upload_id]
+                else :
+                    data = [prot, prot, prot, "", None, self.upload_id]
 
-        proteins = set()
+            db_sequences.append(data)
+
+        self.db.write_db_sequences(db_sequences, self.cur, self.con)
+        self.con.commit()
 
-        # list of peptides that were already seen - index in list is peptide_id
-        # pep sequence including cross-link site and cross-link mass is unique identifier
-        seen_peptides = []
+        # end main loop
+        self.logger.info('main loop - done. Time: ' + str(round(time() - main_loop_start_time, 2)) + " sec")
 
-        cross_linker_pair_count = 0
+    def parse_csv_chunk(self, csv_chunk):
+        """
+        Parses the rows of a csv chunk and writes them to the DB.
 
-        for identification_id, id_item in self.csv_reader.iterrows():  # identification_id, id_item = id_df.iterrows().next()
+        :param csv_chunk: pandas DataFrame of csv rows (see get_csv_chunks)
+        """
+        chunk_start_time = time()
+        self.logger.info('parse csv chunk - start')
+
+        peptide_evidences = []
+        spectrum_identifications = []
+        peptides = []
+
+        proteins = self.proteins
+        scores_rows = []
+        if self.score_table:
+            score_name_id = self.get_score_name_id('score')
+
+        # peptide ids - peptide number (1/2) and cross_linker_pair_id is a unique identifier
+        cross_linked = (csv_chunk['protein2'] != '').tolist()
+        cross_linker_pair_ids = get_cross_linker_pair_ids(cross_linked,
+                                                          self.cross_linker_pair_count)
+        self.cross_linker_pair_count += sum(cross_linked)
+        pep1_ids, new_peptides1, pep2_ids, new_peptides2 = intern_peptide_ids(
+            ["1-%s" % cross_linker_pair_id for cross_linker_pair_id in cross_linker_pair_ids],
+            ["2-%s" % cross_linker_pair_id for cross_linker_pair_id in cross_linker_pair_ids],
+            cross_linked,
+            self.peptide_interner
+        )
+
+        for row_index, (identification_id, id_item) in enumerate(csv_chunk.iterrows()):  # identification_id, id_item = id_df.iterrows().next()
 
             # 1 based row number
             row_number = identification_id + 1
@@ -132,57 +184,41 @@ class LinksOnlyCsvParser(AbstractCsvParser):
             # -----Start actual parsing------
             #
 
-            if cross_linked_id_item:
-                cross_linker_pair_id = cross_linker_pair_count
-                cross_linker_pair_count += 1
-            else:
-                cross_linker_pair_id = -1  # linear ToDo: -1 or None?
+            cross_linker_pair_id = cross_linker_pair_ids[row_index]  # linear: -1 ToDo: -1 or None?
+
+            # peptide - 1
+            pep1_id = pep1_ids[row_index]
+
+            if new_peptides1[row_index]:
+                peptide1 = [
+                    pep1_id,  # id,
+                    "",  # seq_mods,
+                    1,  # link_site,
+                    None,  # crosslinker_modmass, declare peptide 1 as cl donor: full mass
+                    self.upload_id,  # upload_id,
+                    cross_linker_pair_id  # crosslinker_pair_id
+                ]
+                peptides.append(peptide1)
+
+            # peptide - 2
+            pep2_id = pep2_ids[row_index]
+
+            if cross_linked_id_item and new_peptides2[row_index]:
+                peptide2 = [
+                    pep2_id,  # id,
+                    "",  # seq_mods,
+                    1,  # link_site,
+                    None,  # crosslinker_modmass, declare peptide 2 as cl acceptor: 0 mass
+                    self.upload_id,  # upload_id,
+                    cross_linker_pair_id  # crosslinker_pair_id
+                ]
+                peptides.append(peptide2)
 
             #
             # PEPTIDE EVIDENCES
             # peptide evidence - 1
             for i in range(len(protein_list1)):
 
-                # peptide - 1
-                unique_pep_identifier1 = "%s-%s" % (1, cross_linker_pair_id)
-
-                if unique_pep_identifier1 not in seen_peptides:
-                    seen_peptides.append(unique_pep_identifier1)
-                    pep1_id = len(seen_peptides) - 1
-
-                    peptide1 = [
-                        pep1_id,  # id,
-                        "",  # seq_mods,
-                        1,  # link_site,
-                        None,  # crosslinker_modmass, declare peptide 1 as cl donor: full mass
-                        self.upload_id,  # upload_id,
-                        cross_linker_pair_id  # crosslinker_pair_id
-                    ]
-                    peptides.append(peptide1)
-                else:
-                    pep1_id = seen_peptides.index(unique_pep_identifier1)
-
-                if cross_linked_id_item:
-                    # peptide - 2
-                    unique_pep_identifier2 = "%s-%s" % (2, cross_linker_pair_id)
-
-                    if unique_pep_identifier2 not in seen_peptides:
-                        seen_peptides.append(unique_pep_identifier2)
-                        pep2_id = len(seen_peptides) - 1
-                        peptide2 = [
-                            pep2_id,  # id,
-                            "",  # seq_mods,
-                            1,  # link_site,
-                            None,  # crosslinker_modmass, declare peptide 2 as cl acceptor: 0 mass
-                            self.upload_id,  # upload_id,
-                            cross_linker_pair_id  # crosslinker_pair_id
-                        ]
-                        peptides.append(peptide2)
-                    else:
-                        pep2_id = seen_peptides.index(unique_pep_identifier2)
-                else:
-                    pep2_id = None
-
                 m = re.search("..\|(.*)\|(.*)\s?", protein_list1[i])
                 accession = protein_list1[i]
                 if m:
@@ -227,6 +263,8 @@ class LinksOnlyCsvParser(AbstractCsvParser):
             # SPECTRUM IDENTIFICATIONS
             # ToDo: experimental_mass_to_charge, calculated_mass_to_charge
             scores = json.dumps({'score': score})
+            if self.score_table:
+                scores_rows.append([identification_id, self.upload_id, score_name_id, score])
 
             try:
                 meta1 = id_item[self.meta_columns[0]]
@@ -260,29 +298,7 @@ class LinksOnlyCsvParser(AbstractCsvParser):
             ]
             spectrum_identifications.append(spectrum_identification)
 
-        # DBSEQUENCES
-        # if self.fasta:
-        db_sequences = []
-        for prot in proteins:
-            try:
-                #data = [prot] + self.fasta[prot] + [self.upload_id]
-                temp = self.fasta[prot]
-                data = [prot, temp[0], temp[1], temp[2], temp[3], self.upload_id] # surely there's a better way
-            except Exception as ke:
-                sp_regex = re.compile('(.*)\|(.*)\|(.*)')
-                matches = sp_regex.search(prot)
-                if matches is not None:
-                    data = [matches.group(), matches.group(2), matches.group(3), "", None, self.upload_id]
-                else :
-                    data = [prot, prot, prot, "", None, self.upload_id]
-
-            db_sequences.append(data)
-
-
-        # end main loop
-        self.logger.info('main loop - done. Time: ' + str(round(time() - main_loop_start_time, 2)) + " sec")
-
-        # once loop is done write data to DB
+        # write the chunk to DB
         db_wrap_up_start_time = time()
         self.logger.info('write spectra to DB - start')
         try:
@@ -291,10 +307,13 @@ class LinksOnlyCsvParser(AbstractCsvParser):
             self.db.write_peptides(peptides, self.cur, self.con)
             # self.db.write_spectra(spectra, self.cur, self.con)
             self.db.write_spectrum_identifications(spectrum_identifications, self.cur, self.con)
-            self.db.write_db_sequences(db_sequences, self.cur, self.con)
+            if self.score_table:
+                self.db.write_scores(scores_rows, self.cur, self.con)
             self.con.commit()
         except Exception as e:
             raise e
 
         self.logger.info('write spectra to DB - start - done. Time: '
                          + str(round(time() - db_wrap_up_start_time, 2)) + " sec")
+        self.logger.info('parse csv chunk - done. Time: '
+                         + str(round(time() - chunk_start_time, 2)) + " sec")
@@ -6,6 +6,10 @@ def connect(dbname):
     pass
 
 
+def finish_ingest(cur, con):
+    pass
+
+
 def create_tables(cur, con):
     pass
 
@@ -38,5 +42,21 @@ def write_spectrum_identifications(inj_list, cur, con):
     pass
 
 
-def fill_in_missing_scores(cur, con):
+def write_score_names(inj_list, cur, con):
+    pass
+
+
+def write_scores(inj_list, cur, con):
+    pass
+
+
+def create_indexes(cur, con):
+    pass
+
+
+def create_psm_view(upload_id, cur, con):
+    pass
+
+
+def fill_in_missing_scores(score_names, identification_ids, cur, con):
     pass
@@ -13,12 +13,35 @@ import getopt
 dev = False
 use_ftp, use_postgreSQL, user_id = False, False, False
 identifications_file, peakList_file, identifier = False, False, False
+index_cache_dir = False
+binary_peaks, compress_peaks = False, False
+peak_store_dir = False
+csv_chunk_size = None
+sqlite_ingest = False
+sqlite_journal_mode = 'WAL'
+sqlite_commit_interval = None
+score_table = False
+stream_sequence = False
+processes = 1
+mod_tolerance, mod_tolerance_unit = 0.01, 'Da'
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "fi:p:s:u:", ["ftp", "postgresql"])
+    opts, args = getopt.getopt(sys.argv[1:], "fi:p:s:u:", ["ftp", "postgresql", "index-cache=",
+                                                              "binary-peaks", "compress-peaks",
+                                                              "peak-store=", "csv-chunk-size=",
+                                                              "sqlite-ingest", "sqlite-journal-mode=",
+                                                              "sqlite-commit-interval=", "score-table",
+                                                              "mod-tolerance=",
+                                                              "stream-sequence-collection",
+                                                              "processes="])
 except getopt.GetoptError:
     print('parser.py (-f) -i <identifications file> -p <peak list file> -s <session identifier>'
-          ' (-u <user_id>)')
+          ' (-u <user_id>) (--index-cache <peak list index dir>) (--binary-peaks)'
+          ' (--compress-peaks) (--peak-store <peak list store dir>)'
+          ' (--csv-chunk-size <rows>) (--sqlite-ingest) (--sqlite-journal-mode <WAL|OFF>)'
+          ' (--sqlite-commit-interval <commits>) (--score-table)'
+          ' (--mod-tolerance <tolerance, e.g. 0.01Da or 10ppm>) (--stream-sequence-collection)'
+          ' (--processes <mzid main loop worker processes>)')
     sys.exit(2)
 
 for o, a in opts:
@@ -41,14 +64,61 @@ for o, a in opts:
     if o == '-u':   # user_id
         user_id = a
 
+    if o == '--index-cache':    # shared dir for persistent peak list and mzid offset indices
+        index_cache_dir = a
+
+    if o == '--binary-peaks':   # store peaks as binary spectra.peak_blob instead of text
+        binary_peaks = True
+
+    if o == '--compress-peaks':     # zlib compress the binary peaks
+        binary_peaks = True
+        compress_peaks = True
+
+    if o == '--peak-store':     # lazy peaks: keep peak list files in this store, only store offsets
+        peak_store_dir = a
+
+    if o == '--csv-chunk-size':     # stream csv files in chunks of this many rows
+        csv_chunk_size = int(a)
+
+    if o == '--sqlite-ingest':  # fast ingest profile: WAL, synchronous=OFF, one transaction
+        sqlite_ingest = True
+
+    if o == '--sqlite-journal-mode':    # ingest profile journal mode (WAL or OFF)
+        sqlite_ingest = True
+        sqlite_journal_mode = a
+
+    if o == '--sqlite-commit-interval':     # ingest profile: only commit every n commits
+        sqlite_ingest = True
+        sqlite_commit_interval = int(a)
+
+    if o == '--score-table':    # also write the scores to the columnar scores table
+        score_table = True
+
+    if o == '--mod-tolerance':  # mass tolerance for the unimod candidates of unknown mods
+        tolerance_match = re.match(r'^\s*([0-9.]+)\s*(ppm|Da)\s*$', a, re.IGNORECASE)
+        if tolerance_match is None:
+            print('invalid --mod-tolerance: %s (e.g. 0.01Da or 10ppm)' % a)
+            sys.exit(2)
+        mod_tolerance = float(tolerance_match.group(1))
+        mod_tolerance_unit = tolerance_match.group(2)
+
+    if o == '--stream-sequence-collection':     # mzid: parse the SequenceCollection in one pass
+        stream_sequence = True
+
+    if o == '--processes':  # mzid: number of worker processes for the main loop
+        processes = int(a)
+
 if identifications_file is False or identifier is False:
     dev = True
     print ("dev test mode...")
 
+ingest_profile = None
 if use_postgreSQL:
     import PostgreSQL as db
 else:
     import SQLite as db
+    if sqlite_ingest:
+        ingest_profile = db.get_ingest_profile(sqlite_journal_mode, sqlite_commit_interval)
 
 if use_ftp:
     import ftplib
@@ -71,6 +141,22 @@ try:
     from csv_parser.NoPeakListsCsvParser import NoPeakListsCsvParser
     from csv_parser.LinksOnlyCsvParser import LinksOnlyCsvParser
     import PeakListParser
+    from SpectrumIndexCache import SpectrumIndexCache
+    from PeakEncoding import PeakEncoder
+    from PeakListStore import PeakListStore
+    from UnimodTable import UnimodTable
+
+    if index_cache_dir:
+        PeakListParser.PeakListParser.index_cache = SpectrumIndexCache(index_cache_dir)
+        MzIdParser.MzIdParser.index_cache = SpectrumIndexCache(index_cache_dir)
+
+    peak_encoder = None
+    if binary_peaks:
+        peak_encoder = PeakEncoder(compress=compress_peaks)
+
+    peak_list_store = None
+    if peak_store_dir:
+        peak_list_store = PeakListStore(peak_store_dir, peak_encoder)
 
     # logging
     logFile = dname + "/log/%s_%s.log" % (identifier, int(time()))
@@ -230,10 +316,20 @@ try:
 
         if use_postgreSQL:
             id_parser = MzIdParser.MzIdParser(identifications_file, upload_folder, peak_list_folder,
-                                              db, logger, user_id=user_id)
+                                              db, logger, user_id=user_id, peak_encoder=peak_encoder,
+                                              peak_list_store=peak_list_store,
+                                              score_table=score_table,
+                                              stream_sequence_collection=stream_sequence,
+                                              processes=processes)
         else:
             id_parser = MzIdParser.xiSPEC_MzIdParser(identifications_file, upload_folder,
-                                                     peak_list_folder, db, logger, db_name=database)
+                                                     peak_list_folder, db, logger, db_name=database,
+                                                     peak_encoder=peak_encoder,
+                                                     peak_list_store=peak_list_store,
+                                                     score_table=score_table,
+                                                     stream_sequence_collection=stream_sequence,
+                                                     processes=processes,
+                                                     ingest_profile=ingest_profile)
         id_parser.initialise_mzid_reader()
     elif identifications_fileName.endswith('.csv'):
         logger.info('parsing csv start')
@@ -241,21 +337,30 @@ try:
         if use_postgreSQL:
             if peakList_file:
                 id_parser = FullCsvParser(identifications_file, upload_folder, peak_list_folder, db,
-                                          logger, user_id=user_id)
+                                          logger, user_id=user_id, peak_encoder=peak_encoder,
+                                          peak_list_store=peak_list_store,
+                                          chunk_size=csv_chunk_size, score_table=score_table)
             else:
                 id_parser = NoPeakListsCsvParser(identifications_file, upload_folder,
-                                                 peak_list_folder, db, logger, user_id=user_id)
+                                                 peak_list_folder, db, logger, user_id=user_id,
+                                                 chunk_size=csv_chunk_size,
+                                                 score_table=score_table)
                 try:
                     id_parser.check_required_columns()
 
                 except CsvParseException as e:
                     id_parser = LinksOnlyCsvParser(identifications_file, upload_folder,
-                                                   peak_list_folder, db, logger, user_id=user_id)
+                                                   peak_list_folder, db, logger, user_id=user_id,
+                                                   chunk_size=csv_chunk_size,
+                                                   score_table=score_table)
                     id_parser.check_required_columns()
 
         else:
             id_parser = xiSPEC_CsvParser(identifications_file, upload_folder, peak_list_folder, db,
-                                         logger, db_name=database)
+                                         logger, db_name=database, peak_encoder=peak_encoder,
+                                         peak_list_store=peak_list_store,
+                                         chunk_size=csv_chunk_size, score_table=score_table,
+                                         ingest_profile=ingest_profile)
             id_parser.check_required_columns()
 
     else:
@@ -273,7 +378,9 @@ try:
     id_parser.parse()
 
     returnJSON['identifier'] = str(id_parser.upload_id) + "-" + str(id_parser.random_id)
-    returnJSON['modifications'] = id_parser.unknown_mods
+    # unimod candidates for the unknown mods given as mass deltas
+    returnJSON['modifications'] = UnimodTable.get_table(unimodPath).resolve_unknown_mods(
+        id_parser.unknown_mods, mod_tolerance, mod_tolerance_unit)
     returnJSON['warnings'] = id_parser.warnings
 
     # delete uploaded files after they have been parsed
@@ -131,6 +131,65 @@ CREATE TABLE public.protocols (
 
 ALTER TABLE public.protocols OWNER TO username;
 
+--
+-- Name: psm_view; Type: TABLE; Schema: public; Owner: username
+--
+
+CREATE TABLE public.psm_view (
+    id bigint,
+    upload_id integer,
+    sid bigint,
+    pep1 text,
+    pep2 text,
+    linkpos1 integer,
+    linkpos2 integer,
+    charge integer,
+    fragtolerance text,
+    pass_threshold boolean,
+    rank integer,
+    ions text,
+    scores json,
+    modmass1 double precision,
+    crosslinker_modmass double precision,
+    is_decoy1 text,
+    is_decoy2 text,
+    protein1 text,
+    protein2 text,
+    file text,
+    scan_id text,
+    peaklist_id bigint
+);
+
+
+ALTER TABLE public.psm_view OWNER TO username;
+
+--
+-- Name: score_names; Type: TABLE; Schema: public; Owner: username
+--
+
+CREATE TABLE public.score_names (
+    id integer,
+    upload_id integer,
+    name text
+);
+
+
+ALTER TABLE public.score_names OWNER TO username;
+
+--
+-- Name: scores; Type: TABLE; Schema: public; Owner: username
+--
+
+CREATE TABLE public.scores (
+    identification_id bigint,
+    upload_id integer,
+    score_name_id integer,
+    value double precision
+);
+
+
+ALTER TABLE public.scores OWNER TO username;
+
 --
 -- Name: spectra; Type: TABLE; Schema: public; Owner: username
 --
@@ -142,7 +201,12 @@ CREATE TABLE public.spectra (
     peak_list_file_name text,
     scan_id text,
     frag_tol text,
-    spectrum_ref text
+    spectrum_ref text,
+    peak_blob bytea,
+    peak_file_hash text,
+    peak_offset bigint,
+    peak_length bigint,
+    peak_file_format text
 );
 
 
@@ -308,6 +372,48 @@ ALTER TABLE ONLY public.uploads
     ADD CONSTRAINT uploads_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: peptide_evidences_upload_id_peptide_ref_idx; Type: INDEX; Schema: public; Owner: username
+--
+
+CREATE INDEX peptide_evidences_upload_id_peptide_ref_idx ON public.peptide_evidences USING btree (upload_id, peptide_ref);
+
+
+--
+-- Name: peptides_upload_id_id_idx; Type: INDEX; Schema: public; Owner: username
+--
+
+CREATE INDEX peptides_upload_id_id_idx ON public.peptides USING btree (upload_id, id);
+
+
+--
+-- Name: scores_upload_id_score_name_id_value_idx; Type: INDEX; Schema: public; Owner: username
+--
+
+CREATE INDEX scores_upload_id_score_name_id_value_idx ON public.scores USING btree (upload_id, score_name_id, value);
+
+
+--
+-- Name: spectra_upload_id_id_idx; Type: INDEX; Schema: public; Owner: username
+--
+
+CREATE INDEX spectra_upload_id_id_idx ON public.spectra USING btree (upload_id, id);
+
+
+--
+-- Name: spectrum_identifications_upload_id_id_idx; Type: INDEX; Schema: public; Owner: username
+--
+
+CREATE INDEX spectrum_identifications_upload_id_id_idx ON public.spectrum_identifications USING btree (upload_id, id);
+
+
+--
+-- Name: psm_view_upload_id_id_idx; Type: INDEX; Schema: public; Owner: username
+--
+
+CREATE INDEX psm_view_upload_id_id_idx ON public.psm_view USING btree (upload_id, id);
+
+
 --
 -- PostgreSQL database dump complete
 --
@@ -95,6 +95,9 @@ class Reader(object):
     :param file_object: file object or any other iterable stream, this will make
                         path obsolete, seeking is disabled
     :type file_object: File_object like
+    :param build_index: build (or load) the offset index, without it the spectra
+                        can only be read by get_by_offset_range
+    :type build_index: boolean
 
     Example:
 
@@ -113,6 +116,8 @@ class Reader(object):
         file_object=None,
         obo_version=None,
         use_spectra_sanity_check=True,
+        index_cache=None,
+        build_index=True,
     ):
         # self.param contains user-specified parsing parameters
         self.param = dict()
@@ -159,7 +164,19 @@ class Reader(object):
         )
         self.info['filename'] = path
 
-        if self.info['seekable']:
+        # LK edit - persistent index (SpectrumIndexCache)
+        self.index_cache = index_cache
+        # LK edit end
+
+        # LK edit - lazy peaks: without the index only get_by_offset_range works
+        if self.info['seekable'] and not build_index:
+            self.seeker = codecs.open(
+                self.info['filename'],
+                mode     = 'r',
+                encoding = self.info['encoding']
+            )
+        # LK edit end
+        elif self.info['seekable']:
             # Seekable files can use the index for random access
             self.seeker = self._build_index(build_index_from_scratch, use_spectra_sanity_check)
 
@@ -247,6 +264,15 @@ class Reader(object):
                   seeking to a particular offset for the file.
         """
 
+        # LK edit - persistent index (SpectrumIndexCache)
+        if self.index_cache is not None and self._load_cached_index():
+            return codecs.open(
+                self.info['filename'],
+                mode     = 'r',
+                encoding = self.info['encoding']
+            )
+        # LK edit end
+
         # Declare the pre-seeker
         seeker = open(self.info['filename'], 'rb')
         # Reading last 1024 bytes to find chromatogram Pos and SpectrumIndex Pos
@@ -340,6 +366,12 @@ class Reader(object):
                     self.info['offsetList'].append(offset)
             # opening seeker in normal mode again
         seeker.close()
+
+        # LK edit - persistent index (SpectrumIndexCache)
+        if self.index_cache is not None and self.info['seekable']:
+            self._save_cached_index()
+        # LK edit end
+
         seeker = codecs.open(
             self.info['filename'],
             mode     = 'r',
@@ -349,6 +381,46 @@ class Reader(object):
 
         return seeker
 
+    # LK edit - persistent index (SpectrumIndexCache)
+    def _load_cached_index(self):
+        """
+        Restores the index from :attr:`index_cache`.
+
+        :returns: True if a valid index was found
+        """
+        cached_index = self.index_cache.load(self.info['filename'], self._check_index_entry)
+        if cached_index is None:
+            return False
+        offset_list, meta = cached_index
+
+        # nativeID -> offset (None for missing indexList/TIC offsets)
+        self.info['offsets'] = ddict()
+        self.info['offsets'].update(
+            (native_id, offset) for native_id, offset in meta['offsets'])
+        # memory-mapped, sorted for bisect
+        self.info['offsetList'] = offset_list[:, 0]
+        self.info['spectrum_count'] = meta['spectrum_count']
+        self.info['chromatogram_count'] = meta['chromatogram_count']
+        self.info['seekable'] = True
+        return True
+
+    @staticmethod
+    def _check_index_entry(f, entry):
+        """
+        Checks a cached index entry against the file: a spectrum or chromatogram element
+        starts at the offset.
+        """
+        f.seek(int(entry[0]))
+        return f.read(1) == b'<'
+
+    def _save_cached_index(self):
+        self.index_cache.save(self.info['filename'], self.info['offsetList'], {
+            'offsets': list(self.info['offsets'].items()),
+            'spectrum_count': self.info['spectrum_count'],
+            'chromatogram_count': self.info['chromatogram_count'],
+        })
+    # LK edit end
+
     def _build_index_from_scratch(self, seeker):
         """Build an index of spectra/chromatogram data with offsets by parsing the file."""
 
@@ -625,6 +697,42 @@ class Reader(object):
         else:
             return answer
 
+    # LK edit - lazy peaks (byte range access)
+    def get_offset_range(self, value):
+        '''
+        Byte range of the spectrum with the given native ID.
+
+        :returns: tuple (start, end) of file offsets
+        '''
+        if not self.info['seekable'] or value not in self.info['offsets']:
+            raise KeyError("Run does not contain spec with native ID {0}".format(value))
+
+        startPos = self.info['offsets'][value]
+        endPos_index = bisect.bisect_right(self.info['offsetList'], startPos)
+        if endPos_index == len(self.info['offsetList']):
+            endPos = os.path.getsize(self.info['filename'])
+        else:
+            endPos = self.info['offsetList'][endPos_index]
+        return int(startPos), int(endPos)
+
+    def get_by_offset_range(self, startPos, endPos):
+        '''
+        Random access to a spectrum by its byte range (see get_offset_range).
+        '''
+        self.seeker.seek(startPos, 0)
+        data = self.seeker.read(endPos - startPos)
+        try:
+            self.spectrum.initFromTreeObject(cElementTree.fromstring(data))
+        except:
+            # have closing </mzml> & </run> &or </spectrumList>
+            startingTag = data.split()[0]
+            stopIndex = data.index('</' + startingTag[1:] + '>')
+            self.spectrum.initFromTreeObject(
+                cElementTree.fromstring(data[:stopIndex + len(startingTag) + 2])
+            )
+        return self.spectrum
+    # LK edit end
+
     def getSpectrumCount(self):
         return self.info['spectrum_count']
 
@@ -95,8 +95,10 @@ This module requires :py:mod:`lxml`.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import copy
 import warnings
 warnings.formatwarning = lambda msg, *args: str(msg) + '\n'
+from collections import OrderedDict
 from . import auxiliary as aux
 from . import xml
 
@@ -114,6 +116,48 @@ class MzIdentML(xml.IndexedXML):
         'SpectrumIdentificationProtocol'  # , 'SpectraData'             # LK edit
     }
 
+    # edit start - LRU cache of the references resolved by _retrieve_refs
+    _ref_cache_size = 10000
+
+    def __init__(self, *args, **kwargs):
+        """Create an MzIdentML parser object, see :py:class:`pyteomics.xml.IndexedXML`.
+
+        Parameters
+        ----------
+        ref_cache_size : int or None, optional
+            Maximum number of referenced elements (keyed by reference type and id)
+            that :meth:`_retrieve_refs` keeps for the lifetime of the reader.
+            :py:const:`None` means unbounded, 0 disables the cache. Default is 10000.
+        """
+        self._ref_cache_size = kwargs.pop('ref_cache_size', self._ref_cache_size)
+        self._ref_cache = OrderedDict()
+        self.ref_cache_hits = 0
+        self.ref_cache_misses = 0
+        super(MzIdentML, self).__init__(*args, **kwargs)
+
+    def _get_ref(self, ref_type, elem_id):
+        """Returns the referenced element with `retrieve_refs=True` from the
+        reference cache or by :meth:`get_by_id`. The cache keeps its own copy of
+        the elements and returns a deep copy, so changes of a returned element
+        don't show up in other entities that reference it."""
+        if self._ref_cache_size == 0:
+            self.ref_cache_misses += 1
+            return self.get_by_id(elem_id, retrieve_refs=True)
+        key = (ref_type, elem_id)
+        try:
+            by_id = self._ref_cache.pop(key)
+            self.ref_cache_hits += 1
+        except KeyError:
+            by_id = self.get_by_id(elem_id, retrieve_refs=True)
+            self.ref_cache_misses += 1
+        if by_id is None:
+            return None
+        self._ref_cache[key] = by_id
+        if self._ref_cache_size is not None and len(self._ref_cache) > self._ref_cache_size:
+            self._ref_cache.popitem(last=False)
+        return copy.deepcopy(by_id)
+    # edit end
+
     def _get_info_smart(self, element, **kwargs):
         """Extract the info in a smart way depending on the element type"""
         name = xml._local_name(element)
@@ -136,7 +180,8 @@ class MzIdentML(xml.IndexedXML):
         ends in _ref. Removes the id attribute from `info`"""
         for k, v in dict(info).items():
             if k.endswith('_ref'):
-                by_id = self.get_by_id(v, retrieve_refs=True)
+                # edit - cached by reference type (attribute name without _ref) and id
+                by_id = self._get_ref(k[:-4], v)
                 if by_id is None:
                     warnings.warn('Ignoring unresolved reference: ' + v)
                 else:
@@ -28,6 +28,8 @@ This module requres :py:mod:`lxml` and :py:mod:`numpy`.
 #   limitations under the License.
 
 import re
+import io
+import mmap
 import warnings
 warnings.formatwarning = lambda msg, *args: str(msg) + '\n'
 import socket
@@ -636,6 +638,13 @@ class ByteEncodingOrderedDict(OrderedDict):
         return super(ByteEncodingOrderedDict, self).__setitem__(key, value)
 
 
+# file objects that can be memory-mapped by ByteCountingXMLScanner
+try:
+    _mappable_file_types = (file, io.FileIO, io.BufferedReader, io.BufferedRandom)
+except NameError:
+    _mappable_file_types = (io.FileIO, io.BufferedReader, io.BufferedRandom)
+
+
 class ByteCountingXMLScanner(_file_obj):
     """
     Carry out the construction of a byte offset index for `source` XML file
@@ -748,12 +757,71 @@ class ByteCountingXMLScanner(_file_obj):
             lookup_id_key_mapping.setdefault(name, "id")
             lookup_id_key_mapping[name] = ensure_bytes_single(lookup_id_key_mapping[name])
 
+        # edit start - scan a memory map of the file with one regex instead of chunking
+        # the file into tags, falls back to the chunk scanner for other file objects
+        indices = self._build_byte_index_mmap(lookup_id_key_mapping)
+        if indices is not None:
+            return indices
+        # edit end
+
         indices = defaultdict(ByteEncodingOrderedDict)
         g = self._generate_offsets()
         for offset, offset_type, attrs in g:
             indices[offset_type][attrs[lookup_id_key_mapping[offset_type]]] = offset
         return indices
 
+    def _build_byte_index_mmap(self, lookup_id_key_mapping):
+        """
+        Builds the byte offset index by scanning a memory map of the file with one compiled
+        regex per id attribute name (usually one), which only extracts the tag type and the
+        id attribute of the indexed tags. Offsets are the same as the ones of
+        :py:meth:`_generate_offsets`: the position of the ``<`` of the opening tag.
+
+        The id is the first id attribute of the start tag itself: the match can't run past
+        the ``>`` of the start tag and skips quoted attribute values.
+        :py:meth:`_generate_offsets` takes the last ``id=`` up to the next ``<`` instead, which
+        differs if an attribute value or the text after the start tag contains ``id=``.
+
+        Returns
+        -------
+        defaultdict(ByteEncodingOrderedDict) or None
+            The index, :py:const:`None` if the file can't be memory-mapped (e.g. not a
+            regular file or an empty file).
+        """
+        f = self.file
+        # e.g. the _source of IndexedXML
+        while isinstance(f, _file_obj):
+            f = f.file
+        if not isinstance(f, _mappable_file_types):
+            return None
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, IOError, OSError, ValueError, io.UnsupportedOperation):
+            return None
+
+        tags_by_key = defaultdict(list)
+        for name in self.indexed_tags:
+            tags_by_key[lookup_id_key_mapping[name]].append(name)
+
+        indices = defaultdict(ByteEncodingOrderedDict)
+        try:
+            for key, names in tags_by_key.items():
+                # <Tag ...whitespace key="value" within the start tag - quoted attribute
+                # values may contain '>' (but not '<')
+                tags = b'|'.join(re.escape(name) for name in names)
+                pattern = re.compile(
+                    br'<(' + tags + br''')(?=\s)(?:[^<>"']|"[^"<]*"|'[^'<]*')*?\s''' +
+                    re.escape(key) + br'''\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+                for match in pattern.finditer(mm):
+                    elem_id = match.group(2)
+                    if elem_id is None:
+                        elem_id = match.group(3)
+                    # ids are bytes already, skip the encoding of ByteEncodingOrderedDict
+                    OrderedDict.__setitem__(indices[match.group(1)], elem_id, match.start())
+        finally:
+            mm.close()
+        return indices
+
     @classmethod
     def scan(cls, source, indexed_tags):
         inst = cls(source, indexed_tags)
@@ -993,6 +1061,143 @@ class IndexedXML(XML):
         data = self._get_info_smart(elem, **kwargs)
         return data
 
+    # edit start - batch retrieval of indexed elements in file order
+    _batch_block_size = 1048576
+    # larger start tags / elements aren't read by get_by_ids but retrieved by get_by_id
+    _max_start_tag_size = 65536
+    _max_element_size = 67108864
+    _start_tag_pattern = re.compile(br'''<([^\s/<>]+)(?:[^<>"']|"[^"<]*"|'[^'<]*')*?(/?)>''')
+
+    def get_by_ids(self, ids, id_key=None, tag_id=None, **kwargs):
+        """
+        Retrieve the entities with the given ids, like calling :meth:`get_by_id`
+        for each id.
+
+        The byte offsets of the ids are sorted and the elements are read in one
+        forward pass over the file. The elements of about `_batch_block_size` bytes
+        are parsed at once, so the entities are yielded in file order (and not in the
+        order of `ids`). The indexed elements must not contain elements with the same
+        tag (true for the indexed tags of mzML and mzIdentML). Elements that can't be
+        parsed from their offset are retrieved by :meth:`get_by_id` and ids that aren't
+        in the offset index are retrieved by :meth:`get_by_id` after the indexed ones.
+
+        Parameters
+        ----------
+        ids : iterable of str
+            The id values of the entities to retrieve.
+        tag_id : str, optional
+            The tag of the entities, the offset index of that tag is used.
+
+        Yields
+        ------
+        dict
+        """
+        if id_key is None:
+            id_key = self._default_id_attr
+        if tag_id is None:
+            index = self._flat_offset_index
+        else:
+            index = self._offset_index[tag_id]
+
+        offsets = []
+        unindexed = []
+        for elem_id in ids:
+            try:
+                offsets.append((index[elem_id], elem_id))
+            except KeyError:
+                unindexed.append(elem_id)
+        offsets.sort()
+
+        parser = etree.XMLParser(remove_comments=True, huge_tree=True)
+        buf = b''
+        buf_start = 0
+        i = 0
+        while i < len(offsets):
+            block = []
+            block_size = 0
+            position = self.tell()
+            try:
+                while i < len(offsets) and block_size < self._batch_block_size:
+                    offset, elem_id = offsets[i]
+                    elem_bytes, buf, buf_start = self._read_element(buf, buf_start, offset)
+                    block.append((elem_id, elem_bytes))
+                    block_size += len(elem_bytes) if elem_bytes is not None else 0
+                    i += 1
+            finally:
+                self.seek(position)
+
+            elems = self._parse_element_block(block, id_key, parser)
+            for elem_id, elem_bytes in block:
+                if elems is not None and elem_bytes is not None:
+                    yield self._get_info_smart(next(elems), **kwargs)
+                else:
+                    yield self.get_by_id(elem_id, id_key=id_key, tag_id=tag_id, **kwargs)
+
+        for elem_id in unindexed:
+            yield self.get_by_id(elem_id, id_key=id_key, tag_id=tag_id, **kwargs)
+
+    def _read_element(self, buf, buf_start, offset):
+        """
+        Reads the bytes of the element starting at `offset`. `buf` holds the bytes of
+        the file starting at `buf_start`, it is extended or replaced as needed. The
+        reading stops at EOF, if there is no start tag at `offset` within
+        `_max_start_tag_size` bytes or if the element is larger than `_max_element_size`.
+
+        Returns
+        -------
+        tuple
+            (element bytes or None if the element can't be read, buf, buf_start)
+        """
+        if not buf_start <= offset < buf_start + len(buf):
+            buf = b''
+            buf_start = offset
+        while True:
+            pos = offset - buf_start
+            start_tag = self._start_tag_pattern.match(buf, pos)
+            if start_tag is not None:
+                if start_tag.group(2):
+                    return buf[pos:start_tag.end()], buf, buf_start
+                end = buf.find(b'</' + start_tag.group(1) + b'>', start_tag.end())
+                if end != -1:
+                    end += len(start_tag.group(1)) + 3
+                    return buf[pos:end], buf, buf_start
+                if len(buf) - pos >= self._max_element_size:
+                    return None, buf, buf_start
+            elif buf[pos:pos + 1] not in (b'', b'<') or \
+                    len(buf) - pos >= self._max_start_tag_size:
+                return None, buf, buf_start
+            self.seek(buf_start + len(buf))
+            data = self._source.read(self._batch_block_size)
+            if not data:
+                return None, buf, buf_start
+            buf = buf[pos:] + data
+            buf_start = offset
+
+    @staticmethod
+    def _parse_element_block(block, id_key, parser):
+        """
+        Parses the element bytes of a block with one parser call.
+
+        Returns
+        -------
+        iterator or None
+            The elements (of the entries with bytes) or None if the block can't be
+            parsed or doesn't contain the expected elements.
+        """
+        expected_ids = [ensure_bytes_single(elem_id) for elem_id, elem_bytes in block
+                        if elem_bytes is not None]
+        try:
+            root = etree.fromstring(
+                b'<batch>' + b''.join(elem_bytes for elem_id, elem_bytes in block
+                                      if elem_bytes is not None) + b'</batch>', parser)
+        except (etree.LxmlError, PyteomicsError):
+            return None
+        elems = list(root)
+        if [ensure_bytes_single(elem.attrib.get(id_key, '')) for elem in elems] != expected_ids:
+            return None
+        return iter(elems)
+    # edit end
+
     def __getitem__(self, elem_id):
         return self.get_by_id(elem_id)
 
@@ -0,0 +1,213 @@
+"""
+Small synthetic mzIdentML, MGF and db fixtures for the tests.
+"""
+import os
+import random
+
+import SQLite
+
+
+def write_mgf(path, n_scans):
+    with open(path, 'w') as f:
+        for i in range(n_scans):
+            f.write('BEGIN IONS\nTITLE=scan %d\nPEPMASS=%0.4f\nCHARGE=%d+\n' % (
+                i, 400 + i * 1.1, 2 + i % 3))
+            for j in range(5):
+                f.write('%0.4f %0.2f\n' % (100 + j * 50.5 + i, 1000 + j))
+            f.write('END IONS\n')
+
+
+def write_ms2(path, n_scans):
+    with open(path, 'w') as f:
+        f.write('H\tCreationDate\ttest\n')
+        for i in range(n_scans):
+            f.write('S\t%d\t%d\t%0.4f\nZ\t%d\t%0.4f\n' % (
+                i, i, 400 + i * 1.1, 2 + i % 3, 800 + i * 2.2))
+            for j in range(5):
+                f.write('%0.4f %0.2f\n' % (100 + j * 50.5 + i, 1000 + j))
+
+
+def write_mzid(path, n_pep=20, n_sir=30, spectra_data_location='test.mgf'):
+    """
+    Writes a cross-link mzid with n_pep peptides (pairs of donor/acceptor peptides), their
+    evidences and DBSequences and n_sir SpectrumIdentificationResults referencing the scans
+    of an MGF with n_sir scans (see write_mgf).
+    """
+    rnd = random.Random(1)
+    aas = 'ACDEFGHIKLMNPQRSTVWY'
+    with open(path, 'w') as f:
+        w = f.write
+        w('<?xml version="1.0" encoding="UTF-8"?>\n')
+        w('<MzIdentML id="x" version="1.1.0" xmlns="http://psidev.info/psi/pi/mzIdentML/1.1" '
+          'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation='
+          '"http://psidev.info/psi/pi/mzIdentML/1.1 ../../schema/mzIdentML1.1.0.xsd">\n')
+        w('<cvList><cv id="PSI-MS" uri="x" fullName="ms"/></cvList>\n')
+        w('<AnalysisSoftwareList><AnalysisSoftware id="sw1" name="xi"><SoftwareName>'
+          '<cvParam accession="MS:1002544" cvRef="PSI-MS" name="xi"/></SoftwareName>'
+          '</AnalysisSoftware></AnalysisSoftwareList>\n')
+        w('<Provider id="prov"><ContactRole contact_ref="p1"><Role><cvParam accession="MS:1001271"'
+          ' cvRef="PSI-MS" name="researcher"/></Role></ContactRole></Provider>\n')
+        w('<AuditCollection><Person id="p1" firstName="A" lastName="B"/></AuditCollection>\n')
+        w('<SequenceCollection>\n')
+        n_db = max(3, n_pep // 4)
+        for d in range(n_db):
+            w('<DBSequence id="dbseq_%d" accession="P%05d" searchDatabase_ref="sdb" length="10">'
+              '<Seq>MKACDEFGHIK</Seq><cvParam accession="MS:1001088" cvRef="PSI-MS" '
+              'value="prot %d" name="protein description"/></DBSequence>\n' % (d, d, d))
+        for p in range(n_pep):
+            seq = ''.join(rnd.choice(aas) for _ in range(6 + p % 5))
+            w('<Peptide id="pep_%d"><PeptideSequence>%s</PeptideSequence>' % (p, seq))
+            if p % 3 == 0:
+                w('<Modification location="2" monoisotopicMassDelta="15.994915"><cvParam '
+                  'accession="UNIMOD:35" cvRef="UNIMOD" name="Oxidation"/></Modification>')
+            if p % 5 == 0:
+                w('<Modification location="2" monoisotopicMassDelta="57.021464"><cvParam '
+                  'accession="UNIMOD:4" cvRef="UNIMOD" name="Carbamidomethyl"/></Modification>')
+            if p % 7 == 0:
+                w('<Modification location="0"><cvParam accession="UNIMOD:1" cvRef="UNIMOD" '
+                  'name="Acetyl"/></Modification>')
+            if p % 2 == 0 and p + 1 < n_pep:
+                w('<Modification location="3" monoisotopicMassDelta="138.06807"><cvParam '
+                  'accession="XLMOD:02000" cvRef="XLMOD" name="BS3"/><cvParam '
+                  'accession="MS:1002509" cvRef="PSI-MS" value="%d" name="cross-link donor"/>'
+                  '</Modification>' % p)
+            elif p % 2 == 1:
+                w('<Modification location="1" monoisotopicMassDelta="0"><cvParam '
+                  'accession="MS:1002510" cvRef="PSI-MS" value="%d" name="cross-link acceptor"/>'
+                  '</Modification>' % (p - 1))
+            w('</Peptide>\n')
+        for p in range(n_pep):
+            for k in range(1 + p % 2):
+                w('<PeptideEvidence id="pe_%d_%d" peptide_ref="pep_%d" dBSequence_ref="dbseq_%d" '
+                  'start="%d" end="10" isDecoy="%s"/>\n' % (
+                      p, k, p, (p + k) % n_db, 1 + p, 'true' if p % 4 == 0 else 'false'))
+        w('</SequenceCollection>\n')
+        w('<AnalysisCollection><SpectrumIdentification id="si" '
+          'spectrumIdentificationProtocol_ref="sip" spectrumIdentificationList_ref="sil">'
+          '<InputSpectra spectraData_ref="sd1"/><SearchDatabaseRef searchDatabase_ref="sdb"/>'
+          '</SpectrumIdentification></AnalysisCollection>\n')
+        w('<AnalysisProtocolCollection><SpectrumIdentificationProtocol id="sip" '
+          'analysisSoftware_ref="sw1"><SearchType><cvParam accession="MS:1001083" cvRef="PSI-MS" '
+          'name="ms-ms search"/></SearchType><FragmentTolerance><cvParam accession="MS:1001412" '
+          'cvRef="PSI-MS" unitCvRef="UO" unitName="parts per million" unitAccession="UO:0000169" '
+          'value="20" name="search tolerance plus value"/><cvParam accession="MS:1001413" '
+          'cvRef="PSI-MS" unitCvRef="UO" unitName="parts per million" unitAccession="UO:0000169" '
+          'value="20" name="search tolerance minus value"/></FragmentTolerance><Threshold>'
+          '<cvParam accession="MS:1001494" cvRef="PSI-MS" name="no threshold"/></Threshold>'
+          '</SpectrumIdentificationProtocol></AnalysisProtocolCollection>\n')
+        w('<DataCollection><Inputs><SearchDatabase id="sdb" location="db.fasta"><DatabaseName>'
+          '<userParam name="db"/></DatabaseName></SearchDatabase><SpectraData id="sd1" '
+          'location="%s"><FileFormat><cvParam accession="MS:1001062" cvRef="PSI-MS" '
+          'name="Mascot MGF format"/></FileFormat><SpectrumIDFormat><cvParam '
+          'accession="MS:1000774" cvRef="PSI-MS" name="multiple peak list nativeID format"/>'
+          '</SpectrumIDFormat></SpectraData></Inputs>\n' % spectra_data_location)
+        w('<AnalysisData><SpectrumIdentificationList id="sil">\n')
+        for s in range(n_sir):
+            w('<SpectrumIdentificationResult id="sir_%d" spectrumID="index=%d" '
+              'spectraData_ref="sd1">\n' % (s, s))
+            for r in range(1 + s % 2):
+                p = (s + r) % (n_pep - 1)
+                p -= p % 2
+                for q in (p, p + 1):
+                    w('<SpectrumIdentificationItem id="sii_%d_%d_%d" calculatedMassToCharge="500.1"'
+                      ' chargeState="3" experimentalMassToCharge="500.2" peptide_ref="pep_%d" '
+                      'rank="%d" passThreshold="true">' % (s, r, q, q, r + 1))
+                    w('<PeptideEvidenceRef peptideEvidence_ref="pe_%d_0"/>' % q)
+                    w('<Fragmentation><IonType charge="1" index="1 2"><cvParam '
+                      'accession="MS:1001118" cvRef="PSI-MS" name="frag: b ion"/></IonType>'
+                      '</Fragmentation>')
+                    w('<cvParam accession="MS:1002511" cvRef="PSI-MS" value="%d_%d" '
+                      'name="cross-link spectrum identification item"/>' % (s, r))
+                    w('<cvParam accession="MS:1002681" cvRef="PSI-MS" value="%0.2f" '
+                      'name="xi:score"/>' % (rnd.random() * 10))
+                    if s > n_sir // 2:
+                        w('<userParam name="Pvalue late" value="0.01"/>')
+                    w('</SpectrumIdentificationItem>\n')
+            w('<cvParam accession="MS:1000796" cvRef="PSI-MS" value="scan %d" '
+              'name="spectrum title"/></SpectrumIdentificationResult>\n' % s)
+        w('</SpectrumIdentificationList></AnalysisData></DataCollection>\n')
+        w('<BibliographicReference id="bib1" authors="X" title="T" year="2018"/>\n')
+        w('</MzIdentML>\n')
+
+
+def dump_sqlite(db_path):
+    """
+    :return: table name -> sorted rows of all tables of the SQLite db
+    """
+    con = SQLite.connect(db_path)
+    tables = {}
+    for (table,) in con.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+        tables[table] = sorted(con.execute('SELECT * FROM %s' % table).fetchall(), key=repr)
+    con.close()
+    return tables
+
+
+class RecordingDB:
+    """
+    Stand-in for the PostgreSQL db module: records the rows of every write_* call.
+    """
+
+    class DBException(Exception):
+        pass
+
+    class Cursor:
+        def execute(self, *args):
+            pass
+
+        def fetchall(self):
+            return [[1]]
+
+    class Connection:
+        def cursor(self):
+            return RecordingDB.Cursor()
+
+        def commit(self):
+            pass
+
+        def close(self):
+            pass
+
+    def __init__(self):
+        self.rows = {}
+
+    def connect(self, dbname):
+        return RecordingDB.Connection()
+
+    def new_upload(self, inj_list, cur, con):
+        return 1
+
+    def get_random_id(self, upload_id, cur, con):
+        return 'random'
+
+    def create_indexes(self, cur, con):
+        return True
+
+    def create_psm_view(self, upload_id, cur, con):
+        return True
+
+    def finish_ingest(self, cur, con):
+        return True
+
+    def __getattr__(self, name):
+        if not name.startswith('write_') and name != 'fill_in_missing_scores':
+            raise AttributeError(name)
+
+        def write(*args):
+            values = args[:-2]
+            if len(values) == 1 and isinstance(values[0], list) and \
+                    all(isinstance(row, (list, tuple)) for row in values[0]):
+                self.rows.setdefault(name, []).extend([list(row) for row in values[0]])
+            else:
+                self.rows.setdefault(name, []).append(list(values))
+            return True
+        return write
+
+
+def make_mzid_fixture(directory, n_pep=20, n_sir=30):
+    """
+    :return: path of a mzid written to directory, with a matching test.mgf next to it
+    """
+    write_mgf(os.path.join(directory, 'test.mgf'), n_sir)
+    mzid_path = os.path.join(directory, 'test.mzid')
+    write_mzid(mzid_path, n_pep, n_sir)
+    return mzid_path
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import MGF
+import Ms2Reader
+from fixtures import write_mgf, write_ms2
+
+
+class TestGetByIds(unittest.TestCase):
+
+    n_scans = 50
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mgf_path = os.path.join(self.temp_dir, 'test.mgf')
+        write_mgf(self.mgf_path, self.n_scans)
+        self.ms2_path = os.path.join(self.temp_dir, 'test.ms2')
+        write_ms2(self.ms2_path, self.n_scans)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_readers(self):
+        return [
+            MGF.Reader(self.mgf_path),
+            MGF.MmapReader(self.mgf_path),
+            Ms2Reader.Reader(self.ms2_path),
+        ]
+
+    def assertEqualGetById(self, reader, scan_ids, **kwargs):
+        scans = list(reader.get_by_ids(scan_ids, **kwargs))
+        self.assertEqual(sorted(scan_id for scan_id, _ in scans), sorted(set(scan_ids)))
+        for scan_id, scan in scans:
+            self.assertEqual(scan, dict(reader.get_by_id(scan_id)))
+
+    def test_equals_get_by_id(self):
+        scan_ids = [7, 3, 49, 0, 3, 20, 21]
+        for reader in self.get_readers():
+            self.assertEqualGetById(reader, scan_ids)
+            # refill the buffer for every scan
+            self.assertEqualGetById(reader, range(self.n_scans), buffer_size=1)
+
+    def test_empty_scan(self):
+        for reader in self.get_readers():
+            reader.info['offsetList'] = list(reader.info['offsetList'])
+            reader.info['offsetList'][5] = (-1, -1)
+            scans = dict(reader.get_by_ids([4, 5, 6]))
+            self.assertEqual(scans[5], {'peaks': '', 'precursor': {'mz': None, 'charge': None}})
+            self.assertEqualGetById(reader, [4, 5, 6])
+
+    def test_unknown_scan(self):
+        for reader in self.get_readers():
+            with self.assertRaises(KeyError):
+                list(reader.get_by_ids([1, self.n_scans]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+
+from csv_parser.IdInterning import IdInterner, intern_ids, intern_peptide_ids, \
+    get_cross_linker_pair_ids
+
+
+def list_ids(keys):
+    """
+    ids as assigned by the csv parsers before interning: list.index of the seen keys
+    """
+    seen = []
+    ids = []
+    first_appearance = []
+    for key in keys:
+        first_appearance.append(key not in seen)
+        if key not in seen:
+            seen.append(key)
+        ids.append(seen.index(key))
+    return ids, first_appearance
+
+
+class TestIdInterning(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(0)
+        self.keys = ['run_%s.mgf-%s' % (rnd.randint(0, 2), rnd.randint(0, 200))
+                     for _ in range(1000)]
+
+    def test_intern_ids_equals_list_index(self):
+        self.assertEqual(intern_ids(self.keys), list_ids(self.keys))
+        self.assertEqual(intern_ids([]), ([], []))
+
+    def test_interner_chunks(self):
+        interner = IdInterner()
+        ids = []
+        first_appearance = []
+        for i in range(0, len(self.keys), 64):
+            chunk_ids, chunk_first_appearance = interner.intern(self.keys[i:i + 64])
+            ids.extend(chunk_ids)
+            first_appearance.extend(chunk_first_appearance)
+        self.assertEqual((ids, first_appearance), list_ids(self.keys))
+
+    def test_peptide_ids_equal_list_index(self):
+        rnd = random.Random(1)
+        cross_linked = [rnd.random() < 0.7 for _ in range(500)]
+        pair_ids = get_cross_linker_pair_ids(cross_linked)
+        self.assertEqual([pair_id for pair_id in pair_ids if pair_id != -1],
+                         list(range(sum(cross_linked))))
+        pep1_keys = []
+        pep2_keys = []
+        for pair_id in pair_ids:
+            seq1, seq2 = 'PEP%s' % rnd.randint(0, 30), 'PEP%s' % rnd.randint(0, 30)
+            pep1_keys.append(seq1 + ('_%s' % pair_id if pair_id != -1 else ''))
+            pep2_keys.append(seq2 + '_%s' % pair_id if pair_id != -1 else '')
+
+        # peptide 1, peptide 2 (cross-linked only) of each identification
+        keys = []
+        for pep1_key, pep2_key, is_cross_linked in zip(pep1_keys, pep2_keys, cross_linked):
+            keys.append(pep1_key)
+            if is_cross_linked:
+                keys.append(pep2_key)
+        ids, first_appearance = list_ids(keys)
+
+        interner = IdInterner()
+        pep1_ids, pep1_first, pep2_ids, pep2_first = [], [], [], []
+        for i in range(0, len(pep1_keys), 64):
+            chunk = intern_peptide_ids(pep1_keys[i:i + 64], pep2_keys[i:i + 64],
+                                       cross_linked[i:i + 64], interner)
+            pep1_ids.extend(chunk[0])
+            pep1_first.extend(chunk[1])
+            pep2_ids.extend(chunk[2])
+            pep2_first.extend(chunk[3])
+
+        interned_ids = []
+        interned_first_appearance = []
+        for i, is_cross_linked in enumerate(cross_linked):
+            interned_ids.append(pep1_ids[i])
+            interned_first_appearance.append(pep1_first[i])
+            if is_cross_linked:
+                interned_ids.append(pep2_ids[i])
+                interned_first_appearance.append(pep2_first[i])
+            else:
+                self.assertIsNone(pep2_ids[i])
+        self.assertEqual((interned_ids, interned_first_appearance), (ids, first_appearance))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyteomics import mzid
+from pyteomics.xml import ByteCountingXMLScanner
+from fixtures import write_mzid
+
+
+def build_index(source, tags):
+    index = ByteCountingXMLScanner(source, tags).build_byte_index()
+    return dict((tag, list(offsets.items())) for tag, offsets in index.items())
+
+
+class TestByteIndex(unittest.TestCase):
+
+    tags = [b'Peptide', b'PeptideEvidence', b'DBSequence', b'SpectrumIdentificationResult']
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.mzid')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def test_mmap_index_equals_chunk_index(self):
+        write_mzid(self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        # memory-mapped file vs. chunk scanner fallback (BytesIO can't be mapped)
+        index = build_index(self.path, self.tags)
+        self.assertEqual(len(index[b'Peptide']), 20)
+        self.assertEqual(index, build_index(io.BytesIO(data), self.tags))
+
+    def test_id_of_the_start_tag(self):
+        data = (b'<Root>\n'
+                b'<Peptide name="a>b" id="pep_1">\n'
+                b'<Peptide\n  id=\'pep_2\' name="x"/>\n'
+                b'<Peptide id="O\'Brien"></Peptide>\n'
+                b'<Peptide name=" id=&quot;x&quot;" id = "pep_4"/>\n'
+                b'<Peptide name="no id">text id="pep_5"</Peptide>\n'
+                b'<DBSequence id="dbseq_1"/>\n'
+                b'</Root>\n')
+        self.write(data)
+        index = build_index(self.path, [b'Peptide', b'DBSequence'])
+        self.assertEqual(index[b'Peptide'], [
+            (b'pep_1', data.index(b'<Peptide name="a>b"')),
+            (b'pep_2', data.index(b'<Peptide\n')),
+            (b"O'Brien", data.index(b'<Peptide id="O')),
+            (b'pep_4', data.index(b'<Peptide name=" id=')),
+        ])
+        self.assertEqual(index[b'DBSequence'], [(b'dbseq_1', data.index(b'<DBSequence'))])
+
+
+class TestGetByIds(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.mzid')
+        write_mzid(self.path)
+        self.reader = mzid.MzIdentML(self.path)
+
+    def tearDown(self):
+        self.reader.close()
+        shutil.rmtree(self.temp_dir)
+
+    def assertEqualGetById(self, ids, tag_id=None):
+        by_ids = list(self.reader.get_by_ids(ids, tag_id=tag_id))
+        by_id = [self.reader.get_by_id(elem_id, tag_id=tag_id) for elem_id in ids]
+        self.assertEqual(len(by_ids), len(ids))
+        # repr, the elements contain numpy arrays
+        self.assertEqual(sorted(repr(elem) for elem in by_ids), sorted(repr(elem) for elem in by_id))
+
+    def test_equals_get_by_id(self):
+        self.assertEqualGetById(['pep_%d' % p for p in (7, 0, 19, 3)], tag_id='Peptide')
+        self.assertEqualGetById(['sir_%d' % s for s in range(30)],
+                                tag_id='SpectrumIdentificationResult')
+        self.assertEqualGetById(['pe_1_1', 'pep_2', 'dbseq_0', 'sir_5'])
+
+    def test_small_blocks(self):
+        self.reader._batch_block_size = 300
+        self.assertEqualGetById(['sir_%d' % s for s in range(30)],
+                                tag_id='SpectrumIdentificationResult')
+        # elements over the maximum size are retrieved by get_by_id
+        self.reader._max_element_size = 500
+        self.assertEqualGetById(['sir_%d' % s for s in range(30)],
+                                tag_id='SpectrumIdentificationResult')
+
+    def test_no_start_tag_at_offset(self):
+        self.reader._batch_block_size = 1024
+        offset = self.reader._offset_index['Peptide']['pep_3']
+        self.assertEqual(self.reader._read_element(b'', 0, offset)[0][:21],
+                         b'<Peptide id="pep_3"><')
+        elem_bytes, buf, buf_start = self.reader._read_element(b'', 0, offset + 1)
+        self.assertIsNone(elem_bytes)
+        self.assertLessEqual(len(buf), 1024)
+        # an unterminated start tag isn't read to the end of the file
+        with open(self.path, 'r+b') as f:
+            f.seek(offset + len(b'<Peptide id="pep_3"'))
+            f.write(b' ')
+        self.reader.close()
+        self.reader = mzid.MzIdentML(self.path)
+        self.reader._batch_block_size = 1024
+        self.reader._max_start_tag_size = 2048
+        elem_bytes, buf, buf_start = self.reader._read_element(b'', 0, offset)
+        self.assertIsNone(elem_bytes)
+        self.assertLessEqual(len(buf), 3072)
+
+
+class TestRefCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.mzid')
+        write_mzid(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_results(self, **kwargs):
+        reader = mzid.MzIdentML(self.path, **kwargs)
+        try:
+            # repr, the elements contain numpy arrays
+            return [repr(sid_result) for sid_result in reader.iterfind(
+                'SpectrumIdentificationResult', retrieve_refs=True)], reader.ref_cache_hits
+        finally:
+            reader.close()
+
+    def test_equals_uncached(self):
+        uncached, hits = self.read_results(ref_cache_size=0)
+        self.assertEqual(hits, 0)
+        for ref_cache_size in (None, 100):
+            cached, hits = self.read_results(ref_cache_size=ref_cache_size)
+            self.assertGreater(hits, 0)
+            self.assertEqual(cached, uncached)
+
+    def test_results_are_copies(self):
+        uncached, hits = self.read_results(ref_cache_size=0)
+        reader = mzid.MzIdentML(self.path)
+        results = []
+        for sid_result in reader.iterfind('SpectrumIdentificationResult', retrieve_refs=True):
+            results.append(repr(sid_result))
+            # change the nested values of the resolved references
+            for sii in sid_result['SpectrumIdentificationItem']:
+                for value in sii.values():
+                    if isinstance(value, list):
+                        value.append('changed')
+                    elif isinstance(value, dict):
+                        value['changed'] = True
+        reader.close()
+        self.assertGreater(reader.ref_cache_hits, 0)
+        self.assertEqual(results, uncached)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import copy
+import random
+import unittest
+
+from ModificationRegistry import ModificationRegistry
+
+
+def list_add(modlist, mod):
+    """
+    add_to_modlist of MzIdParser before the registry: list scans over the modifications
+    """
+    if mod['name'] == "unknown_modification":
+        mod['name'] = "({0:.2f})".format(mod['monoisotopicMassDelta'])
+    mod['monoisotopicMassDelta'] = float(mod['monoisotopicMassDelta'])
+    mod['residues'] = [aa for aa in mod['residues']]
+
+    if mod['name'] in [m['name'] for m in modlist]:
+        old_mod = modlist[[m['name'] for m in modlist].index(mod['name'])]
+        if mod['monoisotopicMassDelta'] != old_mod['monoisotopicMassDelta']:
+            mod['name'] += "*"
+            list_add(modlist, mod)
+        else:
+            for res in mod['residues']:
+                if res not in old_mod['residues']:
+                    old_mod['residues'].append(res)
+    else:
+        modlist.append(mod)
+    return mod['name']
+
+
+class TestModificationRegistry(unittest.TestCase):
+
+    def test_equals_list_modlist(self):
+        rnd = random.Random(0)
+        mods = []
+        for _ in range(500):
+            mod = {
+                'name': rnd.choice(['Oxidation', 'Carbamidomethyl', 'unknown_modification']),
+                'monoisotopicMassDelta': rnd.choice([15.994915, 57.021464, 42.01]),
+                'residues': rnd.sample('ACDEKMST', 2),
+            }
+            if rnd.random() < 0.5:
+                mod['accession'] = 'UNIMOD:%d' % rnd.randint(1, 3)
+            mods.append(mod)
+
+        modlist = []
+        registry = ModificationRegistry()
+        for mod in mods:
+            self.assertEqual(registry.add(copy.deepcopy(mod)), list_add(modlist, copy.deepcopy(mod)))
+
+        self.assertEqual(list(registry), modlist)
+        self.assertEqual(len(registry), len(modlist))
+        for mod in modlist:
+            self.assertIn(mod['name'], registry)
+            self.assertEqual(registry.get_mass(mod['name']), mod['monoisotopicMassDelta'])
+        rows = registry.get_inj_list(1)
+        self.assertEqual([row[0] for row in rows], list(range(len(modlist))))
+        self.assertEqual([row[4] for row in rows], [''.join(mod['residues']) for mod in modlist])
+
+
+if __name__ == '__main__':
+    unittest.main()
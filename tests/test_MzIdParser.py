@@ -0,0 +1,137 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+import SQLite
+import MzIdParser
+from fixtures import make_mzid_fixture, dump_sqlite, RecordingDB
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+logger = logging.getLogger(__name__)
+
+
+class MzIdParserTestCase(unittest.TestCase):
+
+    n_pep = 20
+    n_sir = 30
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mzid_path = make_mzid_fixture(self.temp_dir, self.n_pep, self.n_sir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def parse_recorded(self, sid_result_chunk_size=None, **kwargs):
+        """
+        :param sid_result_chunk_size: SpectrumIdentificationResults per parallel main loop chunk
+        :return: rows written by MzIdParser with the recording db
+        """
+        db = RecordingDB()
+        parser = MzIdParser.MzIdParser(self.mzid_path, self.temp_dir, self.temp_dir, db, logger,
+                                       **kwargs)
+        parser.unimod_path = os.path.join(repo_dir, 'obo/unimod.obo')
+        if sid_result_chunk_size is not None:
+            parser.get_sid_result_byte_ranges = lambda: MzIdParser.MzIdParser.\
+                get_sid_result_byte_ranges(parser, chunk_size=sid_result_chunk_size)
+        parser.initialise_mzid_reader()
+        parser.parse()
+        return db.rows
+
+    def get_sqlite_parser(self, db_path, **kwargs):
+        parser = MzIdParser.xiSPEC_MzIdParser(self.mzid_path, self.temp_dir, self.temp_dir,
+                                              SQLite, logger, db_name=db_path, **kwargs)
+        parser.unimod_path = os.path.join(repo_dir, 'obo/unimod.obo')
+        SQLite.create_tables(parser.cur, parser.con)
+        parser.initialise_mzid_reader()
+        return parser
+
+    def parse_sqlite(self, **kwargs):
+        """
+        :return: tables written by xiSPEC_MzIdParser to SQLite
+        """
+        db_path = tempfile.mktemp(suffix='.db', dir=self.temp_dir)
+        self.get_sqlite_parser(db_path, **kwargs).parse()
+        return dump_sqlite(db_path)
+
+
+class TestStreamSequenceCollection(MzIdParserTestCase):
+
+    def test_rows_equal_serial(self):
+        serial = self.parse_recorded()
+        streamed = self.parse_recorded(stream_sequence_collection=True)
+        self.assertEqual(len(serial['write_db_sequences']), 5)
+        self.assertEqual(len(serial['write_peptide_evidences']), 30)
+        self.assertEqual(serial, streamed)
+
+    def test_xispec_rows_equal_serial(self):
+        serial = self.parse_sqlite()
+        self.assertEqual(serial, self.parse_sqlite(stream_sequence_collection=True))
+
+    def test_xispec_writes_no_db_sequences(self):
+        db = RecordingDB()
+        parser = MzIdParser.xiSPEC_MzIdParser(self.mzid_path, self.temp_dir, self.temp_dir, db,
+                                              logger, stream_sequence_collection=True)
+        parser.unimod_path = os.path.join(repo_dir, 'obo/unimod.obo')
+        parser.initialise_mzid_reader()
+        parser.parse()
+        self.assertNotIn('write_db_sequences', db.rows)
+        self.assertEqual(len(db.rows['write_peptide_evidences']), 30)
+
+
+class TestParallelMainLoop(MzIdParserTestCase):
+
+    def test_rows_equal_serial(self):
+        serial = self.parse_recorded()
+        self.assertEqual(len(serial['write_spectrum_identifications']), 45)
+        self.assertEqual(serial, self.parse_recorded(processes=3, sid_result_chunk_size=7))
+
+    def test_ids_follow_file_order(self):
+        rows = self.parse_recorded(processes=2, sid_result_chunk_size=4)
+        self.assertEqual(sorted(row[0] for row in rows['write_spectrum_identifications']),
+                         list(range(45)))
+        self.assertEqual([row[0] for row in rows['write_spectra']], list(range(30)))
+
+    def test_byte_ranges_cover_all_results(self):
+        db = RecordingDB()
+        parser = MzIdParser.MzIdParser(self.mzid_path, self.temp_dir, self.temp_dir, db, logger)
+        parser.initialise_mzid_reader()
+        byte_ranges = parser.get_sid_result_byte_ranges(chunk_size=7)
+        self.assertEqual(len(byte_ranges), 5)
+        self.assertEqual(sum(len(parser.read_sid_results(*byte_range))
+                             for byte_range in byte_ranges), 30)
+
+
+class TestSQLiteIngestProfile(MzIdParserTestCase):
+
+    def test_tables_equal_default(self):
+        tables = self.parse_sqlite()
+        self.assertEqual(len(tables['spectrum_identifications']), 45)
+        self.assertEqual(tables, self.parse_sqlite(ingest_profile=SQLite.get_ingest_profile()))
+
+    def test_failed_parse_writes_nothing(self):
+        db_path = tempfile.mktemp(suffix='.db', dir=self.temp_dir)
+        con = SQLite.connect(db_path)
+        SQLite.create_tables(con.cursor(), con)
+        con.close()
+        parser = MzIdParser.xiSPEC_MzIdParser(self.mzid_path, self.temp_dir, self.temp_dir,
+                                              SQLite, logger, db_name=db_path,
+                                              ingest_profile=SQLite.get_ingest_profile())
+        parser.unimod_path = os.path.join(repo_dir, 'obo/unimod.obo')
+        parser.initialise_mzid_reader()
+
+        def fail():
+            raise MzIdParser.MzIdParseException('failed')
+        parser.create_psm_view = fail
+        with self.assertRaises(MzIdParser.MzIdParseException):
+            parser.parse()
+        parser.con.close()
+        tables = dump_sqlite(db_path)
+        self.assertIn('spectrum_identifications', tables)
+        self.assertTrue(all(len(rows) == 0 for rows in tables.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+import MGF
+import Ms2Reader
+from PeakEncoding import PeakEncoder, PeakEncodingException, decode_peaks, \
+    decode_peaks_to_text, parse_peak_arrays
+
+
+raw_scan = '\n'.join([
+    'TITLE=scan 1',
+    'PEPMASS=500.25',
+    'CHARGE=2+',
+    '100.5 2000',
+    '123.4 1.5e+04',
+    '130.25\t3.5E2',
+    '  140.0 12.5',
+    '150.0  -1.0',
+    '+160.75 .5',
+    '170 1e-3 extra',
+    'END IONS',
+    '',
+])
+
+
+def text_to_arrays(peak_list):
+    peaks = [line.split() for line in peak_list.splitlines()]
+    return [float(p[0]) for p in peaks], [float(p[1]) for p in peaks]
+
+
+class TestParsePeakArrays(unittest.TestCase):
+
+    def test_parse(self):
+        mz, intensity = parse_peak_arrays(raw_scan)
+        self.assertEqual(mz.tolist(), [100.5, 123.4, 130.25, 140.0, 150.0, 160.75, 170.0])
+        self.assertEqual(intensity.tolist(), [2000.0, 15000.0, 350.0, 12.5, -1.0, 0.5, 0.001])
+
+    def test_peak_list_lines_unchanged(self):
+        # the text peak lists keep the lines of the scan as they are
+        for reader in (MGF.Reader, Ms2Reader.Reader):
+            self.assertEqual(reader.parse_peak_list(raw_scan),
+                             '100.5 2000\n123.4 1.5e+04\n130.25\t3.5E2\n170 1e-3 extra')
+            self.assertEqual(reader.parse_peak_list('100.5 2000 \r\n123.4 15\r\n'),
+                             '100.5 2000 \n123.4 15')
+
+    def test_no_peaks(self):
+        mz, intensity = parse_peak_arrays('TITLE=scan 1\nEND IONS\n')
+        self.assertEqual((len(mz), len(intensity)), (0, 0))
+
+    def test_invalid_peak(self):
+        with self.assertRaises(PeakEncodingException):
+            parse_peak_arrays('100.5 2000\n1.2.3 4\n')
+
+    def test_encode_decode(self):
+        mz, intensity = parse_peak_arrays(raw_scan)
+        for dtype in ('float64', 'float32'):
+            for compress in (False, True):
+                blob = PeakEncoder(dtype, compress).encode(mz, intensity)
+                decoded_mz, decoded_intensity = decode_peaks(blob)
+                np.testing.assert_array_equal(decoded_mz, mz.astype(dtype))
+                np.testing.assert_array_equal(decoded_intensity, intensity.astype(dtype))
+
+        blob = PeakEncoder().encode(mz, intensity)
+        self.assertEqual(text_to_arrays(decode_peaks_to_text(blob)),
+                         (mz.tolist(), intensity.tolist()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+import PeakListStore as peak_list_store
+from PeakListParser import PeakListParser
+from PeakListStore import PeakListStore
+from PeakEncoding import PeakEncoder
+from fixtures import write_mgf, write_ms2
+
+
+class TestPeakListStore(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.temp_dir, 'store')
+        self.mgf_path = os.path.join(self.temp_dir, 'test.mgf')
+        write_mgf(self.mgf_path, 20)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def list_store(self):
+        return sorted(os.path.join(os.path.relpath(root, self.store_dir), name)
+                      for root, _, files in os.walk(self.store_dir) for name in files)
+
+    def test_add(self):
+        with open(self.mgf_path, 'rb') as f:
+            data = f.read()
+        store = PeakListStore(self.store_dir)
+        peak_file_hash = store.add(self.mgf_path)
+        self.assertEqual(peak_file_hash, hashlib.sha1(data).hexdigest())
+        with open(store.get_path(peak_file_hash), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        # stored once without copying the file again, no tmp files left
+        copy_path = os.path.join(self.temp_dir, 'copy.mgf')
+        shutil.copy(self.mgf_path, copy_path)
+        copyfile = peak_list_store.shutil.copyfile
+        peak_list_store.shutil.copyfile = None
+        try:
+            self.assertEqual(store.add(copy_path), peak_file_hash)
+        finally:
+            peak_list_store.shutil.copyfile = copyfile
+        self.assertEqual(self.list_store(), [os.path.join(peak_file_hash[:2], peak_file_hash)])
+
+    def test_get_scan(self):
+        ms2_path = os.path.join(self.temp_dir, 'test.ms2')
+        write_ms2(ms2_path, 20)
+        for peak_encoder in (None, PeakEncoder()):
+            store = PeakListStore(self.store_dir, peak_encoder)
+            for path, file_format in ((self.mgf_path, 'MS:1001062'), (ms2_path, 'MS:1001466')):
+                peak_file_hash = store.add(path)
+                reader = PeakListParser(path, file_format, None, peak_encoder)
+                for scan_id in (0, 7, 19):
+                    offset, length = reader.get_scan_location(scan_id)
+                    self.assertEqual(store.get_scan(peak_file_hash, offset, length, file_format),
+                                     reader.get_scan(scan_id))
+                # the stored file isn't indexed
+                self.assertIsNone(store.get_peak_list_reader(peak_file_hash, file_format).reader)
+
+
+if __name__ == '__main__':
+    unittest.main()
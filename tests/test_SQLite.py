@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import SQLite
+
+
+class TestIngestProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'test.db')
+        con = SQLite.connect(self.db_path)
+        con.execute("CREATE TABLE t(id INT)")
+        con.commit()
+        con.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def connect(self, **kwargs):
+        con = SQLite.connect(self.db_path, SQLite.get_ingest_profile(**kwargs))
+        self.assertIsInstance(con, SQLite.IngestConnection)
+        return con
+
+    def read(self):
+        con = SQLite.connect(self.db_path)
+        rows = con.execute("SELECT id FROM t ORDER BY id").fetchall()
+        journal_mode = con.execute("PRAGMA journal_mode").fetchone()[0]
+        con.close()
+        return [row[0] for row in rows], journal_mode
+
+    def insert(self, con, ids):
+        for i in ids:
+            con.execute("INSERT INTO t VALUES (?)", (i,))
+            con.commit()
+
+    def test_finish(self):
+        con = self.connect()
+        self.insert(con, range(3))
+        SQLite.finish_ingest(con.cursor(), con)
+        con.close()
+        self.assertEqual(self.read(), ([0, 1, 2], 'delete'))
+
+    def test_close_without_finish_rolls_back(self):
+        con = self.connect()
+        self.insert(con, range(3))
+        con.close()
+        self.assertEqual(self.read(), ([], 'delete'))
+
+    def test_journal_mode_off_has_no_rollback(self):
+        con = self.connect(journal_mode='OFF')
+        self.insert(con, range(2))
+        con.rollback()
+        self.insert(con, [2])
+        con.close()
+        self.assertEqual(self.read(), ([0, 1, 2], 'delete'))
+
+    def test_rollback_without_transaction(self):
+        # e.g. rolled back by SQLite on SQLITE_FULL
+        con = self.connect()
+        self.insert(con, [1])
+        con.execute("ROLLBACK")
+        with self.assertRaises(ValueError):
+            with con:
+                raise ValueError()
+        con.execute("ROLLBACK")
+        con.close()
+        self.assertEqual(self.read(), ([], 'delete'))
+
+    def test_commit_interval(self):
+        con = self.connect(commit_interval=2)
+        self.insert(con, range(3))
+        con.close()
+        self.assertEqual(self.read(), ([0, 1], 'delete'))
+
+    def test_context_manager(self):
+        con = self.connect()
+        with con:
+            self.insert(con, [1])
+        con.close()
+        self.assertEqual(self.read()[0], [1])
+
+        con = self.connect()
+        with self.assertRaises(ValueError):
+            with con:
+                self.insert(con, [2])
+                raise ValueError()
+        con.close()
+        self.assertEqual(self.read()[0], [1])
+
+    def test_profile_is_per_connection(self):
+        self.connect().close()
+        con = SQLite.connect(self.db_path)
+        self.assertNotIsInstance(con, SQLite.IngestConnection)
+        self.assertIs(type(con), sqlite3.Connection)
+        con.close()
+
+    def test_invalid_journal_mode(self):
+        with self.assertRaises(SQLite.DBException):
+            SQLite.get_ingest_profile('MEMORY')
+
+
+class TestFillInMissingScores(unittest.TestCase):
+
+    def test_score_names_with_quotes(self):
+        con = SQLite.connect(':memory:')
+        cur = con.cursor()
+        SQLite.create_tables(cur, con)
+        for i, scores in enumerate([{'xi:score': 1.5}, {'xi:score': 2.5, 'x"y': 3}, {}]):
+            cur.execute("INSERT INTO spectrum_identifications (id, scores) VALUES (?, ?)",
+                        (i, json.dumps(scores)))
+        score_names = ['x"y', 'back\\slash', u'\u00e9', '$.a[0]']
+        SQLite.fill_in_missing_scores(score_names, [0, 2], cur, con)
+
+        scores = [json.loads(row[0]) for row in cur.execute(
+            "SELECT scores FROM spectrum_identifications ORDER BY id")]
+        missing = dict((score_name, -1) for score_name in score_names)
+        missing_0 = dict(missing, **{'xi:score': 1.5})
+        self.assertEqual(scores, [missing_0, {'xi:score': 2.5, 'x"y': 3}, missing])
+        con.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
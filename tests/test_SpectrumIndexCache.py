@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import MGF
+from SpectrumIndexCache import SpectrumIndexCache
+from CachedIndexMzIdentML import CachedIndexMzIdentML
+from pyteomics import mzid
+from fixtures import write_mgf, write_mzid
+
+
+class TestSpectrumIndexCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        os.mkdir(self.cache_dir)
+        self.mgf_path = os.path.join(self.temp_dir, 'test.mgf')
+        # larger than the head and tail blocks hashed by SpectrumIndexCache.fingerprint
+        write_mgf(self.mgf_path, 2000)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load_saved_index(self):
+        for cache_dir in (None, self.cache_dir):
+            index_cache = SpectrumIndexCache(cache_dir)
+            self.assertIsNone(index_cache.load(self.mgf_path))
+            self.assertTrue(index_cache.save(self.mgf_path, [[1, 2], [3, 4]], {'a': 1}))
+            offsets, meta = index_cache.load(self.mgf_path)
+            self.assertEqual(offsets.tolist(), [[1, 2], [3, 4]])
+            self.assertEqual(meta, {'a': 1})
+
+    def test_modified_file_with_same_size(self):
+        for cache_dir in (None, self.cache_dir):
+            write_mgf(self.mgf_path, 2000)
+            index_cache = SpectrumIndexCache(cache_dir)
+            index_cache.save(self.mgf_path, [[1, 2]])
+            stat = os.stat(self.mgf_path)
+
+            # same size, head and tail, different middle
+            with open(self.mgf_path, 'r+b') as f:
+                f.seek(stat.st_size // 2)
+                byte = f.read(1)
+                f.seek(stat.st_size // 2)
+                f.write(b'x' if byte != b'x' else b'y')
+            os.utime(self.mgf_path, (stat.st_atime, stat.st_mtime + 10))
+            self.assertIsNone(index_cache.load(self.mgf_path))
+
+    def test_shared_cache_dir_copy(self):
+        index_cache = SpectrumIndexCache(self.cache_dir)
+        index_cache.save(self.mgf_path, [[1, 2]])
+        copy_path = os.path.join(self.temp_dir, 'copy.mgf')
+        shutil.copy(self.mgf_path, copy_path)
+        stat = os.stat(copy_path)
+        os.utime(copy_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(index_cache.load(copy_path)[0].tolist(), [[1, 2]])
+        # not shared next to the file
+        self.assertIsNone(SpectrumIndexCache().load(copy_path))
+
+    def test_check_entry(self):
+        index_cache = SpectrumIndexCache()
+        index_cache.save(self.mgf_path, [[i] for i in range(100)])
+        checked = []
+
+        def check_entry(f, entry):
+            checked.append(int(entry[0]))
+            return True
+        self.assertIsNotNone(index_cache.load(self.mgf_path, check_entry))
+        self.assertEqual(checked, [0, 25, 50, 74, 99])
+        self.assertIsNone(index_cache.load(self.mgf_path, lambda f, entry: entry[0] != 50))
+
+    def test_mgf_stale_index(self):
+        for cache_dir in (None, self.cache_dir):
+            write_mgf(self.mgf_path, 2000)
+            # float mtimes don't survive os.utime exactly
+            os.utime(self.mgf_path, (1500000000, 1500000000))
+            index_cache = SpectrumIndexCache(cache_dir)
+            reader = MGF.Reader(self.mgf_path, index_cache=index_cache)
+            scans = [reader.get_by_id(i)['peaks'] for i in (999, 1005, 1010)]
+
+            # same size, mtime, head and tail, the scans in the middle moved
+            size = os.path.getsize(self.mgf_path)
+            with open(self.mgf_path, 'rb') as f:
+                data = f.read()
+            middle = data.index(b'BEGIN IONS\nTITLE=scan 1000\n')
+            data = data[:middle] + b'\n' * 30 + \
+                data[middle:].replace(b' 1004.00\n', b' 1004\n', 10)
+            with open(self.mgf_path, 'wb') as f:
+                f.write(data)
+            os.utime(self.mgf_path, (1500000000, 1500000000))
+            self.assertEqual(os.path.getsize(self.mgf_path), size)
+            self.assertIsNotNone(index_cache.load(self.mgf_path))
+            self.assertIsNone(index_cache.load(self.mgf_path, MGF.Reader.check_index_entry))
+
+            reader = MGF.Reader(self.mgf_path, index_cache=index_cache)
+            self.assertEqual(reader.get_by_id(999)['peaks'], scans[0])
+            self.assertEqual(reader.get_by_id(1005)['peaks'], scans[1].replace('1004.00', '1004'))
+            self.assertEqual(reader.get_by_id(1010)['peaks'], scans[2])
+
+
+class TestCachedIndexMzIdentML(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mzid_path = os.path.join(self.temp_dir, 'test.mzid')
+        write_mzid(self.mzid_path, n_pep=2000)
+        os.utime(self.mzid_path, (1500000000, 1500000000))
+        self.index_cache = SpectrumIndexCache(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assertIndexEqual(self, reader, expected):
+        self.assertEqual(sorted(reader._offset_index.keys()), sorted(expected._offset_index.keys()))
+        for tag in expected._offset_index.keys():
+            self.assertEqual(list(reader._offset_index[tag].items()),
+                             list(expected._offset_index[tag].items()))
+        self.assertEqual(list(reader._flat_offset_index.items()),
+                         list(expected._flat_offset_index.items()))
+
+    def test_cached_index_equals_fresh_index(self):
+        fresh = mzid.MzIdentML(self.mzid_path)
+        saved = CachedIndexMzIdentML(self.mzid_path, index_cache=self.index_cache)
+        self.assertIsNotNone(saved.load_offset_index())
+        loaded = CachedIndexMzIdentML(self.mzid_path, index_cache=self.index_cache)
+        self.assertEqual(type(loaded._offset_index).__name__, 'CachedTagSpecificXMLByteIndex')
+        self.assertIndexEqual(saved, fresh)
+        self.assertIndexEqual(loaded, fresh)
+        self.assertEqual(loaded.get_by_id('pep_3', tag_id='Peptide'),
+                         fresh.get_by_id('pep_3', tag_id='Peptide'))
+
+    def test_stale_index(self):
+        CachedIndexMzIdentML(self.mzid_path, index_cache=self.index_cache)
+
+        # same size, mtime, head and tail, the elements in the middle moved
+        size = os.path.getsize(self.mzid_path)
+        with open(self.mzid_path, 'rb') as f:
+            data = f.read()
+        data = data.replace(b'<Peptide id="pep_999">', b'<Peptide  id="pep_999">', 1)
+        data = data.replace(b'\n<Peptide id="pep_1010">', b'<Peptide id="pep_1010">', 1)
+        with open(self.mzid_path, 'wb') as f:
+            f.write(data)
+        os.utime(self.mzid_path, (1500000000, 1500000000))
+        self.assertEqual(os.path.getsize(self.mzid_path), size)
+
+        reader = CachedIndexMzIdentML(self.mzid_path)
+        reader.index_cache = self.index_cache
+        self.assertIsNone(reader.load_offset_index())
+        reader = CachedIndexMzIdentML(self.mzid_path, index_cache=self.index_cache)
+        self.assertIndexEqual(reader, mzid.MzIdentML(self.mzid_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
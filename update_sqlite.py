@@ -29,8 +29,41 @@ def update_database(con, db_name):
         cur.execute('ALTER TABLE spectra ADD COLUMN precursor_charge TEXT')
     except Exception:
         print('{}: spectrum precursor columns exist already - not updated'.format(db_name))
+
+    try:
+        # binary peaks (PeakEncoding)
+        cur.execute('ALTER TABLE spectra ADD COLUMN peak_blob BLOB')
+    except Exception:
+        print('{}: spectrum peak_blob column exists already - not updated'.format(db_name))
+
+    try:
+        # lazy peaks (PeakListStore)
+        cur.execute('ALTER TABLE spectra ADD COLUMN peak_file_hash TEXT')
+        cur.execute('ALTER TABLE spectra ADD COLUMN peak_offset INT')
+        cur.execute('ALTER TABLE spectra ADD COLUMN peak_length INT')
+        cur.execute('ALTER TABLE spectra ADD COLUMN peak_file_format TEXT')
+    except Exception:
+        print('{}: spectrum peak location columns exist already - not updated'.format(db_name))
+
+    # columnar scores
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS score_names("
+        "id INT, "
+        "upload_id INT,"
+        "name TEXT)"
+    )
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS scores("
+        "identification_id INT, "
+        "upload_id INT,"
+        "score_name_id INT,"
+        "value FLOAT)"
+    )
     con.commit()
 
+    SQLite.create_indexes(cur, con)
+    SQLite.create_psm_view(None, cur, con)
+
     return True
 
 